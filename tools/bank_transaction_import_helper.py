@@ -1,22 +1,44 @@
 #!/usr/bin/env python3
 
+import codecs
 import csv
-from typing import Union
+from datetime import date, datetime
+from functools import lru_cache
+import mmap
+import os
+from typing import Iterator, Union
 
 import yaml
 
 from ledger_importer import import_ledger_file
+from ledger_money import Amount
+from ledger_reconcile import BankTransaction, match_splits, reconcile_ledger
+
+
+DEFAULT_DATE_FORMAT = '%m/%d/%Y'
 
 
 class BankTransactionProfile:
     def __init__(self, bank_alias: str,
                  amount: Union[int, None] = None,
                  credit_amount: Union[int, None] = None,
-                 debit_amount: Union[int, None] = None):
+                 debit_amount: Union[int, None] = None,
+                 date: Union[int, None] = None,
+                 date_format: str = DEFAULT_DATE_FORMAT,
+                 account: Union[str, None] = None,
+                 description: Union[int, None] = None,
+                 statements: Union[list[str], None] = None):
         self.bank_alias = bank_alias
         self.amount = amount
         self.credit_amount = credit_amount
         self.debit_amount = debit_amount
+        self.date = date
+        self.date_format = date_format
+        # the ledger account the bank's transactions are posted to
+        self.account = account
+        self.description = description
+        # paths (or glob patterns) of the bank's csv statements
+        self.statements = statements if statements is not None else []
 
 
 def import_bank_transaction_profile(path: str):
@@ -26,66 +48,134 @@ def import_bank_transaction_profile(path: str):
 
     bank_profiles = {}
     for bank in bank_configs['banks']:
-        config = bank_configs['banks'][bank]['transaction_column_mapping']
+        bank_config = bank_configs['banks'][bank]
+        config = bank_config['transaction_column_mapping']
 
         amount_col = config.get('amount', None)
         credit_amount_col = config.get('credit_amount', None)
         debit_amount_col = config.get('debit_amount', None)
+        date_col = config.get('date', None)
+        description_col = config.get('description', None)
+        statements = bank_config.get('statements', [])
+        if isinstance(statements, str):
+            statements = [statements]
 
         profile = BankTransactionProfile(bank, amount_col,
-                                         credit_amount_col, debit_amount_col)
+                                         credit_amount_col, debit_amount_col, date_col,
+                                         bank_config.get('date_format', DEFAULT_DATE_FORMAT),
+                                         bank_config.get('account', None), description_col,
+                                         statements)
         bank_profiles[bank] = profile
 
     return bank_profiles
 
 
-def import_bank_transactions(path: str, bank_profile: BankTransactionProfile):
-    """Note: Function currently does not handle files with windows
-    line endings (e.g. \r\n, unix systems show an extra ^M at the end of the line)"""
+@lru_cache(maxsize=4096)
+def _parse_date(text: str, date_format: str) -> date:
+    # statements list many transactions on each day
+    return datetime.strptime(text, date_format).date()
+
+
+class _LineReader:
+    """Iterates over the decoded lines of `data` from byte offset
+    `start`, keeping the offset where the last line read ends, so
+    the span of each csv row (which can take several lines when a
+    quoted field has a newline) is known."""
+    def __init__(self, data: Union[bytes, mmap.mmap], start: int):
+        self.data = data
+        self.end = start
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        data = self.data
+        start = self.end
+        if start >= len(data):
+            raise StopIteration
+        end = data.find(b'\n', start)
+        end = len(data) if end == -1 else end + 1
+        self.end = end
+        return data[start:end].decode('utf-8')
+
+
+def iter_bank_transactions(path: Union[str, os.PathLike],
+                           bank_profile: BankTransactionProfile) -> Iterator[BankTransaction]:
+    """Yields a BankTransaction for each row of the csv statement at
+    `path`, skipping its header row.
+
+    The statement is memory-mapped and read a row at a time, and only
+    the columns `bank_profile` maps are converted, so statements of
+    any size are read in constant memory. The text of each row is
+    only copied out of the map when its `raw` is asked for, and the
+    map stays open as long as a yielded transaction refers to it.
+
+    Handles \r\n line endings and a leading byte order mark."""
     amount_col = bank_profile.amount
     credit_amount_col = bank_profile.credit_amount
     debit_amount_col = bank_profile.debit_amount
-
-    def get_amount(csv_row):
-        if amount_col:
-            return csv_row[amount_col]
-        credit = csv_row[credit_amount_col]
-        debit = csv_row[debit_amount_col]
-
-        if len(credit) > 0:
-            return float(credit)
-        else:
-            return -1.0 * float(debit)
-
-    amount_to_full_transaction_tuples = []
-    with open(path, 'r', newline='') as f:
-        reader = csv.reader(f)
-
-        first_row = True
-        for row in reader:
-            if first_row:
-                first_row = False
-                continue
-            amount = get_amount(row)
-            row_as_str = ', '.join(row)
-            amount_to_full_transaction_tuples.append((amount, row_as_str))
-
-    return amount_to_full_transaction_tuples
-
-# create empty ledger object
-# load a listener that creates an index of transactions by amount and date
-
-# for each item in the bank list (optionally starting from a given start date)
-# check to see if amount is listed (and if so, ensure transaction's date is
-# relatively close to the one given)
-
-# list all transactions that are clearly not listed
-# list all transactions that seem suspect because date is pretty far off
+    date_col = bank_profile.date
+    date_format = bank_profile.date_format
+    description_col = bank_profile.description
+
+    # pick how to read each column once, instead of on every row.
+    # amounts are parsed exactly, so they can be matched against ledger amounts with ==
+    if amount_col is not None:
+        def get_amount(row):
+            return Amount.parse(row[amount_col].strip())
+    else:
+        def get_amount(row):
+            credit = row[credit_amount_col].strip()
+            if credit:
+                return Amount.parse(credit)
+            return -Amount.parse(row[debit_amount_col].strip())
+
+    if date_col is not None:
+        def get_date(row):
+            return _parse_date(row[date_col].strip(), date_format)
+    else:
+        def get_date(row):
+            return None
+
+    if description_col is not None:
+        def get_description(row):
+            return row[description_col].strip()
+    else:
+        def get_description(row):
+            return ''
+
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # empty files can not be mapped
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    start = len(codecs.BOM_UTF8) if data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+    lines = _LineReader(data, start)
+    reader = csv.reader(lines)
+    first_row = True
+    for row in reader:
+        row_start, start = start, lines.end
+        if first_row or not row:
+            first_row = False
+            continue
+
+        # the row without its line ending
+        row_end = start
+        while row_end > row_start and data[row_end - 1] in b'\r\n':
+            row_end -= 1
+        yield BankTransaction(get_amount(row), get_date(row), get_description(row),
+                              data=data, span=(row_start, row_end))
+
+
+def import_bank_transactions(path: str, bank_profile: BankTransactionProfile) -> list[BankTransaction]:
+    """Returns a BankTransaction for each row of the csv statement at
+    `path` (see `iter_bank_transactions`)"""
+    return list(iter_bank_transactions(path, bank_profile))
+
+# TODO: optionally start from a given start date
 # list all transactions that have an amount and date that is close to
 #   those listed in transactions that haven't been accounted foreign
-# and, in the future, could maybe get fancy and try to determine
-# if a transaction is actually split into several transactions in
-# the ledger file
 
 
 if __name__ == '__main__':
@@ -98,20 +188,6 @@ if __name__ == '__main__':
     # bank_transactions = import_bank_transactions('/home/jim/ledger/statements/chase/transactions.csv', profile)
     bank_transactions = import_bank_transactions('/home/jim/ledger/statements/onpoint/transactions.csv', profile)
 
-    for tx in bank_transactions:
-        found_match = False
-        amount = abs(float(tx[0]))
-        raw_line = tx[1]
-
-        for ledger_tx in ledger.transactions:
-            if found_match:
-                break
-            for transfer in ledger_tx.transfers:
-                if found_match:
-                    break
-                ledger_tx_amount = transfer.amount
-                if ledger_tx_amount == amount:
-                    found_match = True
-
-        if not found_match:
-            print(f'MISSING: {amount} => {raw_line}')
+    reconciliation = reconcile_ledger(ledger, bank_transactions, profile.account)
+    match_splits(reconciliation)
+    print(reconciliation.format())
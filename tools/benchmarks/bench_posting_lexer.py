@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for posting line parsing.
+
+Compares the three-regex cascade that `_form_transaction`
+used to run on every posting line ("before") against the
+single-pass `_lex_posting` ("after").
+
+Run from the tools directory:
+
+    python3 benchmarks/bench_posting_lexer.py
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ledger import TransferStatus  # noqa
+from ledger_importer import MalformedTransfer, _lex_posting  # noqa
+
+
+POSTINGS = ['    Asset:MyBank:Checking  $123.45',
+            '    * Expenses:Food:Groceries  $1,042.10',
+            '    ! Income:Nerds, Inc.  $-2,500.00',
+            '    Assets:Broker  5 FOO @ $20.00',
+            '    Assets:MyBank:Savings  €-42',
+            '    Income:Nerds, Inc.']
+
+
+# `_parse_raw_amount` and `_parse_status_symbol` as they were
+# before the lexer was added, parsing amounts into floats
+
+
+def _parse_raw_amount(raw_amount):
+    try:
+        # does this use dollars or euros?
+        res = re.match(r'^([$€])(-?[0-9,.]*)$', raw_amount)
+        if res is not None:
+            unit = res.group(1)
+            amount = float(res.group(2).replace(',', ''))
+            return amount, unit
+
+        # does this use a custom unit?
+        res = re.match(r'^(-?[0-9,.]*) (\S+)$', raw_amount)
+        if res is not None:
+            unit = res.group(2)
+            amount = float(res.group(1).replace(',', ''))
+            return amount, unit
+    except ValueError:
+        raise MalformedTransfer(f'Unable to parse decimal amount given in {raw_amount}')
+
+    raise MalformedTransfer(f'Unable to parse amount string: {raw_amount}')
+
+
+def _parse_status_symbol(status_text):
+    status_text = status_text.strip()
+    if status_text == '':
+        return TransferStatus.DEFAULT
+    elif status_text == '!':
+        return TransferStatus.PENDING
+    elif status_text == '*':
+        return TransferStatus.CLEARED
+    else:
+        raise MalformedTransfer(f'Unable to parse status from: {status_text}')
+
+
+def regex_cascade(line):
+    """Posting parsing as it was done before the lexer was added"""
+    res = re.match(r'^\s{4}\s*(([*!] )?)((\S+ )*\S+)\s{2}\s*([$€]\S+)$', line)
+    if res:
+        status = _parse_status_symbol(res.group(1))
+        amount, unit = _parse_raw_amount(res.group(5))
+        return status, res.group(3), amount, unit
+    res = re.match(r'^\s{4}\s*(([*!] )?)((\S+ )*\S+)\s{2}\s*(-?[0-9.]+ \S+)( @ \S+)?$', line)
+    if res is not None:
+        status = _parse_status_symbol(res.group(1))
+        amount, unit = _parse_raw_amount(res.group(5))
+        return status, res.group(3), amount, unit
+    res = re.match(r'^\s{4}\s*((\S+ )*\S+)\s*$', line)
+    return TransferStatus.DEFAULT, res.group(1), None, None
+
+
+def postings_per_second(parse, number):
+    def run():
+        for line in POSTINGS:
+            parse(line)
+    seconds = min(timeit.repeat(run, number=number, repeat=5))
+    return number * len(POSTINGS) / seconds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks posting line parsing')
+    parser.add_argument('--number', '-n', type=int, default=20000,
+                        help='Number of passes over the sample postings')
+    args = parser.parse_args()
+
+    before = postings_per_second(regex_cascade, args.number)
+    after = postings_per_second(_lex_posting, args.number)
+    print(f'before (regex cascade): {before:,.0f} postings/s')
+    print(f'after (_lex_posting):   {after:,.0f} postings/s')
+    print(f'speedup:                {after / before:.2f}x')
@@ -1,17 +1,150 @@
 #!/usr/bin/env python3
 
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import date
 from enum import Enum
-from typing import Union
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+import sys
+from typing import Iterable, Iterator, Union
+
+from ledger_money import Amount, sum_amounts
+
+
+def parse_date(text: str) -> date:
+    """Parses a date given as YYYY/MM/DD. Month and
+    day do not have to be padded (e.g. 2022/7/4).
+
+    Raises ValueError if `text` is not a valid date."""
+    year, month, day = text.split('/')
+    return date(int(year), int(month), int(day))
+
+
+@lru_cache(maxsize=4096)
+def date_ordinal(text: str) -> int:
+    """Returns `parse_date(text).toordinal()`. Most transactions
+    share their date with others, so results are cached."""
+    return parse_date(text).toordinal()
 
 
 class Transaction:
-    def __init__(self, date: str, description: str, transfers: list[str]):
+    __slots__ = ('date', 'description', 'transfers', 'effective_date')
+
+    def __init__(self, date: str, description: str, transfers: list[str],
+                 effective_date: Union[str, None] = None):
         self.date = date
         self.description = description
         self.transfers = transfers
+        # e.g. 2022/03/07 for 2022/02/25=2022/03/07
+        self.effective_date = effective_date
+
+    def imbalance(self) -> dict[str, Amount]:
+        """Returns the sum of the transfers' amounts for each unit
+        that does not balance to zero. Transfers with a price count
+        towards the price's unit (e.g. 5 FOO @ $20.00 counts as $100).
+
+        Transfers with no amount are left out."""
+        totals = {}
+        for transfer in self.transfers:
+            if transfer.amount is None:
+                continue
+            if transfer.price is not None:
+                unit = transfer.price_unit
+                amount = transfer.amount * transfer.price
+            else:
+                unit = transfer.unit
+                amount = transfer.amount
+            totals[unit] = totals.get(unit, 0) + amount
+        return {unit: total for unit, total in totals.items() if total}
+
+    def balance_errors(self) -> list[str]:
+        """Returns a description of each problem found
+        with the amounts of the transaction's transfers"""
+        empty_amounts = sum(1 for transfer in self.transfers if transfer.amount is None)
+        if empty_amounts > 1:
+            return ['Found multiple transfers with no amount specified']
+        if empty_amounts == 1:
+            return []
+
+        imbalance = self.imbalance()
+        # with exactly two units, the transaction
+        # implies an exchange rate between them
+        two_unit_exchange = len(imbalance) == 2 and \
+            len(set(total > 0 for total in imbalance.values())) == 2
+        if imbalance and not two_unit_exchange:
+            amounts = ', '.join(f'{total:g} {unit}' for unit, total in imbalance.items())
+            return [f'Transfers do not balance, off by {amounts}']
+        return []
+
+    def errors(self) -> list[str]:
+        """Returns a description of each problem found with
+        the transaction, e.g. transfers that do not balance"""
+        errors = []
+        try:
+            parse_date(self.date)
+        except ValueError:
+            errors.append(f'Invalid date {self.date}')
+        if self.effective_date is not None:
+            try:
+                parse_date(self.effective_date)
+            except ValueError:
+                errors.append(f'Invalid effective date {self.effective_date}')
+        return errors + self.balance_errors()
+
+    def fill_amount(self) -> bool:
+        """Fills in the amount of the one transfer with no amount,
+        so that the transaction balances. This is only possible if
+        the other transfers are all in (or priced in) one unit.
+
+        Returns True if an amount was filled in."""
+        elided = [transfer for transfer in self.transfers if transfer.amount is None]
+        if len(elided) != 1:
+            return False
+        totals = {}
+        for transfer in self.transfers:
+            if transfer.amount is None:
+                continue
+            if transfer.price is not None:
+                unit, amount = transfer.price_unit, transfer.amount * transfer.price
+            else:
+                unit, amount = transfer.unit, transfer.amount
+            totals.setdefault(unit, []).append(amount)
+        if len(totals) != 1:
+            return False
+        (unit, amounts), = totals.items()
+        elided[0].amount = -sum(amounts)
+        elided[0].unit = unit
+        return True
+
+    def posted_amounts(self) -> Iterator[tuple[str, str, Amount]]:
+        """Yields the account, unit and amount of each transfer.
+
+        The transfer with no amount balances the others, so the
+        negated imbalance of each unit is yielded for it, without
+        filling in its amount (see `fill_amount`). Nothing is
+        yielded for transfers with no amount if there are several."""
+        elided = []
+        for transfer in self.transfers:
+            if transfer.amount is None:
+                elided.append(transfer)
+            else:
+                yield transfer.account, transfer.unit, Amount.coerce(transfer.amount)
+        if len(elided) == 1:
+            for unit, total in self.imbalance().items():
+                yield elided[0].account, unit, -total
 
     def validate(self) -> bool:
-        pass
+        return len(self.errors()) == 0
+
+    def copy(self) -> 'Transaction':
+        """Returns a copy of the transaction with copies of its
+        transfers, which can be changed without affecting it"""
+        return Transaction(self.date, self.description,
+                           [transfer.copy() for transfer in self.transfers],
+                           self.effective_date)
 
 
 class TransferStatus(Enum):
@@ -21,42 +154,552 @@ class TransferStatus(Enum):
 
 
 class Transfer:
+    __slots__ = ('account', 'amount', 'unit', 'status', 'price', 'price_unit')
+
     def __init__(self, account: str,
-                 amount: Union[float, None] = None,
+                 amount: Union[Amount, int, float, None] = None,
                  unit: Union[str, None] = None,
-                 status: TransferStatus = TransferStatus.DEFAULT):
+                 status: TransferStatus = TransferStatus.DEFAULT,
+                 price: Union[Amount, int, float, None] = None,
+                 price_unit: Union[str, None] = None):
         self.account = account
-        self.amount = amount
+        # amounts are always kept exact (see ledger_money.Amount)
+        self.amount = None if amount is None else Amount.coerce(amount)
         self.unit = unit
         self.status = status
+        # per-unit price, e.g. 5 FOO @ $20.00
+        self.price = None if price is None else Amount.coerce(price)
+        self.price_unit = price_unit
+
+    def copy(self) -> 'Transfer':
+        return Transfer(self.account, self.amount, self.unit,
+                        self.status, self.price, self.price_unit)
 
 
 class LedgerListenerType(Enum):
+    # called with each transaction added to the ledger
     ADD_TRANSACTION = 1
+    # called with lists of transactions added to the ledger.
+    # every transaction is passed to these listeners as well,
+    # whether it was added on its own or with others
+    ADD_TRANSACTIONS = 2
 
 
 class LedgerPluginManager:
+    """Keeps the listeners registered for each type of event.
+
+    Deferred listeners are not called when an event is triggered.
+    Instead, the event is queued until `run_deferred` is called,
+    e.g. once a whole file has been imported."""
     def __init__(self):
-        self.add_transaction_listeners = []
+        self.listeners = {type: [] for type in LedgerListenerType}
+        self.deferred_listeners = {type: [] for type in LedgerListenerType}
+        # (listeners, args, kwargs) of each event not yet
+        # passed on to the deferred listeners
+        self._deferred = deque()
+
+    @property
+    def add_transaction_listeners(self) -> list[callable]:
+        return self.listeners[LedgerListenerType.ADD_TRANSACTION]
 
-    def register_listener(self, type: LedgerListenerType, f: callable):
-        self.add_transaction_listeners.append(f)
+    def register_listener(self, type: LedgerListenerType, f: callable, deferred: bool = False):
+        if deferred:
+            self.deferred_listeners[type].append(f)
+        else:
+            self.listeners[type].append(f)
+
+    def has_listeners(self, type: LedgerListenerType) -> bool:
+        return bool(self.listeners[type] or self.deferred_listeners[type])
 
     def trigger(self, type: LedgerListenerType, *args, **kwargs):
-        if type == LedgerListenerType.ADD_TRANSACTION:
-            for f in self.add_transaction_listeners:
+        for f in self.listeners[type]:
+            f(*args, **kwargs)
+        deferred_listeners = self.deferred_listeners[type]
+        if deferred_listeners:
+            # only the listeners registered by now get the event
+            self._deferred.append((tuple(deferred_listeners), args, kwargs))
+
+    def run_deferred(self) -> None:
+        """Passes every queued event on to its deferred listeners"""
+        deferred = self._deferred
+        while deferred:
+            listeners, args, kwargs = deferred.popleft()
+            for f in listeners:
                 f(*args, **kwargs)
 
 
+# separates the parts of an account name, e.g. Expenses:Food
+ACCOUNT_SEPARATOR = ':'
+
+
+class AccountNode:
+    """An account in an AccountTree. `postings` holds the postings
+    made to this exact account; postings to subaccounts are kept
+    on the nodes in `children`."""
+    __slots__ = ('name', 'full_name', 'parent', 'children', 'postings')
+
+    def __init__(self, name: str, full_name: str, parent: Union['AccountNode', None], postings):
+        self.name = name
+        self.full_name = full_name
+        self.parent = parent
+        self.children = {}
+        self.postings = postings
+
+    def iter_nodes(self) -> Iterator['AccountNode']:
+        """Yields this node and every node below it, depth first,
+        visiting children in the order they were added"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children.values()))
+
+    def iter_postings(self, include_subaccounts: bool = True) -> Iterator:
+        if not include_subaccounts:
+            yield from self.postings
+            return
+        for node in self.iter_nodes():
+            yield from node.postings
+
+
+class AccountTree:
+    """Trie of account names, split on ACCOUNT_SEPARATOR,
+    where each node keeps the postings made to its account.
+
+    Account names are interned: every posting to an account
+    refers to the same `full_name` string.
+
+    By default, a posting is a (transaction, transfer) tuple.
+    `new_postings` creates the container each node keeps its
+    postings in, so a ledger can store postings another way."""
+    def __init__(self, new_postings: callable = list):
+        self.new_postings = new_postings
+        self.root = AccountNode('', '', None, new_postings())
+        # every node by its full name, so adding a posting
+        # does not need to walk down the trie
+        self.nodes = {}
+        # lazy transactions, which are only indexed once
+        # an account is looked up (see `add_transaction`)
+        self._pending = deque()
+
+    def __contains__(self, account: str) -> bool:
+        self._index_pending()
+        return account in self.nodes
+
+    def node(self, account: str) -> AccountNode:
+        """Returns the node of `account`, creating it
+        (and any missing parent accounts) if needed"""
+        try:
+            return self.nodes[account]
+        except KeyError:
+            pass
+        parent_name, _, name = account.rpartition(ACCOUNT_SEPARATOR)
+        parent = self.node(parent_name) if parent_name else self.root
+        account = sys.intern(account)
+        node = AccountNode(sys.intern(name), account, parent, self.new_postings())
+        parent.children[node.name] = node
+        self.nodes[account] = node
+        return node
+
+    def find(self, account: str) -> Union[AccountNode, None]:
+        """Returns the node of `account`, or None if no
+        posting has been made to it or its subaccounts"""
+        self._index_pending()
+        return self.nodes.get(account)
+
+    def intern(self, account: str) -> str:
+        """Returns the interned name of `account`"""
+        return self.node(account).full_name
+
+    def copy(self) -> 'AccountTree':
+        """Returns a tree with the same accounts and postings, which
+        can be added to without changing this one. The postings
+        themselves are shared, only their containers are copied."""
+        tree = AccountTree(self.new_postings)
+        # parents come before their children, which are visited
+        # in the order they were added, so the order is kept
+        for node in islice(self.root.iter_nodes(), 1, None):
+            tree.node(node.full_name).postings = node.postings[:]
+        tree._pending = deque(self._pending)
+        return tree
+
+    def add(self, account: str, posting) -> None:
+        self.node(account).postings.append(posting)
+
+    def add_transactions(self, transactions: list[Transaction]) -> None:
+        """Same as calling `add_transaction` for each of `transactions`"""
+        nodes = self.nodes
+        for transaction in transactions:
+            is_parsed = getattr(transaction, 'is_parsed', None)
+            if is_parsed is not None and not is_parsed():
+                self._pending.append(transaction)
+                continue
+            for transfer in transaction.transfers:
+                node = nodes.get(transfer.account)
+                if node is None:
+                    node = self.node(transfer.account)
+                node.postings.append((transaction, transfer))
+
+    def add_transaction(self, transaction: Transaction) -> None:
+        """Adds a posting for each of the transfers of `transaction`.
+
+        Lazy transactions whose transfers have not been parsed yet are
+        only added once an account is looked up, so that importing
+        lazily does not parse every transaction."""
+        is_parsed = getattr(transaction, 'is_parsed', None)
+        if is_parsed is not None and not is_parsed():
+            self._pending.append(transaction)
+            return
+        for transfer in transaction.transfers:
+            self.add(transfer.account, (transaction, transfer))
+
+    def _index_pending(self) -> None:
+        pending = self._pending
+        while pending:
+            # a transaction with malformed transfers raises
+            # here, but is not tried again on the next lookup
+            transaction = pending.popleft()
+            for transfer in transaction.transfers:
+                self.add(transfer.account, (transaction, transfer))
+
+    def accounts(self) -> list[str]:
+        """Returns the name of every account, sorted"""
+        self._index_pending()
+        return sorted(self.nodes)
+
+    def postings(self, account: str, include_subaccounts: bool = True) -> list:
+        """Returns the postings made to `account` and, if
+        `include_subaccounts` is set, to any of its subaccounts"""
+        node = self.find(account)
+        if node is None:
+            return []
+        return list(node.iter_postings(include_subaccounts))
+
+
+class SortedIndex:
+    """Items sorted by a numeric key, which can be looked up
+    by key range with a binary search.
+
+    Items added in key order are appended. Items added out of
+    order are held back and merged in on the next lookup, so
+    adding unsorted items does not insert into the middle of
+    the index over and over. Items with the same key keep the
+    order they were added in."""
+    # array typecode of the keys
+    typecode = 'd'
+
+    def __init__(self):
+        self.keys = array(self.typecode)
+        self.items = []
+        self._unsorted = []
+
+    def __len__(self) -> int:
+        return len(self.items) + len(self._unsorted)
+
+    def add(self, key, item) -> None:
+        if not self._unsorted and (not self.keys or key >= self.keys[-1]):
+            self.keys.append(key)
+            self.items.append(item)
+        else:
+            self._unsorted.append((key, item))
+
+    def _sort(self) -> None:
+        if not self._unsorted:
+            return
+        entries = list(zip(self.keys, self.items))
+        entries.extend(self._unsorted)
+        # stable, and fast on the sorted runs already in the index
+        entries.sort(key=itemgetter(0))
+        self.keys = array(self.typecode, (key for key, _ in entries))
+        self.items = [item for _, item in entries]
+        self._unsorted = []
+
+    def _range(self, low, high) -> tuple[int, int]:
+        self._sort()
+        lo = 0 if low is None else bisect_left(self.keys, low)
+        hi = len(self.items) if high is None else bisect_right(self.keys, high)
+        return lo, max(lo, hi)
+
+    def items_between(self, low=None, high=None) -> list:
+        """Returns the items with a key from `low` to `high`
+        (inclusive), in key order. Either can be None to
+        leave that end of the range open."""
+        lo, hi = self._range(low, high)
+        return self.items[lo:hi]
+
+    def count_between(self, low=None, high=None) -> int:
+        """Returns the number of items `items_between` returns"""
+        lo, hi = self._range(low, high)
+        return hi - lo
+
+    def copy(self) -> 'SortedIndex':
+        """Returns an index with the same items, which can be
+        added to without changing this one"""
+        index = type(self)()
+        index.keys = array(self.typecode, self.keys)
+        index.items = list(self.items)
+        index._unsorted = list(self._unsorted)
+        return index
+
+
+class DateIndex(SortedIndex):
+    """Items (usually transactions) sorted by date ordinal"""
+    typecode = 'l'
+
+    @property
+    def ordinals(self) -> array:
+        return self.keys
+
+    def between(self, start: Union[date, None] = None, end: Union[date, None] = None) -> list:
+        """Returns the items dated from `start` to `end`
+        (inclusive), in date order. Either can be None
+        to leave that end of the range open."""
+        return self.items_between(None if start is None else start.toordinal(),
+                                  None if end is None else end.toordinal())
+
+
+class AmountIndex(SortedIndex):
+    """Items (usually postings) sorted by amount.
+
+    The keys are the amounts as floats, which keeps the index
+    compact. Converting to float never changes the order of two
+    amounts, but can make close amounts equal, so a lookup may
+    return a few items just outside of the range asked for.
+    Compare their exact amounts when that matters."""
+    typecode = 'd'
+
+    def between(self, low: Union[Amount, float, None] = None,
+                high: Union[Amount, float, None] = None) -> list:
+        return self.items_between(None if low is None else float(low),
+                                  None if high is None else float(high))
+
+    def count(self, low: Union[Amount, float, None] = None,
+              high: Union[Amount, float, None] = None) -> int:
+        return self.count_between(None if low is None else float(low),
+                                  None if high is None else float(high))
+
+
+# number of transactions passed to ADD_TRANSACTIONS
+# listeners at once by `Ledger.add_transactions`
+ADD_TRANSACTIONS_CHUNK_SIZE = 1024
+
+
+class FrozenLedgerError(Exception):
+    pass
+
+
 class Ledger:
     def __init__(self):
+        # set by `freeze`
+        self.frozen = False
         self.transactions = []
         self.plugin_mgr = LedgerPluginManager()
+        # postings by account, only kept once `index_accounts` is called
+        self.accounts = None
+        # transactions by date and by effective date, only kept once
+        # `index_dates` is called. transactions with no effective
+        # date are indexed by their date in both
+        self.dates = None
+        self.effective_dates = None
+        # postings by amount, only kept once `index_amounts` is called
+        self.amounts = None
 
     def add_transaction(self, transaction):
+        self._check_not_frozen()
         self.transactions.append(transaction)
 
-        self.plugin_mgr.trigger(LedgerListenerType.ADD_TRANSACTION, transaction)
+        self._trigger_added([transaction])
+
+    def add_transactions(self, transactions: Iterable[Transaction],
+                         chunk_size: int = ADD_TRANSACTIONS_CHUNK_SIZE) -> None:
+        """Adds each of `transactions` to the ledger. Listeners
+        are triggered once per chunk of `chunk_size` transactions
+        (see `LedgerListenerType.ADD_TRANSACTIONS`) rather than
+        once per transaction."""
+        self._check_not_frozen()
+        transactions = iter(transactions)
+        while True:
+            chunk = list(islice(transactions, chunk_size))
+            if not chunk:
+                break
+            self.transactions.extend(chunk)
+            self._trigger_added(chunk)
+
+    def _check_not_frozen(self) -> None:
+        if self.frozen:
+            raise FrozenLedgerError('Transactions can not be added to a frozen ledger')
+
+    def freeze(self) -> None:
+        """Stops transactions from being added to the ledger.
+
+        Work the indexes leave for the next lookup is done now
+        (indexing lazy transactions, sorting dates added out of
+        order), so lookups on a frozen ledger only read it and it
+        can be shared between threads. The account and date indexes
+        are built now if no lookup has built them yet. Fill in
+        amounts (see `auto_balance`) before freezing, since that
+        changes the transactions."""
+        self.index_accounts().accounts()
+        self.index_dates()
+        for index in (self.dates, self.effective_dates, self.amounts):
+            if index is not None:
+                index._sort()
+        self.frozen = True
+
+    def fork(self) -> 'Ledger':
+        """Returns a new ledger holding the same transactions, which
+        can be added to without changing this one (even if this one
+        is frozen).
+
+        The transactions and the entries of the indexes are shared
+        by the two ledgers, only the lists holding them are copied.
+        Listeners registered on this ledger are not carried over."""
+        ledger = type(self)()
+        ledger.transactions = list(self.transactions)
+        if self.accounts is not None:
+            ledger.accounts = self.accounts.copy()
+            ledger.plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                                ledger._index_accounts)
+        if self.dates is not None:
+            ledger.dates = self.dates.copy()
+            ledger.effective_dates = self.effective_dates.copy()
+            ledger.plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                                ledger._index_dates)
+        if self.amounts is not None:
+            ledger.amounts = self.amounts.copy()
+            ledger.plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                                ledger._index_amounts)
+        return ledger
+
+    def _trigger_added(self, transactions: list[Transaction]) -> None:
+        plugin_mgr = self.plugin_mgr
+        if plugin_mgr.has_listeners(LedgerListenerType.ADD_TRANSACTION):
+            for transaction in transactions:
+                plugin_mgr.trigger(LedgerListenerType.ADD_TRANSACTION, transaction)
+        plugin_mgr.trigger(LedgerListenerType.ADD_TRANSACTIONS, transactions)
 
     def get_plugin_manager(self):
         return self.plugin_mgr
+
+    def index_accounts(self) -> AccountTree:
+        """Starts keeping a tree of the accounts posted to, for
+        `postings`, and returns it. The first lookup by account
+        calls it, so ledgers that are never looked up by account
+        do not pay for the tree."""
+        if self.accounts is None:
+            self.accounts = self._new_account_tree()
+            self._index_accounts(self.transactions)
+            self.plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                              self._index_accounts)
+        return self.accounts
+
+    def _new_account_tree(self) -> AccountTree:
+        return AccountTree()
+
+    def _index_accounts(self, transactions: list[Transaction]) -> None:
+        self.accounts.add_transactions(transactions)
+
+    def index_dates(self, effective: bool = False) -> DateIndex:
+        """Starts keeping indexes of transactions by date and by
+        effective date, for `transactions_between`, and returns the
+        one picked by `effective`. The first lookup by date calls it."""
+        if self.dates is None:
+            self.dates = DateIndex()
+            self.effective_dates = DateIndex()
+            self._index_dates(self.transactions)
+            self.plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                              self._index_dates)
+        return self.effective_dates if effective else self.dates
+
+    def _index_dates(self, transactions: list[Transaction]) -> None:
+        for transaction in transactions:
+            try:
+                ordinal = date_ordinal(transaction.date)
+                effective_ordinal = ordinal if transaction.effective_date is None \
+                    else date_ordinal(transaction.effective_date)
+            except ValueError:
+                # only imported when not strict (see Transaction.errors)
+                continue
+            self.dates.add(ordinal, transaction)
+            self.effective_dates.add(effective_ordinal, transaction)
+
+    def index_amounts(self) -> AmountIndex:
+        """Starts keeping an index of postings by amount, for
+        `postings_between_amounts`, and returns it. Postings with
+        no amount are left out of the index, so call it after
+        `auto_balance` for the amounts it fills in to be indexed.
+
+        A frozen ledger may be shared between threads, so it can
+        not start an index. Raises FrozenLedgerError if it was not
+        called before `freeze`."""
+        if self.amounts is None:
+            if self.frozen:
+                raise FrozenLedgerError('Amounts must be indexed before the ledger is frozen')
+            self.amounts = AmountIndex()
+            self._index_amounts(self.transactions)
+            self.plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                              self._index_amounts)
+        return self.amounts
+
+    def _index_amounts(self, transactions: Iterable[Transaction]) -> None:
+        amounts = self.amounts
+        for transaction in transactions:
+            for transfer in transaction.transfers:
+                if transfer.amount is not None:
+                    amounts.add(float(transfer.amount), (transaction, transfer))
+
+    def postings_between_amounts(self, low: Union[Amount, float, None] = None,
+                                 high: Union[Amount, float, None] = None
+                                 ) -> list[tuple[Transaction, Transfer]]:
+        """Returns a (transaction, transfer) tuple for each posting
+        with an amount from `low` to `high` (see `AmountIndex`),
+        sorted by amount. Starts indexing amounts if needed (see
+        `index_amounts`)."""
+        return self.index_amounts().between(low, high)
+
+    def transactions_between(self, start: Union[date, None] = None,
+                             end: Union[date, None] = None,
+                             effective: bool = False) -> list[Transaction]:
+        """Returns the transactions dated from `start` to `end`
+        (inclusive), sorted by date. If `effective` is set,
+        transactions are selected and sorted by their effective date.
+
+        Takes O(log n) time plus the size of the result.
+        Transactions with an invalid date are left out."""
+        return self.index_dates(effective).between(start, end)
+
+    def auto_balance(self) -> list[tuple[Transaction, str]]:
+        """Fills in the amounts left blank in every transaction
+        (see `Transaction.fill_amount`) and checks that every
+        transaction balances.
+
+        Returns a (transaction, error) tuple for each problem
+        found. The transfers of lazy transactions are parsed,
+        so any malformed ones are raised here."""
+        problems = []
+        for transaction in self.transactions:
+            transaction.fill_amount()
+            for error in transaction.balance_errors():
+                problems.append((transaction, error))
+        return problems
+
+    def postings(self, account: str,
+                 include_subaccounts: bool = True) -> list[tuple[Transaction, Transfer]]:
+        """Returns a (transaction, transfer) tuple for each posting
+        to `account` and, if `include_subaccounts` is set, to any
+        of its subaccounts (e.g. Expenses:Food:Groceries for
+        Expenses:Food). Takes time proportional to the result."""
+        return self.index_accounts().postings(account, include_subaccounts)
+
+    def totals(self, account: Union[str, None] = None,
+               include_subaccounts: bool = True) -> dict[str, Amount]:
+        """Returns the exact total amount of each unit posted to
+        `account` (see `postings`), or to any account if it is
+        None. Transfers with no amount are left out."""
+        if account is None:
+            transfers = (transfer for transaction in self.transactions
+                         for transfer in transaction.transfers)
+        else:
+            transfers = (transfer for _, transfer in self.postings(account, include_subaccounts))
+        return sum_amounts((transfer.unit, Amount.coerce(transfer.amount))
+                           for transfer in transfers if transfer.amount is not None)
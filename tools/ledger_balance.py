@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import date
+from typing import Iterable, Union
+
+from ledger import ACCOUNT_SEPARATOR, Ledger, LedgerListenerType, LedgerPluginManager, \
+    Transaction, date_ordinal
+from ledger_money import Amount
+
+
+class FenwickTree:
+    """Binary indexed tree over a growable array of integers.
+    Adding to a value and summing a prefix of the array
+    both take O(log n) time."""
+    def __init__(self, values: Union[array, None] = None):
+        self.values = array('q')
+        # tree[i - 1] holds the sum of values (i - lowbit(i), i]
+        self.tree = array('q')
+        if values is not None:
+            self.extend(values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def extend(self, values: Iterable[int]) -> None:
+        """Appends `values` to the array, in time proportional
+        to their number plus O(log n)"""
+        old_size = len(self.values)
+        self.values.extend(values)
+        size = len(self.values)
+        tree = self.tree
+        tree.extend(self.values[old_size:])
+        # the nodes covering the end of the old array are the only
+        # old ones with a parent among the new ones
+        i = old_size
+        while i > 0:
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent - 1] += tree[i - 1]
+            i -= i & -i
+        for i in range(old_size + 1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent - 1] += tree[i - 1]
+
+    def add(self, index: int, delta: int) -> None:
+        """Adds `delta` to the value at `index`, growing
+        the array if it does not reach `index` yet"""
+        if index >= len(self.values):
+            self.extend(bytes(index + 1 - len(self.values)))
+        self.values[index] += delta
+        i = index + 1
+        tree = self.tree
+        size = len(tree)
+        while i <= size:
+            tree[i - 1] += delta
+            i += i & -i
+
+    def prefix_sum(self, index: int) -> int:
+        """Returns the sum of the values up to and including
+        `index`. Indexes past the end sum the whole array."""
+        i = min(index + 1, len(self.tree))
+        tree = self.tree
+        total = 0
+        while i > 0:
+            total += tree[i - 1]
+            i -= i & -i
+        return total
+
+    def multiply(self, factor: int) -> None:
+        """Multiplies every value by `factor`"""
+        self.values = array(self.values.typecode, map(factor.__mul__, self.values))
+        self.tree = array(self.tree.typecode, map(factor.__mul__, self.tree))
+
+
+class DayTotals:
+    """Running totals of the amounts posted on each day, for one
+    account and unit. Only days with postings take a slot: the
+    tree is indexed by the position of each day in `ordinals`.
+
+    Postings on a day later than (or the same as) the last one, or
+    on a day that already has postings, are added in O(log n) time.
+    Postings on a new day before the last one are kept aside and
+    merged in all at once by the next query, as `SortedIndex` does
+    with its sort, so adding transactions newest first or in any
+    order takes O(n log n) time overall."""
+    def __init__(self):
+        # days with postings, sorted
+        self.ordinals = array('l')
+        self.tree = FenwickTree()
+        # (ordinal, value) of postings waiting to be merged in
+        self._unsorted = []
+
+    def add(self, ordinal: int, value: int) -> None:
+        ordinals = self.ordinals
+        if not ordinals or ordinal > ordinals[-1]:
+            ordinals.append(ordinal)
+            self.tree.extend((value,))
+            return
+        position = bisect_left(ordinals, ordinal)
+        if ordinals[position] == ordinal:
+            self.tree.add(position, value)
+        else:
+            self._unsorted.append((ordinal, value))
+
+    def _sort(self) -> None:
+        if not self._unsorted:
+            return
+        values = dict(zip(self.ordinals, self.tree.values))
+        for ordinal, value in self._unsorted:
+            values[ordinal] = values.get(ordinal, 0) + value
+        self._unsorted = []
+        ordinals = sorted(values)
+        self.ordinals = array('l', ordinals)
+        self.tree = FenwickTree(array('q', map(values.__getitem__, ordinals)))
+
+    def total(self, ordinal: Union[int, None] = None) -> int:
+        """Returns the total of the postings up to and
+        including day `ordinal`, or of all of them"""
+        self._sort()
+        if ordinal is None:
+            return self.tree.prefix_sum(len(self.tree))
+        return self.tree.prefix_sum(bisect_right(self.ordinals, ordinal) - 1)
+
+    def multiply(self, factor: int) -> None:
+        """Multiplies every amount by `factor`"""
+        self.tree.multiply(factor)
+        self._unsorted = [(ordinal, value * factor) for ordinal, value in self._unsorted]
+
+
+class BalanceEngine:
+    """Keeps running sums of the amounts posted to each account,
+    per unit and per day, so that the balance of any account as
+    of any date takes O(log n) time to compute (n being the
+    number of days the account has postings on).
+
+    Each account has one DayTotals per unit for its own postings
+    and another for the postings to it and all of its subaccounts.
+    Adding a transaction updates the totals of the accounts it
+    posts to and their parents. Amounts are kept exactly, as
+    integers scaled by the decimal places of their unit.
+
+    Register the engine on a ledger's plugin manager (see
+    `register`) to keep it up to date as transactions are added."""
+    def __init__(self):
+        # ordinal of the earliest transaction
+        self.first = None
+        # account -> unit -> DayTotals, for postings to exactly that account
+        self.own = {}
+        # account -> unit -> DayTotals, including subaccounts
+        self.subtree = {}
+        # unit -> number of decimal places the totals of the unit hold
+        self.scales = {}
+        # transactions whose date could not be parsed
+        self.undated = []
+        # lazy transactions, only added once the engine is queried
+        self._pending = deque()
+        # the totals that postings to each account add to
+        self._account_totals = {}
+        # plugin managers the engine is a deferred listener of
+        self._plugin_mgrs = []
+
+    def register(self, plugin_mgr: LedgerPluginManager, deferred: bool = False) -> None:
+        """Registers the engine for transactions added to a ledger.
+
+        If `deferred` is set, transactions are only added once
+        the plugin manager runs its deferred listeners, which
+        querying the engine does first."""
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS, self.add_transactions,
+                                     deferred=deferred)
+        if deferred:
+            self._plugin_mgrs.append(plugin_mgr)
+
+    def add_transactions(self, transactions: list[Transaction]) -> None:
+        for transaction in transactions:
+            self.add_transaction(transaction)
+
+    @classmethod
+    def for_ledger(cls, ledger: Ledger) -> 'BalanceEngine':
+        """Creates an engine holding the transactions already in
+        `ledger` and registers it for the ones added later"""
+        engine = cls()
+        for transaction in ledger.transactions:
+            engine.add_transaction(transaction)
+        engine.register(ledger.get_plugin_manager())
+        return engine
+
+    def add_transaction(self, transaction: Transaction) -> None:
+        is_parsed = getattr(transaction, 'is_parsed', None)
+        if is_parsed is not None and not is_parsed():
+            # avoid parsing lazy transactions during an import
+            self._pending.append(transaction)
+            return
+        self._add(transaction)
+
+    def _unit_totals(self, account: str) -> list[dict[str, DayTotals]]:
+        """Returns the totals of each unit that a posting to `account`
+        adds to: its own and those of it and every parent account"""
+        try:
+            return self._account_totals[account]
+        except KeyError:
+            pass
+        unit_totals = [self.own.setdefault(account, {})]
+        parts = account.split(ACCOUNT_SEPARATOR)
+        for depth in range(1, len(parts) + 1):
+            unit_totals.append(self.subtree.setdefault(ACCOUNT_SEPARATOR.join(parts[:depth]), {}))
+        self._account_totals[account] = unit_totals
+        return unit_totals
+
+    def _scaled(self, unit: str, amount: Amount) -> int:
+        """Returns `amount` as an integer scaled for `unit`, first
+        scaling up the unit's totals if it has more decimal places"""
+        scale = self.scales.setdefault(unit, amount.scale)
+        if amount.scale > scale:
+            factor = 10 ** (amount.scale - scale)
+            for all_totals in (self.own, self.subtree):
+                for unit_totals in all_totals.values():
+                    totals = unit_totals.get(unit)
+                    if totals is not None:
+                        totals.multiply(factor)
+            scale = self.scales[unit] = amount.scale
+        return amount.rescale(scale)
+
+    def _add(self, transaction: Transaction) -> None:
+        try:
+            ordinal = date_ordinal(transaction.date)
+        except ValueError:
+            self.undated.append(transaction)
+            return
+
+        if self.first is None or ordinal < self.first:
+            self.first = ordinal
+        for account, unit, amount in transaction.posted_amounts():
+            value = self._scaled(unit, amount)
+            for unit_totals in self._unit_totals(account):
+                totals = unit_totals.get(unit)
+                if totals is None:
+                    totals = unit_totals[unit] = DayTotals()
+                totals.add(ordinal, value)
+
+    def _add_pending(self) -> None:
+        for plugin_mgr in self._plugin_mgrs:
+            plugin_mgr.run_deferred()
+        pending = self._pending
+        while pending:
+            self._add(pending.popleft())
+
+    def balance(self, account: str, as_of: Union[date, None] = None,
+                include_subaccounts: bool = True) -> dict[str, Amount]:
+        """Returns the balance of `account` in each unit, counting
+        transactions up to and including `as_of` (or all of them).
+
+        If `include_subaccounts` is set, postings to subaccounts
+        of `account` are included (e.g. Expenses:Food:Groceries
+        for Expenses:Food)."""
+        self._add_pending()
+        unit_totals = (self.subtree if include_subaccounts else self.own).get(account)
+        if not unit_totals:
+            return {}
+
+        ordinal = None if as_of is None else as_of.toordinal()
+        if ordinal is not None and ordinal < self.first:
+            return {}
+        return {unit: Amount(totals.total(ordinal), self.scales[unit])
+                for unit, totals in unit_totals.items()}
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+from typing import Union
+
+from ledger import Transaction, Transfer, TransferStatus
+from ledger_money import Amount
+
+
+logger = logging.getLogger(__name__)
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+logger.addHandler(handler)
+
+
+# bump CACHE_VERSION whenever the layout of the cache file or the
+# way transactions are parsed changes, so stale caches are ignored
+CACHE_MAGIC = b'LEDGERWEB-CACHE'
+CACHE_VERSION = 4
+_HEADER = struct.Struct(f'>{len(CACHE_MAGIC)}sH')
+
+_READ_SIZE = 1 << 20
+
+
+class CacheKey:
+    """Identifies the exact contents of a ledger file"""
+    def __init__(self, path: str, mtime_ns: int, size: int, digest: bytes):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+
+    def as_json(self) -> list:
+        return [self.path, self.mtime_ns, self.size, self.digest.hex()]
+
+
+def cache_path(path: Union[str, os.PathLike]) -> str:
+    """Returns the path of the sidecar cache file kept next
+    to the ledger file at `path`, e.g. `.ladds.ledger.cache`"""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f'.{name}.cache')
+
+
+def cache_key(path: Union[str, os.PathLike]) -> CacheKey:
+    """Stats and hashes the ledger file at `path`"""
+    path = os.path.abspath(path)
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as ledger_file:
+        stat = os.fstat(ledger_file.fileno())
+        while True:
+            data = ledger_file.read(_READ_SIZE)
+            if not data:
+                break
+            file_hash.update(data)
+    return CacheKey(path, stat.st_mtime_ns, stat.st_size, file_hash.digest())
+
+
+# the cache is stored as JSON rather than pickled, since anyone able
+# to write next to a ledger file could otherwise have any process
+# importing the file run code of their choosing
+def _pack_amount(amount: Union[Amount, None]) -> Union[list[int], None]:
+    return None if amount is None else [amount.value, amount.scale]
+
+
+def _unpack_amount(packed: Union[list[int], None]) -> Union[Amount, None]:
+    return None if packed is None else Amount(*packed)
+
+
+def _pack(transactions: list[Transaction]) -> list[list]:
+    return [[t.date, t.description,
+             [[tr.account, _pack_amount(tr.amount), tr.unit, tr.status.value,
+               _pack_amount(tr.price), tr.price_unit]
+              for tr in t.transfers],
+             t.effective_date]
+            for t in transactions]
+
+
+def _unpack(packed: list[list]) -> list[Transaction]:
+    statuses = {status.value: status for status in TransferStatus}
+    return [Transaction(date, description,
+                        [Transfer(account, _unpack_amount(amount), unit, statuses[status],
+                                  _unpack_amount(price), price_unit)
+                         for account, amount, unit, status, price, price_unit in transfers],
+                        effective_date)
+            for date, description, transfers, effective_date in packed]
+
+
+def load(key: CacheKey) -> Union[list[Transaction], None]:
+    """Returns the cached transactions of the ledger file
+    identified by `key`, or None if there is no cache for
+    that exact file or the cache is stale."""
+    path = cache_path(key.path)
+    try:
+        with open(path, 'rb') as cache_file:
+            magic, version = _HEADER.unpack(cache_file.read(_HEADER.size))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                logger.info(f'Cache miss for {key.path}: {path} has version {version}, '
+                            f'expected {CACHE_VERSION}')
+                return None
+
+            contents = json.load(cache_file)
+        cached_key = contents['key']
+        packed = contents['transactions']
+        if cached_key != key.as_json():
+            logger.info(f'Cache miss for {key.path}: file changed since {path} was written')
+            return None
+        transactions = _unpack(packed)
+    except FileNotFoundError:
+        logger.info(f'Cache miss for {key.path}: no cache found at {path}')
+        return None
+    except (OSError, struct.error, ValueError, TypeError, KeyError):
+        logger.warning(f'Cache miss for {key.path}: unable to read {path}', exc_info=True)
+        return None
+
+    logger.info(f'Cache hit for {key.path}: loaded {len(transactions)} transactions from {path}')
+    return transactions
+
+
+def store(key: CacheKey, transactions: list[Transaction]) -> None:
+    """Writes `transactions` to the cache of the ledger file
+    identified by `key`. Failing to write the cache is logged,
+    but is not an error."""
+    path = cache_path(key.path)
+    directory = os.path.dirname(path)
+    try:
+        # write to a temporary file first, so readers
+        # never see a partially written cache
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.ledgerweb-cache-')
+        try:
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(_HEADER.pack(CACHE_MAGIC, CACHE_VERSION))
+                cache_file.write(json.dumps({'key': key.as_json(),
+                                             'transactions': _pack(transactions)},
+                                            separators=(',', ':')).encode('utf-8'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError:
+        logger.warning(f'Unable to write cache {path}', exc_info=True)
+        return
+
+    logger.info(f'Wrote {len(transactions)} transactions to {path}')
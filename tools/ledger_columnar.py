@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+
+from array import array
+from bisect import bisect_right
+from datetime import date
+from itertools import accumulate, compress, islice
+from operator import and_, eq, mul, not_, sub
+from typing import Iterable, Iterator, Union
+
+from ledger import ADD_TRANSACTIONS_CHUNK_SIZE, AccountTree, Ledger, \
+    Transaction, Transfer, TransferStatus, parse_date
+from ledger_money import Amount, sum_by_unit
+
+
+# stored in place of a missing amount, price or unit
+_NO_AMOUNT = -(1 << 63)
+_NO_ID = -1
+# stored in place of the ordinal of a date that does not parse
+_NO_ORDINAL = 0
+# stored in place of the index of the transfer with no amount
+_NO_ELIDED = -1
+_MULTIPLE_ELIDED = -2
+
+_STATUSES = {status.value: status for status in TransferStatus}
+
+
+class Interner:
+    """Assigns a small integer id to each distinct string"""
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def id(self, name: Union[str, None]) -> int:
+        """Returns the id of `name`, assigning one if needed"""
+        if name is None:
+            return _NO_ID
+        try:
+            return self.ids[name]
+        except KeyError:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            return name_id
+
+    def name(self, name_id: int) -> Union[str, None]:
+        if name_id == _NO_ID:
+            return None
+        return self.names[name_id]
+
+
+class TransferView(Transfer):
+    """A transfer stored in the columns of a ColumnarLedger.
+
+    A new view is made each time a transfer is looked up, so
+    views of the same transfer are equal, but not the same object."""
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns: 'LedgerColumns', index: int):
+        self._columns = columns
+        self._index = index
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TransferView):
+            return NotImplemented
+        return self._columns is other._columns and self._index == other._index
+
+    def __hash__(self) -> int:
+        return hash((id(self._columns), self._index))
+
+    @property
+    def account(self) -> str:
+        return self._columns.accounts.names[self._columns.account_ids[self._index]]
+
+    @property
+    def amount(self) -> Union[Amount, None]:
+        columns = self._columns
+        return columns.amount(columns.amounts[self._index], columns.unit_ids[self._index],
+                              columns.scales[self._index])
+
+    @property
+    def unit(self) -> Union[str, None]:
+        return self._columns.units.name(self._columns.unit_ids[self._index])
+
+    @property
+    def status(self) -> TransferStatus:
+        return _STATUSES[self._columns.statuses[self._index]]
+
+    @property
+    def price(self) -> Union[Amount, None]:
+        columns = self._columns
+        return columns.amount(columns.prices[self._index], columns.price_unit_ids[self._index],
+                              columns.price_scales[self._index])
+
+    @property
+    def price_unit(self) -> Union[str, None]:
+        return self._columns.units.name(self._columns.price_unit_ids[self._index])
+
+
+class TransactionView(Transaction):
+    """A transaction stored in the columns of a ColumnarLedger.
+    Views of the same transaction are equal (see `TransferView`)."""
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns: 'LedgerColumns', index: int):
+        self._columns = columns
+        self._index = index
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TransactionView):
+            return NotImplemented
+        return self._columns is other._columns and self._index == other._index
+
+    def __hash__(self) -> int:
+        return hash((id(self._columns), self._index))
+
+    @property
+    def date(self) -> str:
+        return self._columns.dates.names[self._columns.date_ids[self._index]]
+
+    @property
+    def effective_date(self) -> Union[str, None]:
+        return self._columns.dates.name(self._columns.effective_date_ids[self._index])
+
+    @property
+    def ordinal(self) -> int:
+        """The date of the transaction as a `date.toordinal()`,
+        or 0 if the date is not valid"""
+        return self._columns.ordinals[self._index]
+
+    @property
+    def description(self) -> str:
+        return self._columns.descriptions[self._index]
+
+    @property
+    def transfers(self) -> list[TransferView]:
+        start, end = self._columns.transfer_range(self._index)
+        return [TransferView(self._columns, i) for i in range(start, end)]
+
+
+class LedgerColumns:
+    """Transactions and transfers stored column by column, in
+    contiguous arrays. Strings that repeat (dates, accounts and
+    units) are interned and stored as ids.
+
+    Amounts, prices and costs are stored as integers, scaled by
+    the number of decimal places of their unit (see `unit_scales`).
+    When an amount with more decimal places than its unit has so
+    far is added, the unit's values are all scaled up to match.
+    The number of decimal places each amount and price was written
+    with is kept as well, so that they read back as written.
+
+    The transfers of transaction `i` are the ones between
+    `transfer_offsets[i]` and `transfer_offsets[i + 1]`."""
+    def __init__(self):
+        self.dates = Interner()
+        # ordinal of each interned date
+        self.date_ordinals = array('l')
+        self.accounts = Interner()
+        self.units = Interner()
+        # number of decimal places of each unit id
+        self.unit_scales = {}
+
+        # one entry per transaction
+        self.date_ids = array('l')
+        self.ordinals = array('l')
+        self.effective_date_ids = array('l')
+        # the ordinal of the date, if there is no effective date
+        self.effective_ordinals = array('l')
+        self.descriptions = []
+        self.transfer_offsets = array('q', [0])
+        # index of the transfer with no amount, if any
+        self.elided = array('q')
+
+        # one entry per transfer
+        self.account_ids = array('l')
+        self.amounts = array('q')
+        self.unit_ids = array('l')
+        # decimal places each amount and price was written with
+        self.scales = array('b')
+        self.statuses = array('b')
+        self.prices = array('q')
+        self.price_unit_ids = array('l')
+        self.price_scales = array('b')
+        # amount in the unit the transfer balances in: the price
+        # unit for priced transfers. 0 for transfers with no amount,
+        # which are given the unit of another transfer
+        self.costs = array('q')
+        self.cost_unit_ids = array('l')
+
+    def __len__(self) -> int:
+        return len(self.descriptions)
+
+    def _date_id(self, date_text: str) -> int:
+        date_id = self.dates.id(date_text)
+        if date_id == len(self.date_ordinals):
+            # first time this date is seen
+            try:
+                self.date_ordinals.append(parse_date(date_text).toordinal())
+            except ValueError:
+                self.date_ordinals.append(_NO_ORDINAL)
+        return date_id
+
+    def _rescale_unit(self, unit_id: int, scale: int) -> None:
+        factor = 10 ** (scale - self.unit_scales[unit_id])
+        for values, unit_ids in ((self.amounts, self.unit_ids),
+                                 (self.prices, self.price_unit_ids),
+                                 (self.costs, self.cost_unit_ids)):
+            for i in compress(range(len(values)), map(unit_id.__eq__, unit_ids)):
+                if values[i] != _NO_AMOUNT:
+                    values[i] *= factor
+        self.unit_scales[unit_id] = scale
+
+    def _scaled(self, amount: Union[Amount, float], unit_id: int) -> int:
+        """Returns `amount` as an integer scaled for `unit_id`"""
+        amount = Amount.coerce(amount)
+        scale = self.unit_scales.setdefault(unit_id, amount.scale)
+        if amount.scale > scale:
+            self._rescale_unit(unit_id, amount.scale)
+            scale = amount.scale
+        return amount.rescale(scale)
+
+    def amount(self, value: int, unit_id: int,
+               scale: Union[int, None] = None) -> Union[Amount, None]:
+        """Returns the Amount of a `value` stored for `unit_id`,
+        with `scale` decimal places if given. `scale` can not be
+        more than the unit's."""
+        if value == _NO_AMOUNT:
+            return None
+        unit_scale = self.unit_scales[unit_id]
+        if scale is None or scale == unit_scale:
+            return Amount(value, unit_scale)
+        return Amount(value // 10 ** (unit_scale - scale), scale)
+
+    def transfer_range(self, index: int) -> tuple[int, int]:
+        return self.transfer_offsets[index], self.transfer_offsets[index + 1]
+
+    def append(self, transaction: Transaction) -> int:
+        """Stores `transaction` and returns its index"""
+        date_id = self._date_id(transaction.date)
+        self.date_ids.append(date_id)
+        self.ordinals.append(self.date_ordinals[date_id])
+        if transaction.effective_date is None:
+            self.effective_date_ids.append(_NO_ID)
+            self.effective_ordinals.append(self.date_ordinals[date_id])
+        else:
+            effective_date_id = self._date_id(transaction.effective_date)
+            self.effective_date_ids.append(effective_date_id)
+            self.effective_ordinals.append(self.date_ordinals[effective_date_id])
+        self.descriptions.append(transaction.description)
+
+        elided = _NO_ELIDED
+        for transfer in transaction.transfers:
+            amount, price = transfer.amount, transfer.price
+            unit_id = self.units.id(transfer.unit)
+            price_unit_id = self.units.id(transfer.price_unit)
+            self.account_ids.append(self.accounts.id(transfer.account))
+            self.statuses.append(transfer.status.value)
+            # the unit ids go in first, so that rescaling a unit
+            # also rescales the values of this transfer
+            self.unit_ids.append(unit_id)
+            self.price_unit_ids.append(price_unit_id)
+            if price is not None:
+                price = Amount.coerce(price)
+            if amount is None:
+                elided = len(self.amounts) if elided == _NO_ELIDED else _MULTIPLE_ELIDED
+                self.amounts.append(_NO_AMOUNT)
+                self.scales.append(0)
+                self.cost_unit_ids.append(_NO_ID)
+                self.costs.append(0)
+            else:
+                amount = Amount.coerce(amount)
+                self.amounts.append(self._scaled(amount, unit_id))
+                self.scales.append(amount.scale)
+                if price is None:
+                    self.cost_unit_ids.append(unit_id)
+                    self.costs.append(self._scaled(amount, unit_id))
+                else:
+                    self.cost_unit_ids.append(price_unit_id)
+                    self.costs.append(self._scaled(amount * price, price_unit_id))
+            if price is None:
+                self.prices.append(_NO_AMOUNT)
+                self.price_scales.append(0)
+            else:
+                self.prices.append(self._scaled(price, price_unit_id))
+                self.price_scales.append(price.scale)
+        if elided >= 0 and len(self.costs) - 1 > self.transfer_offsets[-1]:
+            # so that the transfer with no amount does not count as
+            # another unit, it takes the unit of one of the others
+            other = self.transfer_offsets[-1] if elided != self.transfer_offsets[-1] else elided + 1
+            self.cost_unit_ids[elided] = self.cost_unit_ids[other]
+        self.elided.append(elided)
+        self.transfer_offsets.append(len(self.account_ids))
+        return len(self.descriptions) - 1
+
+    def auto_balance(self) -> list[tuple[int, str]]:
+        """Fills in the amounts left blank and checks that every
+        transaction balances, like `Ledger.auto_balance`, but on
+        all of the columns at once.
+
+        The costs of each transaction's transfers are added up
+        exactly, as integers, with one segmented sum over the
+        `costs` column. Whether they are
+        all in one unit is found from prefix sums of the unit ids
+        and their squares (a segment of n ids holds a single unit
+        exactly when n * sum(id^2) == sum(id)^2). Only transactions
+        left with a problem are looked at one by one.
+
+        Returns a (transaction index, error) tuple for each problem."""
+        offsets = self.transfer_offsets
+        starts, ends = offsets[:-1], offsets[1:]
+        sums = list(map(sum, map(self.costs.__getitem__, map(slice, starts, ends))))
+
+        unit_ids = self.cost_unit_ids
+        id_sums = array('q', [0])
+        id_sums.extend(accumulate(unit_ids))
+        square_sums = array('q', [0])
+        square_sums.extend(accumulate(map(mul, unit_ids, unit_ids)))
+        id_totals = list(map(sub, map(id_sums.__getitem__, ends), map(id_sums.__getitem__, starts)))
+        one_unit = list(map(eq,
+                            map(mul, map(sub, ends, starts),
+                                map(sub, map(square_sums.__getitem__, ends),
+                                    map(square_sums.__getitem__, starts))),
+                            map(mul, id_totals, id_totals)))
+
+        # fill in the amount of the transactions with one transfer
+        # with no amount, whose other transfers are in a single unit
+        to_fill = list(map(and_, one_unit, map(_NO_ELIDED.__lt__, self.elided)))
+        for index, elided, total, first in zip(compress(range(len(sums)), to_fill),
+                                               compress(self.elided, to_fill),
+                                               compress(sums, to_fill),
+                                               compress(starts, to_fill)):
+            unit_id = unit_ids[first]
+            if unit_id == _NO_ID:
+                # the transfer with no amount is the only one
+                continue
+            self.amounts[elided] = self.costs[elided] = -total
+            self.unit_ids[elided] = unit_id
+            # as many decimal places as the most precise of the
+            # amounts it balances, as `Transaction.fill_amount` gives
+            self.scales[elided] = max(self.scales[i] + self.price_scales[i]
+                                      for i in range(first, ends[index])
+                                      if i != elided)
+            self.elided[index] = _NO_ELIDED
+            sums[index] = 0
+
+        unbalanced = compress(range(len(sums)), sums)
+        not_one_unit = compress(range(len(sums)), map(not_, one_unit))
+        multiple_elided = compress(range(len(sums)), map(_MULTIPLE_ELIDED.__eq__, self.elided))
+
+        problems = []
+        for index in sorted(set(unbalanced).union(not_one_unit, multiple_elided)):
+            for error in TransactionView(self, index).balance_errors():
+                problems.append((index, error))
+        return problems
+
+    def totals(self, transfer_indexes: Union[Iterable[int], None] = None) -> dict[str, Amount]:
+        """Returns the total amount of each unit, over the transfers
+        at `transfer_indexes` or all of them. Transfers with no
+        amount are left out."""
+        amounts, unit_ids = self.amounts, self.unit_ids
+        if transfer_indexes is not None:
+            transfer_indexes = list(transfer_indexes)
+            amounts = array('q', map(amounts.__getitem__, transfer_indexes))
+            unit_ids = array('l', map(unit_ids.__getitem__, transfer_indexes))
+        if _NO_AMOUNT in amounts:
+            keep = list(map(_NO_AMOUNT.__ne__, amounts))
+            amounts = array('q', compress(amounts, keep))
+            unit_ids = array('l', compress(unit_ids, keep))
+        return {self.units.name(unit_id): Amount(total, self.unit_scales[unit_id])
+                for unit_id, total in sum_by_unit(amounts, unit_ids).items()}
+
+    def transaction_of(self, transfer_index: int) -> int:
+        """Returns the index of the transaction that
+        the transfer at `transfer_index` belongs to"""
+        return bisect_right(self.transfer_offsets, transfer_index) - 1
+
+
+class TransactionColumn:
+    """Sequence of views over the transactions of a ColumnarLedger,
+    used in place of the list in `Ledger.transactions`"""
+    def __init__(self, columns: LedgerColumns):
+        self._columns = columns
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[TransactionView, list[TransactionView]]:
+        if isinstance(index, slice):
+            return [TransactionView(self._columns, i)
+                    for i in range(*index.indices(len(self._columns)))]
+        if index < 0:
+            index += len(self._columns)
+        if not 0 <= index < len(self._columns):
+            raise IndexError('transaction index out of range')
+        return TransactionView(self._columns, index)
+
+    def __iter__(self) -> Iterator[TransactionView]:
+        columns = self._columns
+        for i in range(len(columns)):
+            yield TransactionView(columns, i)
+
+
+class ColumnarLedger(Ledger):
+    """Ledger that stores its transactions in columns (see
+    `LedgerColumns`) rather than as Transaction and Transfer
+    objects. This takes a fraction of the memory for large
+    ledgers.
+
+    `transactions` holds lightweight views with the same API
+    as Transaction and Transfer, which read from the columns.
+    Transactions can not be changed once they are added."""
+    def __init__(self):
+        super().__init__()
+        self.columns = LedgerColumns()
+        self.transactions = TransactionColumn(self.columns)
+        # account tree node of each interned account id
+        self._account_nodes = []
+
+    def add_transaction(self, transaction):
+        self._check_not_frozen()
+        index = self.columns.append(transaction)
+
+        self._trigger_added([TransactionView(self.columns, index)])
+
+    def add_transactions(self, transactions: Iterable[Transaction],
+                         chunk_size: int = ADD_TRANSACTIONS_CHUNK_SIZE) -> None:
+        self._check_not_frozen()
+        columns = self.columns
+        transactions = iter(transactions)
+        while True:
+            start = len(columns)
+            for transaction in islice(transactions, chunk_size):
+                columns.append(transaction)
+            if len(columns) == start:
+                break
+            self._trigger_added([TransactionView(columns, index)
+                                 for index in range(start, len(columns))])
+
+    def fork(self) -> 'ColumnarLedger':
+        """Returns a copy of the ledger, which can be added to
+        without changing this one. Unlike with `Ledger.fork`,
+        the columns are copied rather than shared."""
+        ledger = ColumnarLedger()
+        ledger.add_transactions(self.transactions)
+        if self.accounts is not None:
+            ledger.index_accounts()
+        if self.dates is not None:
+            ledger.index_dates()
+        if self.amounts is not None:
+            ledger.index_amounts()
+        return ledger
+
+    def _new_account_tree(self) -> AccountTree:
+        # the account tree keeps the index of each transfer
+        # in the columns, rather than a view of it
+        return AccountTree(lambda: array('q'))
+
+    def _index_accounts(self, transactions: list[TransactionView]) -> None:
+        columns = self.columns
+        account_nodes = self._account_nodes
+        while len(account_nodes) < len(columns.accounts):
+            account_nodes.append(self.accounts.node(columns.accounts.names[len(account_nodes)]))
+
+        account_ids = columns.account_ids
+        for transaction in transactions:
+            start, end = columns.transfer_range(transaction._index)
+            for i in range(start, end):
+                account_nodes[account_ids[i]].postings.append(i)
+
+    def _index_dates(self, transactions: list[TransactionView]) -> None:
+        # the date indexes keep the index of each transaction
+        ordinals = self.columns.ordinals
+        effective_ordinals = self.columns.effective_ordinals
+        for transaction in transactions:
+            index = transaction._index
+            ordinal = ordinals[index]
+            effective_ordinal = effective_ordinals[index]
+            if ordinal == _NO_ORDINAL or effective_ordinal == _NO_ORDINAL:
+                continue
+            self.dates.add(ordinal, index)
+            self.effective_dates.add(effective_ordinal, index)
+
+    def _index_amounts(self, transactions: Iterable[TransactionView]) -> None:
+        # the amount index keeps the index of each transfer
+        columns = self.columns
+        amounts = self.amounts
+        for transaction in transactions:
+            start, end = columns.transfer_range(transaction._index)
+            for i in range(start, end):
+                amount = columns.amount(columns.amounts[i], columns.unit_ids[i])
+                if amount is not None:
+                    amounts.add(float(amount), i)
+
+    def postings_between_amounts(self, low: Union[Amount, float, None] = None,
+                                 high: Union[Amount, float, None] = None
+                                 ) -> list[tuple[TransactionView, TransferView]]:
+        columns = self.columns
+        return [(TransactionView(columns, columns.transaction_of(i)), TransferView(columns, i))
+                for i in super().postings_between_amounts(low, high)]
+
+    def transactions_between(self, start: Union[date, None] = None,
+                             end: Union[date, None] = None,
+                             effective: bool = False) -> list[TransactionView]:
+        columns = self.columns
+        return [TransactionView(columns, index)
+                for index in super().transactions_between(start, end, effective)]
+
+    def auto_balance(self) -> list[tuple[TransactionView, str]]:
+        return [(TransactionView(self.columns, index), error)
+                for index, error in self.columns.auto_balance()]
+
+    def totals(self, account: Union[str, None] = None,
+               include_subaccounts: bool = True) -> dict[str, Amount]:
+        if account is None:
+            return self.columns.totals()
+        return self.columns.totals(self.index_accounts().postings(account, include_subaccounts))
+
+    def postings(self, account: str,
+                 include_subaccounts: bool = True) -> list[tuple[TransactionView, TransferView]]:
+        columns = self.columns
+        return [(TransactionView(columns, columns.transaction_of(i)), TransferView(columns, i))
+                for i in self.index_accounts().postings(account, include_subaccounts)]
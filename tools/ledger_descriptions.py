@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+import heapq
+import math
+import re
+from typing import Union
+
+from ledger_reconcile import BankTransaction, PostingIndex, cents
+
+
+# words of two letters or more, leaving out numbers (e.g. store numbers)
+_WORD_RE = re.compile(r'[^\W\d_]{2,}')
+
+# how much each part of a candidate's score counts (see `CandidateRanker`)
+AMOUNT_WEIGHT = 1.0
+DATE_WEIGHT = 0.5
+TEXT_WEIGHT = 1.0
+
+# descriptions looked at for each search of the description index
+SEARCH_LIMIT = 20
+
+# words in more descriptions than this (e.g. "pos" or "purchase") only
+# add to the scores of descriptions a search found through rarer words
+MAX_WORD_DESCRIPTIONS = 1000
+
+
+def tokenize(description: str) -> list[str]:
+    """Returns the lower cased words of `description`"""
+    return _WORD_RE.findall(description.casefold())
+
+
+class DescriptionIndex:
+    """TF-IDF vectors of the descriptions of the postings in a
+    PostingIndex, with an inverted index from each word to the
+    descriptions it appears in.
+
+    Each distinct description is only tokenized and stored once,
+    however many transactions share it. Looking a description up
+    only visits the descriptions that share a word with it that
+    few descriptions have."""
+    def __init__(self, postings: PostingIndex):
+        self.postings = postings
+        # word -> word id
+        self.words = {}
+        # description id -> {word id: weight}, of unit length
+        self.vectors = []
+        # description id -> positions in `postings`, sorted by date
+        self.positions = []
+        # word id -> (description id, weight) of each description with the word
+        self.inverted = []
+        # position in `postings` -> description id
+        self.description_ids = array('l')
+        self.idf = []
+
+        ids = {}
+        for transaction in postings.transactions:
+            description_id = ids.get(transaction.description)
+            if description_id is None:
+                description_id = ids[transaction.description] = len(ids)
+                self.positions.append([])
+            self.positions[description_id].append(len(self.description_ids))
+            self.description_ids.append(description_id)
+
+        # how often each word appears in each description, and
+        # how many postings have a description with the word
+        counts = []
+        frequencies = []
+        for description in ids:
+            word_counts = {}
+            for word, count in Counter(tokenize(description)).items():
+                word_id = self.words.get(word)
+                if word_id is None:
+                    word_id = self.words[word] = len(self.words)
+                    frequencies.append(0)
+                word_counts[word_id] = count
+            counts.append(word_counts)
+        for description_id, word_counts in enumerate(counts):
+            postings_count = len(self.positions[description_id])
+            for word_id in word_counts:
+                frequencies[word_id] += postings_count
+
+        total = len(postings)
+        self.idf = [math.log((total + 1) / (frequency + 1)) + 1 for frequency in frequencies]
+        self.inverted = [[] for _ in frequencies]
+        for description_id, word_counts in enumerate(counts):
+            vector = self._weigh(word_counts)
+            self.vectors.append(vector)
+            for word_id, weight in vector.items():
+                self.inverted[word_id].append((description_id, weight))
+
+        ordinals = postings.ordinals
+        for positions in self.positions:
+            positions.sort(key=ordinals.__getitem__)
+
+    def _weigh(self, word_counts: dict[int, int]) -> dict[int, float]:
+        idf = self.idf
+        vector = {word_id: (1 + math.log(count)) * idf[word_id]
+                  for word_id, count in word_counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if norm:
+            for word_id in vector:
+                vector[word_id] /= norm
+        return vector
+
+    def vector(self, description: str) -> dict[int, float]:
+        """Returns the TF-IDF vector of `description`, leaving
+        out the words no indexed description has"""
+        words = self.words
+        word_ids = (words.get(word) for word in tokenize(description))
+        return self._weigh(Counter(word_id for word_id in word_ids if word_id is not None))
+
+    def similarity(self, vector: dict[int, float], position: int) -> float:
+        """Returns the cosine similarity of `vector` and the
+        description of the posting at `position`"""
+        description_vector = self.vectors[self.description_ids[position]]
+        if len(description_vector) < len(vector):
+            vector, description_vector = description_vector, vector
+        return sum(weight * description_vector.get(word_id, 0.0)
+                   for word_id, weight in vector.items())
+
+    def search(self, vector: dict[int, float], ordinal: Union[int, None] = None,
+               days: Union[int, None] = None,
+               limit: int = SEARCH_LIMIT) -> list[tuple[float, int]]:
+        """Returns the (similarity, position) of the postings whose
+        descriptions are most similar to `vector`, most similar first.
+        If `ordinal` and `days` are given, only postings at most `days`
+        away from `ordinal` are returned. Postings are returned for
+        at most `limit` descriptions."""
+        inverted = self.inverted
+        vectors = self.vectors
+        scores = {}
+        # rarer words first, so common ones only add to their scores
+        for word_id, weight in sorted(vector.items(), key=lambda item: len(inverted[item[0]])):
+            if len(inverted[word_id]) <= MAX_WORD_DESCRIPTIONS:
+                for description_id, description_weight in inverted[word_id]:
+                    scores[description_id] = (scores.get(description_id, 0.0)
+                                              + weight * description_weight)
+            else:
+                for description_id in scores:
+                    scores[description_id] += weight * vectors[description_id].get(word_id, 0.0)
+
+        ordinals = self.postings.ordinals
+        found = []
+        descriptions = 0
+        for description_id, score in sorted(scores.items(), key=lambda item: -item[1]):
+            positions = self.positions[description_id]
+            if ordinal is not None and days is not None:
+                positions = positions[bisect_left(positions, ordinal - days, key=ordinals.__getitem__):
+                                      bisect_right(positions, ordinal + days,
+                                                   key=ordinals.__getitem__)]
+            if positions:
+                found.extend((score, position) for position in positions)
+                descriptions += 1
+                if descriptions == limit:
+                    break
+        return found
+
+
+class CandidateRanker:
+    """Ranks the postings a bank transaction could be, by adding up
+
+    - `amount_weight` if the amounts are the same (see `cents`),
+    - `date_weight` scaled by how close the dates are, from 1 on the
+      same day down to 0 more than `days` days apart, and
+    - `text_weight` scaled by how similar the descriptions are.
+
+    Only postings of the same amount within `days` days, and postings
+    the description index finds, are scored, so telling apart the
+    many purchases that share an amount like $5.00 stays cheap."""
+    def __init__(self, postings: PostingIndex, days: int = 3,
+                 amount_weight: float = AMOUNT_WEIGHT, date_weight: float = DATE_WEIGHT,
+                 text_weight: float = TEXT_WEIGHT):
+        self.postings = postings
+        self.descriptions = DescriptionIndex(postings)
+        self.days = days
+        self.amount_weight = amount_weight
+        self.date_weight = date_weight
+        self.text_weight = text_weight
+        # bank statements repeat descriptions
+        self._vectors = {}
+
+    def vector(self, bank_transaction: BankTransaction) -> dict[int, float]:
+        description = bank_transaction.description
+        vector = self._vectors.get(description)
+        if vector is None:
+            vector = self._vectors[description] = self.descriptions.vector(description)
+        return vector
+
+    def score(self, bank_transaction: BankTransaction, position: int,
+              similarity: Union[float, None] = None) -> float:
+        """Returns the score of the posting at `position`. Pass
+        `similarity` if it is known already."""
+        postings = self.postings
+        score = 0.0
+        if cents(bank_transaction.amount) == cents(postings.amounts[position]):
+            score += self.amount_weight
+        if bank_transaction.date is not None:
+            days = abs(postings.ordinals[position] - bank_transaction.date.toordinal())
+            if days <= self.days:
+                score += self.date_weight * (1 - days / (self.days + 1))
+        if similarity is None:
+            similarity = self.descriptions.similarity(self.vector(bank_transaction), position)
+        return score + self.text_weight * similarity
+
+    def best(self, bank_transaction: BankTransaction, positions: list[int]) -> Union[int, None]:
+        """Returns the highest scoring of `positions`, the earliest
+        one if several score the same"""
+        best = None
+        best_score = None
+        for position in positions:
+            score = self.score(bank_transaction, position)
+            if best_score is None or score > best_score:
+                best, best_score = position, score
+        return best
+
+    def rank(self, bank_transaction: BankTransaction, limit: int = 5,
+             used: Union[bytearray, None] = None) -> list[tuple[float, int]]:
+        """Returns the (score, position) of the `limit` highest scoring
+        postings, highest first, leaving out positions set in `used`"""
+        postings = self.postings
+        ordinal = None if bank_transaction.date is None else bank_transaction.date.toordinal()
+        candidates = {}
+        positions = postings.buckets.get(cents(bank_transaction.amount), [])
+        if ordinal is not None:
+            ordinals = postings.ordinals
+            positions = positions[bisect_left(positions, ordinal - self.days,
+                                              key=ordinals.__getitem__):
+                                  bisect_right(positions, ordinal + self.days,
+                                               key=ordinals.__getitem__)]
+        for position in positions:
+            candidates[position] = None
+        if bank_transaction.description:
+            for similarity, position in self.descriptions.search(self.vector(bank_transaction),
+                                                                 ordinal, self.days):
+                candidates[position] = similarity
+        scored = [(self.score(bank_transaction, position, similarity), position)
+                  for position, similarity in candidates.items()
+                  if used is None or not used[position]]
+        return heapq.nlargest(limit, scored, key=lambda item: (item[0], -item[1]))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+from array import array
+from collections import deque
+import re
+
+from ledger import Ledger, LedgerListenerType, LedgerPluginManager, Transaction, date_ordinal
+from ledger_money import Amount
+
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# stored in place of the ordinal of a date that does not parse
+_NO_ORDINAL = 0
+
+
+def normalize_description(description: str) -> str:
+    """Lower cases `description` and collapses runs of whitespace,
+    so descriptions that only differ in those are the same"""
+    return _WHITESPACE_RE.sub(' ', description).strip().casefold()
+
+
+def fingerprint(transaction: Transaction) -> tuple:
+    """Returns what a transaction and a copy of it have in common:
+    its date, normalized description and sorted postings.
+
+    Dates and amounts are compared by value (2022/7/1 is 2022/07/01
+    and $5 is $5.00), and a transfer with no amount counts with the
+    amount that balances the transaction."""
+    return _fingerprint(transaction, list(transaction.posted_amounts()))
+
+
+def _fingerprint(transaction: Transaction, postings: list[tuple]) -> tuple:
+    try:
+        day = date_ordinal(transaction.date)
+    except ValueError:
+        day = transaction.date
+    postings = sorted((account, unit or '', str(amount.normalize()))
+                      for account, unit, amount in postings)
+    return day, normalize_description(transaction.description), tuple(postings)
+
+
+def _sizes(postings: list[tuple]) -> dict[str, Amount]:
+    """Returns how much of each unit the postings of a transaction
+    move: the total of their positive or of their negative amounts,
+    whichever is larger"""
+    positive = {}
+    negative = {}
+    for _, unit, amount in postings:
+        # the sign of an amount is the sign of its scaled value
+        if amount.value > 0:
+            positive.setdefault(unit, []).append(amount)
+        elif amount.value < 0:
+            negative.setdefault(unit, []).append(-amount)
+    sizes = {unit: amounts[0] if len(amounts) == 1 else sum(amounts)
+             for unit, amounts in positive.items()}
+    for unit, amounts in negative.items():
+        total = amounts[0] if len(amounts) == 1 else sum(amounts)
+        if unit not in sizes or total > sizes[unit]:
+            sizes[unit] = total
+    return sizes
+
+
+def _format_transaction(transaction: Transaction) -> str:
+    sizes = ', '.join(f'{amount} {unit}'
+                      for unit, amount in _sizes(list(transaction.posted_amounts())).items())
+    return f'{transaction.date} {transaction.description} ({sizes})'
+
+
+class DuplicateDetector:
+    """Finds transactions that were entered more than once.
+
+    Exact duplicates have the same fingerprint (see `fingerprint`).
+    Each transaction is indexed by the hash of its fingerprint, so
+    fingerprints are only compared when their hashes are equal.
+
+    Probable duplicates move the same amount of a unit within
+    `days` days of each other, but differ otherwise (e.g. in their
+    description or accounts). Transactions are indexed by unit and
+    amount, and only transactions with the same unit and amount are
+    compared, after sorting them by date. Finding duplicates takes
+    roughly linear time, unless many transactions share an amount
+    and are close together.
+
+    Register the detector on a ledger's plugin manager (see
+    `register`) to index transactions as they are added."""
+    def __init__(self, days: int = 3):
+        self.days = days
+        # transactions in the order they were added, which
+        # the indexes refer to by their position
+        self.transactions = []
+        self.ordinals = array('l')
+        self.hashes = array('q')
+        # fingerprint hash -> positions of transactions
+        self.fingerprints = {}
+        # (unit, amount) -> positions of dated transactions
+        self.amounts = {}
+        # lazy transactions, only added once duplicates are looked for
+        self._pending = deque()
+        # plugin managers the detector is a deferred listener of
+        self._plugin_mgrs = []
+
+    def register(self, plugin_mgr: LedgerPluginManager, deferred: bool = False) -> None:
+        """Registers the detector for transactions added to a ledger.
+
+        If `deferred` is set, transactions are only added once the
+        plugin manager runs its deferred listeners, which looking
+        for duplicates does first."""
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS, self.add_transactions,
+                                     deferred=deferred)
+        if deferred:
+            self._plugin_mgrs.append(plugin_mgr)
+
+    @classmethod
+    def for_ledger(cls, ledger: Ledger, days: int = 3) -> 'DuplicateDetector':
+        """Creates a detector holding the transactions already in
+        `ledger` and registers it for the ones added later"""
+        detector = cls(days)
+        detector.add_transactions(ledger.transactions)
+        detector.register(ledger.get_plugin_manager())
+        return detector
+
+    def add_transactions(self, transactions: list[Transaction]) -> None:
+        for transaction in transactions:
+            self.add_transaction(transaction)
+
+    def add_transaction(self, transaction: Transaction) -> None:
+        is_parsed = getattr(transaction, 'is_parsed', None)
+        if is_parsed is not None and not is_parsed():
+            # avoid parsing lazy transactions during an import
+            self._pending.append(transaction)
+            return
+        self._add(transaction)
+
+    def _add(self, transaction: Transaction) -> None:
+        position = len(self.transactions)
+        self.transactions.append(transaction)
+        try:
+            ordinal = date_ordinal(transaction.date)
+        except ValueError:
+            ordinal = _NO_ORDINAL
+        self.ordinals.append(ordinal)
+
+        postings = list(transaction.posted_amounts())
+        transaction_hash = hash(_fingerprint(transaction, postings))
+        self.hashes.append(transaction_hash)
+        self.fingerprints.setdefault(transaction_hash, []).append(position)
+        if ordinal != _NO_ORDINAL:
+            for key in _sizes(postings).items():
+                self.amounts.setdefault(key, []).append(position)
+
+    def _add_pending(self) -> None:
+        for plugin_mgr in self._plugin_mgrs:
+            plugin_mgr.run_deferred()
+        pending = self._pending
+        while pending:
+            self._add(pending.popleft())
+
+    def _same_fingerprint(self, first: int, second: int) -> bool:
+        if self.hashes[first] != self.hashes[second]:
+            return False
+        return fingerprint(self.transactions[first]) == fingerprint(self.transactions[second])
+
+    def exact_duplicates(self) -> list[list[Transaction]]:
+        """Returns each group of transactions with the same
+        fingerprint, in the order they were added"""
+        self._add_pending()
+        groups = []
+        for positions in self.fingerprints.values():
+            if len(positions) < 2:
+                continue
+            # different fingerprints can have the same hash
+            by_fingerprint = {}
+            for position in positions:
+                by_fingerprint.setdefault(fingerprint(self.transactions[position]),
+                                          []).append(position)
+            groups.extend(group for group in by_fingerprint.values() if len(group) > 1)
+        groups.sort()
+        return [[self.transactions[position] for position in group] for group in groups]
+
+    def probable_duplicates(self) -> list[tuple[Transaction, Transaction]]:
+        """Returns each pair of transactions that move the same amount
+        of a unit within `days` days of each other, but are not exact
+        duplicates, in the order they were added"""
+        self._add_pending()
+        ordinals = self.ordinals
+        days = self.days
+        pairs = set()
+        for positions in self.amounts.values():
+            if len(positions) < 2:
+                continue
+            positions = sorted(positions, key=ordinals.__getitem__)
+            for i, first in enumerate(positions):
+                for j in range(i + 1, len(positions)):
+                    second = positions[j]
+                    if ordinals[second] - ordinals[first] > days:
+                        break
+                    if not self._same_fingerprint(first, second):
+                        pairs.add((min(first, second), max(first, second)))
+        return [(self.transactions[first], self.transactions[second])
+                for first, second in sorted(pairs)]
+
+    def format(self) -> str:
+        """Describes the duplicates found, for the command line"""
+        lines = []
+        exact = self.exact_duplicates()
+        for group in exact:
+            lines.append('Duplicate transactions:')
+            lines.extend(f'    {_format_transaction(transaction)}' for transaction in group)
+        probable = self.probable_duplicates()
+        for first, second in probable:
+            lines.append(f'Probable duplicates (same amount within {self.days} days):')
+            lines.append(f'    {_format_transaction(first)}')
+            lines.append(f'    {_format_transaction(second)}')
+        lines.append(f'Checked {len(self.transactions)} transactions: {len(exact)} groups of '
+                     f'duplicates, {len(probable)} probable duplicates found')
+        return '\n'.join(lines)
+
+
+def find_duplicates(ledger: Ledger, days: int = 3) -> tuple[list[list[Transaction]],
+                                                            list[tuple[Transaction, Transaction]]]:
+    """Returns the exact and probable duplicates in `ledger`
+    (see `DuplicateDetector`)"""
+    detector = DuplicateDetector(days)
+    detector.add_transactions(ledger.transactions)
+    return detector.exact_duplicates(), detector.probable_duplicates()
@@ -1,10 +1,22 @@
 import argparse
+import hashlib
 import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
 import re
 import sys
-from typing import Union
+import time
+from typing import Iterable, Iterator, TextIO, Union
 
-from ledger import Ledger, Transaction, Transfer, TransferStatus
+import ledger_cache
+from ledger_columnar import ColumnarLedger
+from ledger_duplicates import DuplicateDetector
+from ledger import ADD_TRANSACTIONS_CHUNK_SIZE, Ledger, Transaction, Transfer, \
+    TransferStatus, parse_date
+from ledger_money import Amount
 
 
 logger = logging.getLogger(__name__)
@@ -110,7 +122,7 @@ def _strip_comments(lines: list[str]) -> list[str]:
     return list(lines_without_inline_comments)
 
 
-def _parse_raw_amount(raw_amount: str) -> tuple[float, str]:
+def _parse_raw_amount(raw_amount: str) -> tuple[Amount, str]:
     """Returns amount and unit as tuple.
 
     Supports dollars, euros, and custom units.
@@ -135,14 +147,14 @@ def _parse_raw_amount(raw_amount: str) -> tuple[float, str]:
         res = re.match(r'^([$€])(-?[0-9,.]*)$', raw_amount)
         if res is not None:
             unit = res.group(1)
-            amount = float(res.group(2).replace(',', ''))
+            amount = Amount.parse(res.group(2))
             return amount, unit
 
         # does this use a custom unit?
         res = re.match(r'^(-?[0-9,.]*) (\S+)$', raw_amount)
         if res is not None:
             unit = res.group(2)
-            amount = float(res.group(1).replace(',', ''))  # might throw an exception
+            amount = Amount.parse(res.group(1))  # might throw an exception
             return amount, unit
     except ValueError:
         raise MalformedTransfer(f'Unable to parse decimal amount given in {raw_amount}')
@@ -150,144 +162,1152 @@ def _parse_raw_amount(raw_amount: str) -> tuple[float, str]:
     raise MalformedTransfer(f'Unable to parse amount string: {raw_amount}')
 
 
-def _parse_status_symbol(status_text):
-    status_text = status_text.strip()
-    if status_text == '':
-        return TransferStatus.DEFAULT
-    elif status_text == '!':
-        return TransferStatus.PENDING
-    elif status_text == '*':
-        return TransferStatus.CLEARED
+# Posting lines are split into their parts by a single pass
+# of one pattern:
+# - must start with four (or more spaces)
+# - optional status symbol (* or !) followed by a space
+# - account can be a string without spaces
+#   or can have single spaces spread through name
+# - after account name must be two (or more) spaces,
+#   unless the amount was left blank
+# - amount is either
+#   - a dollar or euro symbol followed by some amount
+#     (anything left over after the amount means the
+#     amount is malformed)
+#   - or an amount and a custom unit (e.g. 5 apples),
+#     optionally followed by a price (e.g. 5 FOO @ $20.00)
+_POSTING_RE = re.compile(r"""
+    \s{4,}
+    (?:(?P<status>[*!])\ )?
+    (?P<account>(?:\S+\ )*\S+)
+    (?:\s{2,}(?:
+        (?P<symbol>[$€])(?P<cash>-?[0-9,.]*)(?P<junk>\S*)
+        |(?P<quantity>-?[0-9.]+)\ (?P<unit>\S+)(?:\ @\ (?P<price>\S+))?
+    ))?
+    \s*$""", re.VERBOSE)
+
+_STATUS_SYMBOLS = {None: TransferStatus.DEFAULT,
+                   '!': TransferStatus.PENDING,
+                   '*': TransferStatus.CLEARED}
+
+
+def _lex_posting(line: str) -> tuple[TransferStatus, str,
+                                      Union[Amount, None], Union[str, None],
+                                      Union[Amount, None], Union[str, None]]:
+    """Splits a posting line into its status, account, amount,
+    unit, price and price unit.
+
+    Amount and unit are None if the amount was left blank.
+    Price and price unit are None if no price was given, or
+    if the price is not an amount with a unit.
+
+    Raises MalformedTransaction if `line` is not a posting and
+    MalformedTransfer if the posting's amount can not be parsed."""
+    res = _POSTING_RE.match(line)
+    if res is None:
+        raise MalformedTransaction(f'Unable to parse transfer: {line}')
+
+    status, account, symbol, cash, junk, quantity, unit, price = res.groups()
+    status = _STATUS_SYMBOLS[status]
+    # the same few accounts appear on most transfers
+    account = sys.intern(account)
+
+    if symbol is not None:
+        if junk:
+            raise MalformedTransfer(f'Unable to parse amount string: {symbol}{cash}{junk}')
+        unit = symbol
+        number = cash
+    elif unit is not None:
+        number = quantity
     else:
-        raise MalformedTransfer(f'Unable to parse status from: {status_text}')
+        # amount was left blank
+        return status, account, None, None, None, None
+
+    try:
+        amount = Amount.parse(number)
+    except ValueError:
+        raise MalformedTransfer(f'Unable to parse decimal amount given in {line.strip()}')
+
+    price_unit = None
+    if price is not None:
+        try:
+            price, price_unit = _parse_raw_amount(price)
+        except MalformedTransfer:
+            # prices were ignored before they were parsed, so one
+            # without a unit (e.g. 5 FOO @ 3) still leaves a posting
+            price = None
+
+    return status, account, amount, unit, price, price_unit
+
 
+_HEADER_RE = re.compile(r'(\d{4}/\d{1,2}/\d{1,2})(?:=(\d{4}/\d{1,2}/\d{1,2}))?\s+(.*)\s*$')
 
-def _form_transaction(text: list[str]):
-    # parse date
-    # TODO: Currently ignores setting effective date
-    #       e.g. 2022/02/25=2022/03/07
-    date_text = text[0].split()[0]
+
+def _parse_header(header: str) -> tuple[str, Union[str, None], str]:
+    """Returns the date, effective date and description found in
+    the first line of a transaction. The effective date is None
+    unless one is given (e.g. 2022/02/25=2022/03/07)."""
+    res = _HEADER_RE.match(header)
+    if res is not None:
+        return res.groups()
+
+    # work out which part of the header is malformed
+    date_text = header.split()[0]
     res = re.match(r'^(\d{4}/\d{1,2}/\d{1,2})(=\d{4}/\d{1,2}/\d{1,2})?', date_text)
     if not res:
-        raise MalformedTransaction(f'Expected date, found {text[0]}')
-    date = res.group(1)
+        raise MalformedTransaction(f'Expected date, found {header}')
+    raise MalformedTransaction(f'Could not find description, found: {header}')
 
-    # parse description
-    res = re.match(r'^\d{4}/\d{1,2}/\d{1,2}(=\d{4}/\d{1,2}/\d{1,2})?\s+(.*)\s*$', text[0])
-    if not res:
-        raise MalformedTransaction(f'Could not find description, found: {text[0]}')
-    description = res.group(2)
 
-    # parse transfers
+def _form_transfers(text: list[str]) -> list[Transfer]:
+    """Parses the transfers of a transaction, given all of
+    the transaction's lines (stripped of comments)"""
     if len(text) < 2:
         raise MalformedTransaction(f'Failed to find any transfers for {text[0]}')
 
     transfers = []
     found_empty_amount = False  # at most one transfer line can have an unspecified amount
     for line in text[1:]:
-        # for cash transfers (currently only supports dollars, euros)
-        # - must start with four (or more spaces)
-        # - account can be a string without spaces
-        #   or can have single spaces spread through name
-        # - after account name must be two (or more) spaces
-        # - amount must start with dollar or euro symbol
-        # - and then have some amount
-        res = re.match(r'^\s{4}\s*(([*!] )?)((\S+ )*\S+)\s{2}\s*([$€]\S+)$', line)
-        if res:
-            status = _parse_status_symbol(res.group(1))
-            account = res.group(3)
-            amount, unit = _parse_raw_amount(res.group(5))
-            transfer = Transfer(account=account,
-                                amount=amount,
-                                unit=unit,
-                                status=status)
-            transfers.append(transfer)
-            continue
+        status, account, amount, unit, price, price_unit = _lex_posting(line)
+
+        if amount is None:
+            if found_empty_amount:
+                raise MalformedTransaction(f'Found multiple transfers with no amount specified for {text[0]}')
+            found_empty_amount = True
+
+        transfer = Transfer(account=account,
+                            amount=amount,
+                            unit=unit,
+                            status=status,
+                            price=price,
+                            price_unit=price_unit)
+        transfers.append(transfer)
+
+    return transfers
+
+
+def _form_transaction(text: list[str], stats: Union['ImportStats', None] = None):
+    """Forms a transaction from the lines of a block, stripped
+    of comments. If `stats` is given, the time spent parsing
+    the header and the transfers is added to it."""
+    if stats is None:
+        date, effective_date, description = _parse_header(text[0])
+        transfers = _form_transfers(text)
+    else:
+        start = time.perf_counter()
+        date, effective_date, description = _parse_header(text[0])
+        parsed_header = time.perf_counter()
+        transfers = _form_transfers(text)
+        stats.times['header'] += parsed_header - start
+        stats.times['postings'] += time.perf_counter() - parsed_header
+    return Transaction(date=date, description=description, transfers=transfers,
+                       effective_date=effective_date)
+
+
+class LazyTransaction(Transaction):
+    """Transaction that keeps the raw text of its block and
+    only parses its transfers the first time they are accessed.
+
+    Once parsed, the transfers are kept and the raw text
+    is dropped. If the transfers are malformed, every access
+    raises MalformedTransaction or MalformedTransfer
+    (see `validate_transfers`)."""
+    __slots__ = ('_text', '_transfers')
+
+    def __init__(self, date: str, description: str, text: str,
+                 effective_date: Union[str, None] = None):
+        self.date = date
+        self.description = description
+        self.effective_date = effective_date
+        self._text = text
+        self._transfers = None
+
+    @property
+    def transfers(self) -> list[Transfer]:
+        if self._transfers is None:
+            self._transfers = _form_transfers(_strip_comments(self._text.split('\n')))
+            self._text = None
+        return self._transfers
+
+    @transfers.setter
+    def transfers(self, transfers: list[Transfer]):
+        self._transfers = transfers
+        self._text = None
+
+    def is_parsed(self) -> bool:
+        return self._transfers is not None
+
+    def copy(self) -> 'LazyTransaction':
+        """Returns a copy of the transaction. If its transfers
+        have not been parsed, the copy parses them on its own"""
+        transaction = LazyTransaction(self.date, self.description, self._text,
+                                      self.effective_date)
+        if self._transfers is not None:
+            transaction.transfers = [transfer.copy() for transfer in self._transfers]
+        return transaction
+
+    # pickled for worker processes without going through
+    # `transfers`, which would parse them
+    def __getstate__(self):
+        return self.date, self.description, self.effective_date, self._text, self._transfers
+
+    def __setstate__(self, state):
+        self.date, self.description, self.effective_date, self._text, self._transfers = state
+
+
+def validate_transfers(transactions: Iterable[Transaction]) -> list[tuple[Transaction, Exception]]:
+    """Parses the transfers of any lazy transactions in
+    `transactions` that have not been parsed yet.
+
+    Returns a (transaction, error) tuple for each
+    transaction whose transfers are malformed."""
+    errors = []
+    for transaction in transactions:
+        try:
+            transaction.transfers
+        except (MalformedTransaction, MalformedTransfer) as e:
+            errors.append((transaction, e))
+    return errors
+
+
+_COMMENT_LINE_RE = re.compile(r'^\s*;')
+
+
+def _form_lazy_transaction(lines: list[str]) -> Union[LazyTransaction, None]:
+    """Forms a lazy transaction from a single block of lines,
+    only parsing its header. Comments are only stripped from
+    the header line here; the rest of the block is kept as is.
+
+    Returns None if the block only contains comments or if
+    the block is a rule."""
+    for header_index, line in enumerate(lines):
+        if not _COMMENT_LINE_RE.match(line):
+            break
+    else:
+        return None
+
+    header = lines[header_index]
+    if ';' in header:
+        header = _strip_comments([header])[0]
+    if _is_rule([header]):
+        return None
+
+    date, effective_date, description = _parse_header(header)
+    # the header is kept with the rest of the lines, since
+    # parsing the transfers reports errors using the header
+    text = '\n'.join(line.rstrip('\n') for line in lines[header_index:])
+    return LazyTransaction(date, description, text, effective_date)
+
+
+class ImportStats:
+    """Wall time and counts gathered while importing a ledger file.
+
+    Pass an instance to `import_ledger_file` to have it filled in.
+    `times` holds the time spent in each phase of the import:
+    - scan: finding blocks (including reading the file)
+    - strip_comments: removing comments from blocks
+    - header: parsing the date and description of transactions
+    - postings: parsing transfers
+    - add_transaction: adding transactions to the ledger,
+      including calling its listeners
+    - cache: loading or storing the parse cache
+
+    When parsing with multiple workers, the parse phases add up
+    the time spent in each worker, so they can exceed `wall_time`."""
+    PHASES = ('scan', 'strip_comments', 'header', 'postings', 'add_transaction', 'cache')
+
+    def __init__(self):
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.wall_time = 0.0
+        self.bytes = 0
+        self.blocks = 0
+        self.transactions = 0
+        self.postings = 0
+
+    def merge(self, other: 'ImportStats') -> None:
+        """Adds the times and counts of `other` (e.g. from a worker
+        process) to these stats. Wall time and bytes are not added."""
+        for phase, seconds in other.times.items():
+            self.times[phase] += seconds
+        self.blocks += other.blocks
+        self.transactions += other.transactions
+        self.postings += other.postings
+
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.wall_time if self.wall_time else 0.0
+
+    def transactions_per_second(self) -> float:
+        return self.transactions / self.wall_time if self.wall_time else 0.0
+
+    def report(self) -> str:
+        lines = [f'{"phase":<16}{"seconds":>10}']
+        for phase in self.PHASES:
+            lines.append(f'{phase:<16}{self.times[phase]:>10.3f}')
+        other = self.wall_time - sum(self.times.values())
+        lines.append(f'{"other":<16}{max(other, 0.0):>10.3f}')
+        lines.append(f'{"wall time":<16}{self.wall_time:>10.3f}')
+        lines.append(f'{self.bytes} bytes, {self.blocks} blocks, '
+                     f'{self.transactions} transactions, {self.postings} postings')
+        lines.append(f'{self.bytes_per_second() / 1e6:.2f} MB/s, '
+                     f'{self.transactions_per_second():.0f} transactions/s')
+        return '\n'.join(lines)
+
+
+def _timed(iterable: Iterable, stats: ImportStats, phase: str) -> Iterator:
+    """Yields the items of `iterable`, adding the time
+    spent producing each item to `phase` of `stats`"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats.times[phase] += time.perf_counter() - start
+            return
+        stats.times[phase] += time.perf_counter() - start
+        yield item
+
+
+def _iter_blocks(lines: Iterable[str]) -> Iterator[tuple[int, list[str]]]:
+    """Yields each blank-line-delimited block found in `lines`
+    as a tuple of the (zero-based) index of the block's first
+    line and the lines that make up the block.
+
+    Only the lines of the block currently being read are held
+    in memory, so `lines` can be an open file."""
+    block = []
+    start = None
+    for line_no, line in enumerate(lines):
+        if _has_text(line):
+            if not block:
+                start = line_no
+            block.append(line)
+        elif block:
+            yield start, block
+            block = []
+
+    # file may not end with a blank line
+    if block:
+        yield start, block
+
+
+class TransactionFilter:
+    """Selects which transactions to import.
+
+    Transactions dated before `since` or after `until` are
+    skipped, as are transactions without a transfer to one of
+    `accounts` (or one of their subaccounts). Each of these
+    can be left as None to not filter on it.
+
+    Blocks are checked against the filter before any of their
+    transfers are parsed."""
+    def __init__(self, since: Union[date, None] = None,
+                 until: Union[date, None] = None,
+                 accounts: Union[Iterable[str], None] = None):
+        self.since = since
+        self.until = until
+        self.accounts = tuple(accounts) if accounts is not None else None
+        if self.accounts is not None:
+            self._encoded_accounts = tuple(a.encode('utf-8') for a in self.accounts)
+            # a posting line to one of `accounts` or their subaccounts
+            self._posting_re = re.compile(
+                r'\s+(?:[*!] )?(?:' + '|'.join(map(re.escape, self.accounts)) +
+                r')(?::|\s{2}|\t|\s*;|\s*$)')
+
+    def _accepts_date(self, date_text: str) -> bool:
+        try:
+            transaction_date = parse_date(date_text)
+        except ValueError:
+            # let the parser report the malformed date
+            return True
+        if self.since is not None and transaction_date < self.since:
+            return False
+        if self.until is not None and transaction_date > self.until:
+            return False
+        return True
+
+    def accepts_lines(self, lines: list[str]) -> bool:
+        """Checks the date in the header line of a block (stripped
+        of comments) and looks for the names of `accounts`
+        in the rest of its lines"""
+        if self.since is not None or self.until is not None:
+            date_text = lines[0].split(None, 1)[0].split('=', 1)[0]
+            if not self._accepts_date(date_text):
+                return False
+        if self.accounts is not None:
+            return any(account in line for line in lines[1:] for account in self.accounts)
+        return True
+
+    def rejects_raw_block(self, block: bytes) -> bool:
+        """Cheaply checks a block before it is even decoded.
+
+        Only rejects blocks that can not possibly pass the filter,
+        e.g. blocks that start with a date outside of the
+        window, so blocks that are not rejected still
+        have to be checked with `accepts_lines`."""
+        if self.since is not None or self.until is not None:
+            res = _RAW_DATE_RE.match(block)
+            if res is not None and not self._accepts_date(res.group(1).decode('ascii')):
+                return True
+        if self.accounts is not None:
+            return not any(account in block for account in self._encoded_accounts)
+        return False
+
+    def accepts_transfers(self, transaction: Transaction) -> bool:
+        """Checks that `transaction` has a transfer to one of `accounts`"""
+        if self.accounts is None:
+            return True
+        for transfer in transaction.transfers:
+            for account in self.accounts:
+                if transfer.account == account or \
+                   transfer.account.startswith(account + ':'):
+                    return True
+        return False
+
+    def accepts(self, transaction: Transaction) -> bool:
+        """Checks an already parsed transaction against the filter"""
+        return self._accepts_date(transaction.date) and \
+            self.accepts_transfers(transaction)
+
+    def accepts_lazy(self, transaction: Transaction, lines: list[str]) -> bool:
+        """Checks a lazy transaction, formed from the block `lines`,
+        against the filter without parsing its transfers. Postings
+        are only matched on the account at the start of each line."""
+        if not self._accepts_date(transaction.date):
+            return False
+        if self.accounts is None:
+            return True
+        posting_re = self._posting_re
+        return any(posting_re.match(line) for line in lines)
+
+
+# date at the very start of a raw block
+_RAW_DATE_RE = re.compile(rb'(\d{4}/\d{1,2}/\d{1,2})[=\s]')
+
+
+def _parse_block(lines: list[str],
+                 transaction_filter: Union[TransactionFilter, None] = None,
+                 lazy: bool = False,
+                 stats: Union[ImportStats, None] = None) -> Union[Transaction, None]:
+    """Forms a transaction from a single block of lines.
+
+    Returns None if the block only contains comments,
+    if the block is a rule or if the transaction is
+    not accepted by `transaction_filter`.
+
+    If `lazy` is set, a LazyTransaction is returned
+    and its transfers are left unparsed.
+
+    If `stats` is given, the time spent in each
+    phase of parsing is added to it."""
+    if stats is not None:
+        stats.blocks += 1
+        start = time.perf_counter()
+
+    if lazy:
+        transaction = _form_lazy_transaction(lines)
+        if stats is not None:
+            stats.times['header'] += time.perf_counter() - start
+        if transaction is None or \
+           (transaction_filter is not None and
+                not transaction_filter.accepts_lazy(transaction, lines)):
+            return None
+        if stats is not None:
+            stats.transactions += 1
+        return transaction
+
+    lines_without_comments = _strip_comments(lines)
+    if stats is not None:
+        stats.times['strip_comments'] += time.perf_counter() - start
+
+    # skip block if lines only contain comments
+    # also, skip rules
+    if len(lines_without_comments) == 0 or \
+       _is_rule(lines_without_comments):
+        return None
+
+    if transaction_filter is not None and \
+       not transaction_filter.accepts_lines(lines_without_comments):
+        return None
+    transaction = _form_transaction(lines_without_comments, stats)
+    if transaction_filter is not None and \
+       not transaction_filter.accepts_transfers(transaction):
+        return None
+    if stats is not None:
+        stats.transactions += 1
+        stats.postings += len(transaction.transfers)
+    return transaction
+
+
+def _iter_file_transactions(ledger_file: Iterable[str],
+                            transaction_filter: Union[TransactionFilter, None] = None,
+                            lazy: bool = False,
+                            stats: Union[ImportStats, None] = None) -> Iterator[Transaction]:
+    blocks = _iter_blocks(ledger_file)
+    if stats is not None:
+        blocks = _timed(blocks, stats, 'scan')
+    for _, block in blocks:
+        transaction = _parse_block(block, transaction_filter, lazy, stats)
+        if transaction is not None:
+            yield transaction
+
+
+def iter_transactions(path_or_fileobj: Union[str, os.PathLike, TextIO],
+                      transaction_filter: Union[TransactionFilter, None] = None,
+                      lazy: bool = False,
+                      stats: Union[ImportStats, None] = None) -> Iterator[Transaction]:
+    """Yields each transaction found in `path_or_fileobj`
+    as soon as the block that contains it has been read.
+
+    `path_or_fileobj` can either be the path to a ledger file
+    or a file object that is already open for reading.
+    The file is read once, line by line, so memory use does
+    not grow with the size of the file.
+
+    Only transactions accepted by `transaction_filter`
+    are parsed and yielded. If `lazy` is set, LazyTransactions
+    are yielded instead of parsing transfers up front.
+    If `stats` is given, parse times and counts are added to it."""
+    if not isinstance(path_or_fileobj, (str, os.PathLike)):
+        yield from _iter_file_transactions(path_or_fileobj, transaction_filter, lazy, stats)
+        return
+
+    path = path_or_fileobj
+    logger.debug(f'Importing {path}')
+    try:
+        with open(path, 'r') as ledger_file:
+            yield from _iter_file_transactions(ledger_file, transaction_filter, lazy, stats)
+    except FileNotFoundError:
+        logger.exception(f'Unable to open {path}')
+        raise
+
+
+# a block is a run of lines that each contain some text
+_BLOCK_RE = re.compile(rb'(?m)^[^\n]*\S[^\n]*(?:\n[^\n]*\S[^\n]*)*')
+
+# a line that only contains whitespace, along with
+# the newline that ends the line before it
+_BLANK_LINE_RE = re.compile(rb'\n[^\S\n]*\n')
+
+# the characters `_has_text` counts as whitespace that bytes
+# patterns do not (e.g. non-breaking spaces), as UTF-8
+_UNICODE_SPACES = ('\x1c\x1d\x1e\x1f\x85\xa0\u1680'
+                   + ''.join(map(chr, range(0x2000, 0x200b)))
+                   + '\u2028\u2029\u202f\u205f\u3000')
+_UNICODE_SPACE_RE = re.compile(b'|'.join(re.escape(c.encode('utf-8')) for c in _UNICODE_SPACES))
+
+
+def _decode_lines(block: bytes) -> list[str]:
+    """Decodes a block found on the bytes of a ledger file into
+    its lines, without the carriage returns of Windows line
+    endings, as reading the file in text mode would"""
+    return block.decode('utf-8').replace('\r\n', '\n').split('\n')
+
+
+def _split_block_span(data: Union[bytes, mmap.mmap], start: int,
+                      end: int) -> Iterator[tuple[int, int]]:
+    """Yields the offset and length of each block found between
+    byte offsets `start` and `end`, which hold a single block by
+    the bytes patterns, deciding which lines are blank with
+    `_has_text` like `_iter_blocks` does"""
+    block_start = None
+    block_end = None
+    line_start = start
+    while line_start <= end:
+        line_end = data.find(b'\n', line_start, end)
+        if line_end == -1:
+            line_end = end
+        if _has_text(data[line_start:line_end].decode('utf-8', 'replace')):
+            if block_start is None:
+                block_start = line_start
+            block_end = line_end
+        elif block_start is not None:
+            yield block_start, block_end - block_start
+            block_start = None
+        line_start = line_end + 1
+
+    if block_start is not None:
+        yield block_start, block_end - block_start
+
+
+def _iter_block_spans(data: Union[bytes, mmap.mmap], start: int = 0,
+                      end: Union[int, None] = None) -> Iterator[tuple[int, int]]:
+    """Yields the byte offset and length of each
+    blank-line-delimited block found in `data`.
+
+    Only blocks between byte offsets `start` and `end` are
+    scanned. `start` must be the beginning of a line."""
+    if end is None:
+        end = len(data)
+    for res in _BLOCK_RE.finditer(data, start, end):
+        if _UNICODE_SPACE_RE.search(data, res.start(), res.end()):
+            yield from _split_block_span(data, res.start(), res.end())
         else:
-            # for custom units (e.g. 5 apples)
-            # - must start with four (or more spaces)
-            # - account can be a string without spaces
-            #   or can have single spaces spread through name
-            # - after account name must be two (or more) spaces
-            # - amount must have one or more non-space characters
-            # - and unit must have one or more non-space characters
-            # TODO: Currently ignores price information
-            #       e.g. 5 FOO @ $20.00
-            res = re.match(r'^\s{4}\s*(([*!] )?)((\S+ )*\S+)\s{2}\s*(-?[0-9.]+ \S+)( @ \S+)?$', line)
-            if res is not None:
-                status = _parse_status_symbol(res.group(1))
-                account = res.group(3)
-                amount, unit = _parse_raw_amount(res.group(5))
-                transfer = Transfer(account=account,
-                                    amount=amount,
-                                    unit=unit,
-                                    status=status)
-                transfers.append(transfer)
-                continue
+            yield res.start(), res.end() - res.start()
+
 
-        # last possibility is that this is a transfer where the amount was left blank
-        # - must start with four (or more spaces)
-        # - account can be a string without spaces
-        #   or can have single spaces spread through name
-        # - after account, string can end, or there could be trailing spaces
-        res = re.match(r'^\s{4}\s*((\S+ )*\S+)\s*$', line)
+class MappedLedgerFile:
+    """Memory-maps a ledger file so that its blocks can be
+    found directly on the file's bytes, without reading the
+    file into memory or splitting it into lines.
+
+    Only blocks that are actually parsed are copied
+    out of the map and decoded."""
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = path
+        with open(path, 'rb') as ledger_file:
+            self.size = os.fstat(ledger_file.fileno()).st_size
+            if self.size == 0:
+                # empty files can not be mapped
+                self.data = b''
+            else:
+                self.data = mmap.mmap(ledger_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def spans(self, start: int = 0, end: Union[int, None] = None,
+              stats: Union[ImportStats, None] = None) -> Iterator[tuple[int, int]]:
+        """Yields the offset and length of each block
+        between byte offsets `start` and `end`.
+
+        If `stats` is given, the time spent scanning
+        is added to it."""
+        spans = _iter_block_spans(self.data, start, end)
+        if stats is not None:
+            return _timed(spans, stats, 'scan')
+        return spans
+
+    def block(self, offset: int, length: int) -> bytes:
+        return self.data[offset:offset + length]
+
+    def block_lines(self, offset: int, length: int) -> list[str]:
+        return _decode_lines(self.block(offset, length))
+
+    def next_boundary(self, offset: int) -> int:
+        """Returns the offset of the first line following a blank
+        line at or after `offset`, or the size of the file if there
+        is no such line. A block never spans this offset."""
+        res = _BLANK_LINE_RE.search(self.data, offset)
         if res is None:
-            # we were just unable to parse this line
-            raise MalformedTransaction(f'Unable to parse transfer: {line}')
+            return self.size
+        return res.end()
 
-        if found_empty_amount:
-            raise MalformedTransaction(f'Found multiple transfers with no amount specified for {text[0]}')
 
-        found_empty_amount = True
-        transfer = Transfer(account=res.group(1),
-                            amount=None,
-                            unit=None)
-        transfers.append(transfer)
+def iter_mapped_transactions(path: Union[str, os.PathLike],
+                             start: int = 0,
+                             end: Union[int, None] = None,
+                             transaction_filter: Union[TransactionFilter, None] = None,
+                             lazy: bool = False,
+                             stats: Union[ImportStats, None] = None) -> Iterator[Transaction]:
+    """Yields each transaction found in the ledger file at `path`,
+    like `iter_transactions`, but finds blocks on the memory-mapped
+    file and only decodes the blocks that get parsed.
+
+    `start` and `end` limit parsing to blocks between those byte
+    offsets (see `MappedLedgerFile.next_boundary`).
+
+    Blocks that `transaction_filter` rejects based on their raw
+    bytes are not even decoded."""
+    with MappedLedgerFile(path) as mapped:
+        # the scan holds on to the map until it is done, so it is
+        # not kept in a variable that would outlive an exception
+        for offset, length in mapped.spans(start, end, stats):
+            if transaction_filter is None:
+                transaction = _parse_block(mapped.block_lines(offset, length), lazy=lazy, stats=stats)
+            else:
+                block = mapped.block(offset, length)
+                if transaction_filter.rejects_raw_block(block):
+                    continue
+                transaction = _parse_block(_decode_lines(block),
+                                           transaction_filter, lazy, stats)
+            if transaction is not None:
+                yield transaction
+
+
+class ImportProblem:
+    """A block of a ledger file that could not be parsed,
+    or a transaction that did not validate.
+
+    `line` is the file line number the block starts on (counting
+    from 1) and `offset` is its byte offset, when known."""
+    def __init__(self, line: int, offset: Union[int, None], message: str,
+                 transaction: Union[Transaction, None] = None):
+        self.line = line
+        self.offset = offset
+        self.message = message
+        self.transaction = transaction
+
+    def __str__(self) -> str:
+        if self.offset is None:
+            return f'line {self.line}: {self.message}'
+        return f'line {self.line} (byte {self.offset}): {self.message}'
+
+
+class ValidationReport:
+    """Collects the problems found while checking a ledger file"""
+    def __init__(self):
+        self.problems = []
+        self.blocks = 0
+        self.transactions = 0
+
+    def add(self, line: int, offset: Union[int, None], message: str,
+            transaction: Union[Transaction, None] = None) -> None:
+        self.problems.append(ImportProblem(line, offset, message, transaction))
+
+    def ok(self) -> bool:
+        return len(self.problems) == 0
+
+    def format(self) -> str:
+        lines = [str(problem) for problem in self.problems]
+        lines.append(f'Checked {self.blocks} blocks, {self.transactions} transactions: '
+                     f'{len(self.problems)} problems found')
+        return '\n'.join(lines)
+
+
+def _check_block(lines: list[str], line: int, offset: Union[int, None],
+                 report: ValidationReport,
+                 transaction_filter: Union[TransactionFilter, None],
+                 stats: Union[ImportStats, None]) -> Union[Transaction, None]:
+    """Parses and validates a single block, adding any
+    problem to `report` instead of raising it"""
+    report.blocks += 1
+    try:
+        transaction = _parse_block(lines, transaction_filter, stats=stats)
+    except (MalformedTransaction, MalformedTransfer) as e:
+        report.add(line, offset, f'{type(e).__name__}: {str(e).strip()}')
+        return None
+    if transaction is None:
+        return None
+
+    report.transactions += 1
+    for error in transaction.errors():
+        report.add(line, offset, error, transaction)
+    return transaction
+
+
+def _iter_checked_transactions(path_or_fileobj: Union[str, os.PathLike, TextIO],
+                               report: ValidationReport,
+                               transaction_filter: Union[TransactionFilter, None] = None,
+                               stats: Union[ImportStats, None] = None) -> Iterator[Transaction]:
+    """Yields each transaction that could be parsed from
+    `path_or_fileobj`, like `iter_transactions`, but keeps going
+    after malformed blocks. Blocks that fail to parse and
+    transactions that do not validate are added to `report`.
+    Transactions that do not validate are still yielded."""
+    if not isinstance(path_or_fileobj, (str, os.PathLike)):
+        for start, block in _iter_blocks(path_or_fileobj):
+            transaction = _check_block(block, start + 1, None, report,
+                                       transaction_filter, stats)
+            if transaction is not None:
+                yield transaction
+        return
+
+    with MappedLedgerFile(path_or_fileobj) as mapped:
+        # line numbers are only needed for problems, but counting
+        # newlines as blocks go by keeps it to a single pass
+        line = 1
+        counted_to = 0
+        for offset, length in mapped.spans(stats=stats):
+            line += mapped.block(counted_to, offset - counted_to).count(b'\n')
+            counted_to = offset
+            try:
+                lines = mapped.block_lines(offset, length)
+            except UnicodeDecodeError as e:
+                report.blocks += 1
+                report.add(line, offset, f'Unable to decode block: {e}')
+                continue
+            transaction = _check_block(lines, line, offset, report,
+                                       transaction_filter, stats)
+            if transaction is not None:
+                yield transaction
+
+
+def check_ledger_file(path: Union[str, os.PathLike, TextIO]) -> ValidationReport:
+    """Parses and validates every transaction in `path`
+    in a single pass and returns the problems found"""
+    report = ValidationReport()
+    for _ in _iter_checked_transactions(path, report):
+        pass
+    return report
+
+
+# number of chunks handed to each worker process, so that
+# a worker that finishes early can pick up more of the file
+CHUNKS_PER_WORKER = 4
+
+
+def _chunk_file(path: Union[str, os.PathLike], chunks: int) -> list[tuple[int, int]]:
+    """Splits the file at `path` into (at most) `chunks` byte ranges,
+    given as (start, end) tuples. Ranges only ever end just after a
+    blank line, so no transaction block is split across two ranges."""
+    offsets = [0]
+    with MappedLedgerFile(path) as mapped:
+        size = mapped.size
+        for i in range(1, chunks):
+            target = size * i // chunks
+            if target <= offsets[-1]:
+                continue
+
+            offset = mapped.next_boundary(target)
+            if offset >= size:
+                break
+            offsets.append(offset)
+    offsets.append(size)
 
-    return Transaction(date=date, description=description, transfers=transfers)
+    return list(zip(offsets[:-1], offsets[1:]))
 
 
-def import_ledger_file(path: str, ledger: Union[Ledger, None] = None) -> None:
+def _parse_chunk(path: Union[str, os.PathLike], start: int, end: int,
+                 transaction_filter: Union[TransactionFilter, None] = None,
+                 lazy: bool = False,
+                 with_stats: bool = False) -> tuple[list[Transaction], Union[ImportStats, None]]:
+    """Parses all transactions found between byte offsets
+    `start` and `end` of the file at `path`.
+
+    Runs in a worker process, so only the byte range is sent to
+    the worker and only the parsed transactions (and the worker's
+    stats if `with_stats` is set) are sent back."""
+    stats = ImportStats() if with_stats else None
+    transactions = list(iter_mapped_transactions(path, start, end, transaction_filter, lazy, stats))
+    return transactions, stats
+
+
+def _iter_transactions_in_parallel(path: Union[str, os.PathLike], workers: int,
+                                   transaction_filter: Union[TransactionFilter, None] = None,
+                                   lazy: bool = False,
+                                   stats: Union[ImportStats, None] = None) -> Iterator[Transaction]:
+    """Yields the transactions in `path`, in file order, parsing
+    blocks of the file in `workers` processes."""
+    logger.debug(f'Importing {path} using {workers} workers')
+    chunks = _chunk_file(path, workers * CHUNKS_PER_WORKER)
+    starts = [start for start, _ in chunks]
+    ends = [end for _, end in chunks]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map returns results in the order chunks were submitted
+        results = executor.map(_parse_chunk, [path] * len(chunks), starts, ends,
+                               [transaction_filter] * len(chunks),
+                               [lazy] * len(chunks),
+                               [stats is not None] * len(chunks))
+        for transactions, chunk_stats in results:
+            if stats is not None:
+                stats.merge(chunk_stats)
+            yield from transactions
+
+
+def _block_digest(block: bytes) -> bytes:
+    return hashlib.sha256(block).digest()
+
+
+class BlockManifest:
+    """Records the blocks found the last time a ledger
+    file was imported, along with the transaction each
+    block was parsed into.
+
+    `blocks` holds an (offset, length, digest) tuple for each
+    block and `transactions` holds the matching transaction,
+    which is None for blocks that only contain comments or rules."""
+    def __init__(self, size: int, digest: bytes,
+                 blocks: list[tuple[int, int, bytes]],
+                 transactions: list[Union[Transaction, None]]):
+        self.size = size
+        self.digest = digest
+        self.blocks = blocks
+        self.transactions = transactions
+
+
+# manifests of previously imported files, keyed by absolute path
+# and whether their transactions are shared (see `_import_incrementally`)
+_manifests: dict[tuple[str, bool], BlockManifest] = {}
+
+
+def clear_manifests() -> None:
+    """Forgets all files imported with `incremental=True`,
+    so the next import of each file parses the whole file"""
+    _manifests.clear()
+
+
+def _parse_block_bytes(block: bytes, lazy: bool = False,
+                       stats: Union[ImportStats, None] = None) -> Union[Transaction, None]:
+    return _parse_block(_decode_lines(block), lazy=lazy, stats=stats)
+
+
+def _import_incrementally(path: Union[str, os.PathLike], lazy: bool = False,
+                          stats: Union[ImportStats, None] = None,
+                          shared: bool = True) -> list[Transaction]:
+    """Returns the transactions in `path`, only parsing the blocks
+    that were added or changed since the file was last imported.
+
+    If the file was only appended to, the blocks that were
+    already imported are not scanned or hashed again.
+
+    If `shared` is set, the transactions kept in the manifest are
+    returned, so later shared imports of the path return the same
+    objects for unchanged blocks. Otherwise copies are returned and
+    the manifest's transactions are never handed out. Shared and
+    copying imports keep separate manifests."""
+    key = (os.path.abspath(path), shared)
+    logger.debug(f'Importing {path} incrementally')
+
+    previous = _manifests.get(key)
+    blocks = []
+    transactions = []
+    scan_from = 0
+    reusable = {}
+    parsed = 0
+
+    with MappedLedgerFile(path) as mapped:
+        # the digest of the whole file is built up in two parts, so
+        # the part of the file seen during the last import is only
+        # hashed once
+        prefix_size = previous.size if previous is not None else 0
+        with memoryview(mapped.data) as view:
+            file_hash = hashlib.sha256(view[:prefix_size])
+            prefix_digest = file_hash.digest()
+            file_hash.update(view[prefix_size:])
+
+        if previous is not None and mapped.size >= previous.size and \
+           prefix_digest == previous.digest:
+            # file was appended to. the last known block is scanned
+            # again since the append may have extended it
+            kept = len(previous.blocks) - 1
+            if kept >= 0:
+                blocks = previous.blocks[:kept]
+                transactions = previous.transactions[:kept]
+                scan_from = previous.blocks[kept][0]
+                reusable = {previous.blocks[kept][2]: [previous.transactions[kept]]}
+        elif previous is not None:
+            # file was edited. transactions of unchanged blocks can
+            # still be reused. the same block may appear more than
+            # once, in which case each copy is reused once
+            for (_, _, digest), transaction in zip(previous.blocks, previous.transactions):
+                reusable.setdefault(digest, []).append(transaction)
+            for candidates in reusable.values():
+                candidates.reverse()
+
+        for offset, length in mapped.spans(scan_from, stats=stats):
+            block = mapped.block(offset, length)
+            digest = _block_digest(block)
+            candidates = reusable.get(digest)
+            if candidates:
+                transaction = candidates.pop()
+            else:
+                transaction = _parse_block_bytes(block, lazy, stats)
+                parsed += 1
+            blocks.append((offset, length, digest))
+            transactions.append(transaction)
+        size = mapped.size
+
+    _manifests[key] = BlockManifest(size, file_hash.digest(), blocks, transactions)
+    logger.debug(f'Parsed {parsed} of {len(blocks)} blocks in {path}')
+    if shared:
+        return [t for t in transactions if t is not None]
+    return [t.copy() for t in transactions if t is not None]
+
+
+def _read_transactions(path: Union[str, os.PathLike, TextIO],
+                       workers: int, incremental: bool, mapped: bool,
+                       transaction_filter: Union[TransactionFilter, None] = None,
+                       lazy: bool = False,
+                       stats: Union[ImportStats, None] = None,
+                       shared: bool = True) -> Iterable[Transaction]:
+    if incremental:
+        return _import_incrementally(path, lazy, stats, shared)
+    if workers > 1:
+        return _iter_transactions_in_parallel(path, workers, transaction_filter, lazy, stats)
+    if mapped:
+        return iter_mapped_transactions(path, transaction_filter=transaction_filter,
+                                        lazy=lazy, stats=stats)
+    return iter_transactions(path, transaction_filter, lazy, stats)
+
+
+def read_ledger_file(path: Union[str, os.PathLike, TextIO],
+                     workers: int = 1,
+                     incremental: bool = False,
+                     mapped: bool = False,
+                     lazy: bool = False,
+                     stats: Union[ImportStats, None] = None) -> list[Transaction]:
+    """Returns the transactions in `path`, in file order, without
+    adding them to a ledger. See `import_ledger_file` for what
+    each of the other arguments does.
+
+    Unlike `import_ledger_file`, incremental reads return the same
+    transaction objects for unchanged blocks each time (see
+    `ledger_snapshot.LedgerStore`). Changes made to them, such as
+    filling in amounts, are seen by every later incremental read
+    of the path."""
+    if (workers > 1 or incremental or mapped) and not isinstance(path, (str, os.PathLike)):
+        raise ValueError('Reading with multiple workers, incrementally '
+                         'or memory-mapped requires a path')
+    if workers > 1 and incremental:
+        raise ValueError('Incremental imports can not use multiple workers')
+    return list(_read_transactions(path, workers, incremental, mapped, lazy=lazy, stats=stats))
+
+
+def _log_transaction(transaction: Transaction) -> None:
+    log_msg = f'Imported transaction dated {transaction.date}, ' + \
+              f'with description {transaction.description}, ' + \
+              f'containing {len(transaction.transfers)} transfers'
+    logger.debug(log_msg)
+
+
+def import_ledger_file(path: Union[str, os.PathLike, TextIO],
+                       ledger: Union[Ledger, None] = None,
+                       workers: int = 1,
+                       incremental: bool = False,
+                       cache: bool = False,
+                       mapped: bool = False,
+                       since: Union[date, None] = None,
+                       until: Union[date, None] = None,
+                       accounts: Union[Iterable[str], None] = None,
+                       lazy: bool = False,
+                       stats: Union[ImportStats, None] = None,
+                       strict: bool = True,
+                       report: Union[ValidationReport, None] = None) -> Ledger:
     """Imports transactions found in `path`
     into `ledger` object. If `ledger` is not provided,
     one is created. In both cases, the ledger object used
-    is returned."""
-    if not ledger:
+    is returned.
+
+    `path` can also be a file object that is already open
+    for reading (see `iter_transactions`).
+
+    If `workers` is greater than one, the file is cut into chunks
+    at block boundaries which are parsed in that many processes.
+    Transactions are still added to `ledger` in file order.
+
+    If `incremental` is set, a manifest of the file's blocks is
+    kept after the import. Importing the same path again with
+    `incremental` set reuses the transactions of unchanged blocks
+    and only parses blocks that were added or edited. Each import
+    gets its own copies of the reused transactions, so changes made
+    to them in one ledger (e.g. by `fill_amount`, `auto_balance` or
+    plugins) do not show up in later imports.
+
+    If `cache` is set, the parsed transactions are stored in a
+    sidecar cache file next to `path` (see `ledger_cache`). As long
+    as the file does not change, later imports with `cache` set
+    load the transactions from the cache instead of parsing.
+
+    If `mapped` is set, the file is memory-mapped and blocks are
+    found on its raw bytes (see `iter_mapped_transactions`).
+    Multiple workers and incremental imports always do this.
+
+    `since`, `until` and `accounts` limit the import to the
+    transactions in that date range (inclusive) that have a transfer
+    to one of `accounts` or their subaccounts (see `TransactionFilter`).
+    Blocks outside of the filter are skipped before their transfers
+    are parsed. Filtered imports of a path are always memory-mapped.
+
+    If `lazy` is set, only the date and description of each
+    transaction are parsed up front. The transfers of each
+    transaction are parsed the first time they are accessed
+    (see `LazyTransaction`), so malformed transfers are only
+    reported then, or by `validate_transfers`. The cache only
+    holds fully parsed transactions, so lazy imports can not be
+    cached.
+
+    Transactions are added to `ledger` in chunks (see
+    `Ledger.add_transactions`) and any deferred listeners of the
+    ledger are run once all of them have been added.
+
+    If `stats` is given, the time spent in each phase of the
+    import and counts of what was imported are added to it.
+
+    By default, the first malformed transaction or transfer aborts
+    the import. If `strict` is not set, parsing continues past
+    malformed blocks and each transaction is validated. Every
+    problem is added to `report` along with the line it was found
+    on, and the transactions that could be parsed are imported
+    (see `check_ledger_file`). Non-strict imports can not use
+    multiple workers, be incremental, cached or lazy."""
+    start = time.perf_counter()
+    if ledger is None:
         ledger = Ledger()
 
-    try:
-        logger.debug(f'Importing {path}')
-        with open(path, 'r') as ledger_file:
-            lines = ledger_file.readlines()
-    except FileNotFoundError:
-        logger.exception(f'Unable to open {path}')
+    if (workers > 1 or incremental or cache or mapped) and \
+       not isinstance(path, (str, os.PathLike)):
+        raise ValueError('Importing with multiple workers, incrementally, '
+                         'with a cache or memory-mapped requires a path')
+    if workers > 1 and incremental:
+        raise ValueError('Incremental imports can not use multiple workers')
+    if cache and lazy:
+        raise ValueError('Lazy imports can not be cached')
+    if not strict and (workers > 1 or incremental or cache or lazy):
+        raise ValueError('Non-strict imports can not use multiple workers, '
+                         'be incremental, cached or lazy')
 
-    if len(lines) == 0:
-        return []
+    transaction_filter = None
+    if since is not None or until is not None or accounts is not None:
+        if incremental:
+            raise ValueError('Incremental imports can not be filtered')
+        transaction_filter = TransactionFilter(since, until, accounts)
+        mapped = isinstance(path, (str, os.PathLike))
 
-    logger.debug('Beginning to parse {path}')
-    last_end = -1  # inclusive
-    while last_end < len(lines):
-        start = _scan_to_nonempty_line(lines, last_end + 1)
-        if start is None:
-            break
+    if stats is not None and isinstance(path, (str, os.PathLike)):
+        stats.bytes += os.path.getsize(path)
 
-        end = _scan_to_last_nonempty_line(lines, start)
+    if not strict:
+        if report is None:
+            report = ValidationReport()
+        transactions = _iter_checked_transactions(path, report, transaction_filter, stats)
+    elif cache:
+        # the cache always holds every transaction in the file,
+        # so it can be used by imports with any filter
+        cache_start = time.perf_counter()
+        key = ledger_cache.cache_key(path)
+        transactions = ledger_cache.load(key)
+        if stats is not None:
+            stats.times['cache'] += time.perf_counter() - cache_start
 
-        lines_without_comments = _strip_comments(lines[start:end + 1])
+        if transactions is None:
+            transactions = list(_read_transactions(path, workers, incremental, mapped,
+                                                   stats=stats, shared=False))
+            cache_start = time.perf_counter()
+            ledger_cache.store(key, transactions)
+            if stats is not None:
+                stats.times['cache'] += time.perf_counter() - cache_start
+        elif stats is not None:
+            stats.transactions += len(transactions)
+        if transaction_filter is not None:
+            transactions = filter(transaction_filter.accepts, transactions)
+    else:
+        transactions = _read_transactions(path, workers, incremental, mapped,
+                                          transaction_filter, lazy, stats, shared=False)
 
-        # skip block if lines only contain comments
-        # also, skip rules
-        if len(lines_without_comments) > 0 and \
-           not _is_rule(lines_without_comments):
-            transaction = _form_transaction(lines_without_comments)
-            ledger.add_transaction(transaction)
-            log_msg = f'Imported transaction dated {transaction.date}, ' + \
-                      f'with description {transaction.description}, ' + \
-                      f'containing {len(transaction.transfers)} transfers'
-            logger.debug(log_msg)
+    # avoid building a log message for each transaction unless it is
+    # actually logged. this also keeps lazy transactions unparsed
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if stats is None and not debug:
+        ledger.add_transactions(transactions)
+    else:
+        # chunks are handed to the ledger one at a time, the same
+        # way `Ledger.add_transactions` does, so they can be timed
+        transactions = iter(transactions)
+        while True:
+            chunk = list(islice(transactions, ADD_TRANSACTIONS_CHUNK_SIZE))
+            if not chunk:
+                break
+            add_start = time.perf_counter()
+            ledger.add_transactions(chunk)
+            if stats is not None:
+                stats.times['add_transaction'] += time.perf_counter() - add_start
+            if debug:
+                for transaction in chunk:
+                    _log_transaction(transaction)
 
-        last_end = end
+    # indexes that were deferred are built now that parsing is done
+    ledger.get_plugin_manager().run_deferred()
+    if stats is not None:
+        stats.wall_time += time.perf_counter() - start
     return ledger
 
 
@@ -295,11 +1315,68 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Imports Ledger file')
     parser.add_argument('path', type=str, help='Path to Ledger file')
     parser.add_argument('--verbose', '-v', action='count', default=0)
+    parser.add_argument('--workers', '-j', type=int, default=1,
+                        help='Number of processes used to parse the file')
+    parser.add_argument('--cache', action='store_true',
+                        help='Keep a parse cache next to the file, to load it faster '
+                             'while it does not change')
+    parser.add_argument('--mmap', dest='mapped', action='store_true',
+                        help='Memory-map the file instead of reading it line by line')
+    parser.add_argument('--since', '-b', type=parse_date,
+                        help='Only import transactions on or after this date (YYYY/MM/DD)')
+    parser.add_argument('--until', '-e', type=parse_date,
+                        help='Only import transactions on or before this date (YYYY/MM/DD)')
+    parser.add_argument('--account', '-a', dest='accounts', action='append',
+                        help='Only import transactions with a transfer to this account '
+                             '(or its subaccounts). Can be given more than once')
+    parser.add_argument('--lazy', action='store_true',
+                        help='Only parse the transfers of a transaction when they are used')
+    parser.add_argument('--profile', action='store_true',
+                        help='Report the time spent in each phase of the import')
+    parser.add_argument('--columnar', action='store_true',
+                        help='Store transactions in columns to use less memory')
+    parser.add_argument('--check', action='store_true',
+                        help='Keep going after errors, validate each transaction '
+                             'and report every problem found')
+    parser.add_argument('--duplicates', action='store_true',
+                        help='Report transactions that were entered more than once')
+    parser.add_argument('--duplicate-days', type=int, default=3,
+                        help='Report transactions moving the same amount within this many '
+                             'days of each other as probable duplicates (default: 3)')
 
     args = parser.parse_args()
+    if args.cache and args.lazy:
+        parser.error('--cache can not be used with --lazy')
+    if args.check and (args.workers > 1 or args.lazy):
+        parser.error('--check can not be used with --workers or --lazy')
 
     if args.verbose:
         logger.setLevel(logging.DEBUG)
+        ledger_cache.logger.setLevel(logging.DEBUG)
 
-    ledger = import_ledger_file(args.path)
+    stats = ImportStats() if args.profile else None
+    report = ValidationReport() if args.check else None
+    ledger = ColumnarLedger() if args.columnar else Ledger()
+    detector = None
+    if args.duplicates:
+        # lazy transactions are only indexed once the import is done
+        detector = DuplicateDetector(args.duplicate_days)
+        detector.register(ledger.get_plugin_manager(), deferred=args.lazy)
+    ledger = import_ledger_file(args.path, ledger,
+                                workers=args.workers,
+                                cache=args.cache and not args.check,
+                                mapped=args.mapped,
+                                since=args.since, until=args.until,
+                                accounts=args.accounts, lazy=args.lazy,
+                                stats=stats, strict=not args.check,
+                                report=report)
     logger.info(f'Imported {len(ledger.transactions)} transactions')
+    if stats is not None:
+        print(stats.report())
+    if detector is not None:
+        print(detector.format())
+    if report is not None:
+        print(report.format())
+    if (report is not None and not report.ok()) or \
+       (detector is not None and detector.exact_duplicates()):
+        sys.exit(1)
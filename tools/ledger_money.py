@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+from array import array
+from decimal import Decimal
+from itertools import compress
+from typing import Iterable, Union
+
+# decimals with at most this many significant digits
+# convert to and from floats without changing
+_FLOAT_DIGITS = 15
+
+
+class Amount:
+    """An exact decimal amount, stored as an integer `value`
+    scaled by 10 ** `scale` (e.g. 123.45 is 12345 with scale 2).
+
+    Amounts keep the number of decimal places they were written
+    with. Adding, subtracting and multiplying amounts is exact,
+    and amounts that are numerically equal compare and hash as
+    equal (e.g. 1.5 and 1.50), so they can be matched exactly.
+
+    Amounts compare equal to the int or float with the same
+    decimal value (the float's shortest repr, e.g. 123.45), so
+    that plain numbers can be used in place of amounts."""
+    __slots__ = ('value', 'scale')
+
+    def __init__(self, value: Union[int, str], scale: int = 0):
+        if isinstance(value, str):
+            # e.g. Amount('12.50'), like the repr
+            parsed = self.parse(value)
+            value, scale = parsed.value, parsed.scale
+        self.value = value
+        self.scale = scale
+
+    @classmethod
+    def parse(cls, text: str) -> 'Amount':
+        """Parses a decimal number like -1,234.50 without going
+        through float. Raises ValueError if `text` is not one."""
+        number = text.replace(',', '') if ',' in text else text
+        sign = number[:1]
+        if sign == '-' or sign == '+':
+            number = number[1:]
+        whole, _, fraction = number.partition('.')
+        digits = whole + fraction
+        # also rejects a second '.', exponents, spaces and underscores
+        if not digits.isdecimal():
+            raise ValueError(f'Invalid amount {text!r}')
+        value = int(digits)
+        return cls(-value if sign == '-' else value, len(fraction))
+
+    @classmethod
+    def coerce(cls, number: Union['Amount', int, float, str]) -> 'Amount':
+        """Returns `number` as an Amount. Floats are converted
+        using their shortest repr, e.g. 0.1 becomes 0.1 exactly."""
+        if isinstance(number, Amount):
+            return number
+        if isinstance(number, int):
+            return cls(number)
+        if isinstance(number, float):
+            text = repr(number)
+            if 'e' in text or 'E' in text:
+                text = format(Decimal(text), 'f')
+            return cls.parse(text)
+        if isinstance(number, str):
+            return cls.parse(number)
+        raise TypeError(f'Can not convert {type(number).__name__} to Amount')
+
+    def rescale(self, scale: int) -> int:
+        """Returns the value of the amount scaled by 10 ** `scale`,
+        which must not be smaller than the amount's own scale"""
+        if scale < self.scale:
+            raise ValueError(f'Can not rescale {self} to {scale} decimal places')
+        return self.value * 10 ** (scale - self.scale)
+
+    def normalize(self) -> 'Amount':
+        """Returns the amount with trailing zeros removed
+        from its decimal places (e.g. 1.50 becomes 1.5)"""
+        value, scale = self.value, self.scale
+        while scale > 0 and value % 10 == 0:
+            value //= 10
+            scale -= 1
+        return Amount(value, scale)
+
+    def _align(self, other: 'Amount') -> tuple[int, int, int]:
+        if self.scale == other.scale:
+            return self.value, other.value, self.scale
+        scale = max(self.scale, other.scale)
+        return self.rescale(scale), other.rescale(scale), scale
+
+    def _significant_digits(self) -> int:
+        normalized = self.normalize()
+        return len(str(abs(normalized.value)))
+
+    def __float__(self) -> float:
+        return self.value / 10 ** self.scale
+
+    def __bool__(self) -> bool:
+        return self.value != 0
+
+    def __neg__(self) -> 'Amount':
+        return Amount(-self.value, self.scale)
+
+    def __pos__(self) -> 'Amount':
+        return self
+
+    def __abs__(self) -> 'Amount':
+        return self if self.value >= 0 else Amount(-self.value, self.scale)
+
+    def __add__(self, other) -> 'Amount':
+        try:
+            other = Amount.coerce(other)
+        except TypeError:
+            return NotImplemented
+        value, other_value, scale = self._align(other)
+        return Amount(value + other_value, scale)
+
+    __radd__ = __add__
+
+    def __sub__(self, other) -> 'Amount':
+        try:
+            other = Amount.coerce(other)
+        except TypeError:
+            return NotImplemented
+        value, other_value, scale = self._align(other)
+        return Amount(value - other_value, scale)
+
+    def __rsub__(self, other) -> 'Amount':
+        return -self + other
+
+    def __mul__(self, other) -> 'Amount':
+        try:
+            other = Amount.coerce(other)
+        except TypeError:
+            return NotImplemented
+        return Amount(self.value * other.value, self.scale + other.scale)
+
+    __rmul__ = __mul__
+
+    def _compare(self, other) -> Union[int, None]:
+        """Returns the sign of self - other, or None
+        if `other` is not a number"""
+        if not isinstance(other, (Amount, int, float)):
+            return None
+        if isinstance(other, float) and other != other:
+            # NaN
+            return None
+        other = Amount.coerce(other)
+        value, other_value, _ = self._align(other)
+        return (value > other_value) - (value < other_value)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, float) and self._significant_digits() <= _FLOAT_DIGITS:
+            # avoids formatting the float in the common case
+            return float(self) == other
+        result = self._compare(other)
+        return NotImplemented if result is None else result == 0
+
+    def __lt__(self, other) -> bool:
+        result = self._compare(other)
+        return NotImplemented if result is None else result < 0
+
+    def __le__(self, other) -> bool:
+        result = self._compare(other)
+        return NotImplemented if result is None else result <= 0
+
+    def __gt__(self, other) -> bool:
+        result = self._compare(other)
+        return NotImplemented if result is None else result > 0
+
+    def __ge__(self, other) -> bool:
+        result = self._compare(other)
+        return NotImplemented if result is None else result >= 0
+
+    def __hash__(self) -> int:
+        normalized = self.normalize()
+        if normalized.scale == 0:
+            return hash(normalized.value)
+        # an amount equal to a float has to hash like it
+        as_float = float(normalized)
+        if normalized._significant_digits() <= _FLOAT_DIGITS:
+            return hash(as_float)
+        rounded = Amount.coerce(as_float).normalize()
+        if (rounded.value, rounded.scale) == (normalized.value, normalized.scale):
+            return hash(as_float)
+        return hash((normalized.value, normalized.scale))
+
+    def __str__(self) -> str:
+        if self.scale == 0:
+            return str(self.value)
+        digits = str(abs(self.value)).rjust(self.scale + 1, '0')
+        sign = '-' if self.value < 0 else ''
+        return f'{sign}{digits[:-self.scale]}.{digits[-self.scale:]}'
+
+    def __repr__(self) -> str:
+        return f"Amount('{self}')"
+
+    def __format__(self, format_spec: str) -> str:
+        if not format_spec:
+            return str(self)
+        return format(Decimal(str(self.normalize())), format_spec)
+
+    def __reduce__(self):
+        return (Amount, (self.value, self.scale))
+
+
+def sum_by_unit(values: array, unit_ids: array) -> dict[int, int]:
+    """Totals the scaled integer `values` of each unit id in
+    `unit_ids`, which holds the unit of each value. Every value
+    of a unit must be scaled the same way.
+
+    Each unit takes one pass over the arrays in C, so this is
+    fast for the handful of units a ledger uses."""
+    totals = {}
+    for unit_id in set(unit_ids):
+        totals[unit_id] = sum(compress(values, map(unit_id.__eq__, unit_ids)))
+    return totals
+
+
+def sum_amounts(amounts: Iterable[tuple[str, Amount]]) -> dict[str, Amount]:
+    """Totals (unit, amount) pairs exactly, per unit.
+
+    Values are summed as plain integers for each unit and
+    scale, and only brought to a common scale at the end."""
+    totals = {}
+    for unit, amount in amounts:
+        key = (unit, amount.scale)
+        totals[key] = totals.get(key, 0) + amount.value
+
+    by_unit = {}
+    for (unit, scale), value in totals.items():
+        by_unit[unit] = by_unit.get(unit, 0) + Amount(value, scale)
+    return by_unit
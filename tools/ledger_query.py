@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+
+import argparse
+from datetime import date
+import logging
+from operator import eq, ge, gt, itemgetter, le, lt, ne
+import re
+import shlex
+import sys
+from typing import Callable, Iterable, Union
+
+import ledger_cache
+from ledger import Ledger, Transaction, Transfer, date_ordinal, parse_date
+from ledger_columnar import ColumnarLedger
+import ledger_importer
+from ledger_money import Amount, sum_amounts
+
+
+class QuerySyntaxError(Exception):
+    pass
+
+
+# a (transaction, transfer) tuple, as returned by `Ledger.postings`
+Posting = tuple[Transaction, Transfer]
+# a compiled term: checks a posting, given the date
+# ordinal of its transaction (see `Query`)
+Matcher = Callable[[Transaction, Transfer, int], bool]
+
+_COMPARE = {'=': eq, '!=': ne, '<': lt, '<=': le, '>': gt, '>=': ge}
+_FIELD_RE = re.compile(r'(account|payee|date|amount|unit)(<=|>=|!=|=|<|>)(.+)')
+_KEYWORDS = ('and', 'or', 'not', '(', ')')
+
+
+def _compile_regex(pattern: str) -> re.Pattern:
+    try:
+        # case insensitive, like ledger-cli
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise QuerySyntaxError(f'Invalid regex {pattern!r}: {e}')
+
+
+class Term:
+    """A node of a parsed query"""
+    def compile(self) -> Matcher:
+        raise NotImplementedError
+
+
+class AccountTerm(Term):
+    """Postings to an account whose name matches a regex"""
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.regex = _compile_regex(pattern)
+
+    def matches_account(self, account: str) -> bool:
+        return self.regex.search(account) is not None
+
+    def compile(self) -> Matcher:
+        search = self.regex.search
+        return lambda transaction, transfer, ordinal: search(transfer.account) is not None
+
+    def __str__(self) -> str:
+        return f'account={self.pattern}'
+
+
+class PayeeTerm(Term):
+    """Postings of a transaction whose description matches a regex"""
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.regex = _compile_regex(pattern)
+
+    def compile(self) -> Matcher:
+        search = self.regex.search
+        return lambda transaction, transfer, ordinal: search(transaction.description) is not None
+
+    def __str__(self) -> str:
+        return f'payee={self.pattern}'
+
+
+class DateTerm(Term):
+    """Postings of a transaction dated before, on or after a date"""
+    def __init__(self, op: str, day: date):
+        self.op = op
+        self.day = day
+
+    def bounds(self) -> tuple[Union[int, None], Union[int, None]]:
+        """Returns the range of date ordinals (inclusive) the term
+        allows, as a (low, high) tuple. Either can be None."""
+        ordinal = self.day.toordinal()
+        return {'=': (ordinal, ordinal), '<': (None, ordinal - 1), '<=': (None, ordinal),
+                '>': (ordinal + 1, None), '>=': (ordinal, None), '!=': (None, None)}[self.op]
+
+    def compile(self) -> Matcher:
+        compare, target = _COMPARE[self.op], self.day.toordinal()
+        return lambda transaction, transfer, ordinal: compare(ordinal, target)
+
+    def __str__(self) -> str:
+        return f'date{self.op}{self.day:%Y/%m/%d}'
+
+
+class AmountTerm(Term):
+    """Postings with an amount less than, equal to or greater
+    than a number. Postings with no amount never match."""
+    def __init__(self, op: str, amount: Amount):
+        self.op = op
+        self.amount = amount
+
+    def bounds(self) -> tuple[Union[Amount, None], Union[Amount, None]]:
+        """Returns the range of amounts (inclusive, so a little
+        too wide for < and >) the term allows, as a (low, high)
+        tuple. Either can be None."""
+        if self.op == '=':
+            return self.amount, self.amount
+        if self.op in ('<', '<='):
+            return None, self.amount
+        if self.op in ('>', '>='):
+            return self.amount, None
+        return None, None
+
+    def compile(self) -> Matcher:
+        compare, target = _COMPARE[self.op], self.amount
+        return lambda transaction, transfer, ordinal: \
+            transfer.amount is not None and compare(transfer.amount, target)
+
+    def __str__(self) -> str:
+        return f'amount{self.op}{self.amount}'
+
+
+class UnitTerm(Term):
+    """Postings in (or not in) a unit"""
+    def __init__(self, op: str, unit: str):
+        self.op = op
+        self.unit = unit
+
+    def compile(self) -> Matcher:
+        compare, target = _COMPARE[self.op], self.unit
+        return lambda transaction, transfer, ordinal: compare(transfer.unit, target)
+
+    def __str__(self) -> str:
+        return f'unit{self.op}{self.unit}'
+
+
+class Not(Term):
+    def __init__(self, term: Term):
+        self.term = term
+
+    def compile(self) -> Matcher:
+        matcher = self.term.compile()
+        return lambda transaction, transfer, ordinal: not matcher(transaction, transfer, ordinal)
+
+    def __str__(self) -> str:
+        return f'not {self.term}'
+
+
+class And(Term):
+    def __init__(self, terms: list[Term]):
+        self.terms = terms
+
+    def compile(self) -> Matcher:
+        matchers = [term.compile() for term in self.terms]
+        if len(matchers) == 1:
+            return matchers[0]
+        return lambda transaction, transfer, ordinal: \
+            all(matcher(transaction, transfer, ordinal) for matcher in matchers)
+
+    def __str__(self) -> str:
+        return '(' + ' and '.join(map(str, self.terms)) + ')' if self.terms else '(all)'
+
+
+class Or(Term):
+    def __init__(self, terms: list[Term]):
+        self.terms = terms
+
+    def compile(self) -> Matcher:
+        matchers = [term.compile() for term in self.terms]
+        return lambda transaction, transfer, ordinal: \
+            any(matcher(transaction, transfer, ordinal) for matcher in matchers)
+
+    def __str__(self) -> str:
+        return '(' + ' or '.join(map(str, self.terms)) + ')'
+
+
+def _parse_field(field: str, op: str, value: str) -> Term:
+    if field in ('account', 'payee'):
+        if op not in ('=', '!='):
+            raise QuerySyntaxError(f'{field} can only be compared with = or !=')
+        term = AccountTerm(value) if field == 'account' else PayeeTerm(value)
+        return term if op == '=' else Not(term)
+    if field == 'unit':
+        if op not in ('=', '!='):
+            raise QuerySyntaxError('unit can only be compared with = or !=')
+        return UnitTerm(op, value)
+    if field == 'date':
+        try:
+            return DateTerm(op, parse_date(value))
+        except ValueError:
+            raise QuerySyntaxError(f'Invalid date {value!r}, expected YYYY/MM/DD')
+    try:
+        return AmountTerm(op, Amount.parse(value))
+    except ValueError:
+        raise QuerySyntaxError(f'Invalid amount {value!r}')
+
+
+class _Parser:
+    """Recursive descent parser for the query language:
+
+        query := or_expr
+        or_expr := and_expr ('or' and_expr)*
+        and_expr := unary (['and'] unary)*
+        unary := 'not' unary | '(' or_expr ')' | term
+    """
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self) -> Union[str, None]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise QuerySyntaxError('Unexpected end of query')
+        self.position += 1
+        return token
+
+    def parse(self) -> Term:
+        if not self.tokens:
+            return And([])
+        term = self._or_expr()
+        if self._peek() is not None:
+            raise QuerySyntaxError(f'Unexpected {self._peek()!r}')
+        return term
+
+    def _or_expr(self) -> Term:
+        terms = [self._and_expr()]
+        while self._peek() == 'or':
+            self._next()
+            terms.append(self._and_expr())
+        return terms[0] if len(terms) == 1 else Or(terms)
+
+    def _and_expr(self) -> Term:
+        terms = [self._unary()]
+        while self._peek() not in (None, 'or', ')'):
+            if self._peek() == 'and':
+                self._next()
+            terms.append(self._unary())
+        return terms[0] if len(terms) == 1 else And(terms)
+
+    def _unary(self) -> Term:
+        token = self._next()
+        if token == 'not':
+            return Not(self._unary())
+        if token == '(':
+            term = self._or_expr()
+            if self._next() != ')':
+                raise QuerySyntaxError('Expected )')
+            return term
+        if token in _KEYWORDS:
+            raise QuerySyntaxError(f'Unexpected {token!r}')
+        if token.startswith('@'):
+            return PayeeTerm(token[1:])
+        res = _FIELD_RE.fullmatch(token)
+        if res is not None:
+            return _parse_field(*res.groups())
+        return AccountTerm(token)
+
+
+def _split_parens(token: str) -> list[str]:
+    """Splits the parentheses that group terms off of `token`
+    (e.g. '(Food' or 'Rent)'), leaving the ones that are part
+    of a regex (e.g. '(Food|Rent)')"""
+    opening = closing = 0
+    while token.startswith('(') and token.count('(') > token.count(')'):
+        token = token[1:]
+        opening += 1
+    while token.endswith(')') and token.count(')') > token.count('('):
+        token = token[:-1]
+        closing += 1
+    return ['('] * opening + ([token] if token else []) + [')'] * closing
+
+
+def parse_query(query: Union[str, Iterable[str]]) -> Term:
+    """Parses a query, given as a string or as a list of terms
+    (e.g. command line arguments). Terms are matched against
+    each posting:
+
+        REGEX               account name matches REGEX
+        @REGEX              payee (description) matches REGEX
+        account=REGEX, payee=REGEX (or != to negate)
+        date=YYYY/MM/DD     also <, <=, >, >= and !=
+        amount=NUMBER       also <, <=, >, >= and !=
+        unit=UNIT           or unit!=UNIT
+
+    Terms can be combined with `and` (the default), `or`,
+    `not` and parentheses. Regexes are case insensitive, like
+    in ledger-cli.
+
+    Raises QuerySyntaxError if the query is not valid."""
+    tokens = shlex.split(query) if isinstance(query, str) else query
+    return _Parser([part for token in tokens for part in _split_parens(token)]).parse()
+
+
+class QueryPlan:
+    """Where the postings a query checks come from: one of the
+    ledger's indexes, or a scan of every posting"""
+    def __init__(self, index: str, estimate: int, detail: str,
+                 candidates: Callable[[], Iterable[Posting]], by_date: bool = False):
+        # 'date', 'account', 'amount' or 'scan'
+        self.index = index
+        # number of postings expected to be checked
+        self.estimate = estimate
+        self.detail = detail
+        self.candidates = candidates
+        # whether the candidates come in date order
+        self.by_date = by_date
+
+    def __str__(self) -> str:
+        if self.index == 'scan':
+            return f'scan all postings ({self.estimate})'
+        return f'{self.index} index on {self.detail} (~{self.estimate} postings)'
+
+
+def _conjuncts(term: Term) -> list[Term]:
+    return term.terms if isinstance(term, And) else [term]
+
+
+def _account_terms(term: Term) -> Union[list[AccountTerm], None]:
+    """Returns the account terms `term` is a union of, if it is"""
+    if isinstance(term, AccountTerm):
+        return [term]
+    if isinstance(term, Or) and all(isinstance(t, AccountTerm) for t in term.terms):
+        return term.terms
+    return None
+
+
+def _intersect(bounds: Iterable[tuple], low=None, high=None) -> tuple:
+    for term_low, term_high in bounds:
+        if term_low is not None and (low is None or term_low > low):
+            low = term_low
+        if term_high is not None and (high is None or term_high < high):
+            high = term_high
+    return low, high
+
+
+class Query:
+    """A parsed and compiled query (see `parse_query`), which
+    can be run against any number of ledgers.
+
+    Each run is planned against the indexes the ledger has: the
+    date index, the account tree and, if the ledger keeps one,
+    the amount index (see `Ledger.index_amounts`). The index
+    expected to give the fewest postings is used, and the whole
+    query is checked against each of them. Without an index
+    that applies, every posting is scanned.
+
+    If `effective` is set, dates are matched and sorted by the
+    effective date of transactions that have one."""
+    def __init__(self, query: Union[str, Iterable[str], Term], effective: bool = False):
+        self.term = query if isinstance(query, Term) else parse_query(query)
+        self.effective = effective
+        self._matcher = self.term.compile()
+
+    def _ordinal(self, transaction: Transaction) -> Union[int, None]:
+        text = transaction.date
+        if self.effective and transaction.effective_date is not None:
+            text = transaction.effective_date
+        try:
+            return date_ordinal(text)
+        except ValueError:
+            return None
+
+    def plan(self, ledger: Ledger) -> QueryPlan:
+        """Picks where the postings to check come from"""
+        tree = ledger.index_accounts()
+        accounts = tree.accounts()
+        nodes = tree.nodes
+        posting_count = sum(len(nodes[account].postings) for account in accounts)
+        plans = []
+        conjuncts = _conjuncts(self.term)
+
+        date_terms = [t for t in conjuncts if isinstance(t, DateTerm) and t.op != '!=']
+        if date_terms:
+            low, high = _intersect(t.bounds() for t in date_terms)
+            index = ledger.index_dates(self.effective)
+            count = index.count_between(low, high) if low is None or high is None or low <= high else 0
+            start = None if low is None else date.fromordinal(low)
+            end = None if high is None else date.fromordinal(high)
+            estimate = count * posting_count // max(1, len(ledger.transactions))
+            plans.append(QueryPlan(
+                'date', estimate,
+                f'{"..." if start is None else f"{start:%Y/%m/%d}"} to '
+                f'{"..." if end is None else f"{end:%Y/%m/%d}"}',
+                lambda: ((t, tr) for t in ledger.transactions_between(start, end, self.effective)
+                         for tr in t.transfers) if count else (),
+                by_date=True))
+
+        for conjunct in conjuncts:
+            terms = _account_terms(conjunct)
+            if terms is None:
+                continue
+            matching = [account for account in accounts
+                        if any(term.matches_account(account) for term in terms)]
+            plans.append(QueryPlan(
+                'account', sum(len(nodes[account].postings) for account in matching),
+                f'{len(matching)} accounts matching {conjunct}',
+                lambda matching=matching: (posting for account in matching
+                                           for posting in ledger.postings(account, False))))
+
+        amount_terms = [t for t in conjuncts if isinstance(t, AmountTerm) and t.op != '!=']
+        if amount_terms and ledger.amounts is not None:
+            low, high = _intersect(t.bounds() for t in amount_terms)
+            if low is None or high is None or low <= high:
+                plans.append(QueryPlan('amount', ledger.amounts.count(low, high),
+                                       f'{low} to {high}',
+                                       lambda: ledger.postings_between_amounts(low, high)))
+            else:
+                plans.append(QueryPlan('amount', 0, f'{low} to {high}', lambda: ()))
+
+        # an index is used over a scan of the same size
+        plans.append(QueryPlan('scan', posting_count, '',
+                               lambda: ((t, tr) for t in ledger.transactions
+                                        for tr in t.transfers)))
+        return min(plans, key=lambda plan: plan.estimate)
+
+    def postings(self, ledger: Ledger, plan: Union[QueryPlan, None] = None) -> list[Posting]:
+        """Returns the postings of `ledger` matching the query,
+        sorted by date. Postings with the same date come in the
+        order they were added in, unless they are found through
+        the account or amount index. Transactions with an invalid
+        date never match."""
+        if plan is None:
+            plan = self.plan(ledger)
+        matcher = self._matcher
+        matches = []
+        for transaction, transfer in plan.candidates():
+            ordinal = self._ordinal(transaction)
+            if ordinal is not None and matcher(transaction, transfer, ordinal):
+                matches.append((ordinal, transaction, transfer))
+        if not plan.by_date:
+            matches.sort(key=itemgetter(0))
+        return [(transaction, transfer) for _, transaction, transfer in matches]
+
+    def register(self, ledger: Ledger) -> list[tuple[Transaction, Transfer, Amount]]:
+        """Returns the matching postings (see `postings`), each
+        with the running total of its unit, like ledger-cli's
+        `register` report. Postings with no amount are left out."""
+        rows = []
+        totals = {}
+        for transaction, transfer in self.postings(ledger):
+            if transfer.amount is None:
+                continue
+            total = totals[transfer.unit] = totals.get(transfer.unit, 0) + transfer.amount
+            rows.append((transaction, transfer, total))
+        return rows
+
+    def balance(self, ledger: Ledger) -> dict[str, dict[str, Amount]]:
+        """Returns the total of each unit for each account with a
+        matching posting, sorted by account, like ledger-cli's
+        `balance --flat` report"""
+        amounts = {}
+        for _, transfer in self.postings(ledger):
+            if transfer.amount is not None:
+                amounts.setdefault(transfer.account, []).append((transfer.unit, transfer.amount))
+        return {account: sum_amounts(amounts[account]) for account in sorted(amounts)}
+
+
+def format_amount(amount: Union[Amount, None], unit: Union[str, None]) -> str:
+    """Formats an amount the way it is written in a ledger
+    file, e.g. $-12.50 or 5 FOO"""
+    if amount is None:
+        return ''
+    if unit is None:
+        return str(amount)
+    if len(unit) == 1 and not unit.isalnum():
+        return f'{unit}{amount}'
+    return f'{amount} {unit}'
+
+
+def _print_register(rows: list[tuple[Transaction, Transfer, Amount]], effective: bool) -> None:
+    for transaction, transfer, total in rows:
+        day = transaction.date
+        if effective and transaction.effective_date is not None:
+            day = transaction.effective_date
+        print(f'{day:<10} {transaction.description[:30]:<30} {transfer.account[:34]:<34} '
+              f'{format_amount(transfer.amount, transfer.unit):>14} '
+              f'{format_amount(total, transfer.unit):>14}')
+
+
+def _print_balance(balances: dict[str, dict[str, Amount]]) -> None:
+    for account, totals in balances.items():
+        for unit, total in totals.items():
+            print(f'{format_amount(total, unit):>20}  {account}')
+    print('-' * 20)
+    grand_totals = sum_amounts((unit, total) for totals in balances.values()
+                               for unit, total in totals.items())
+    for unit, total in grand_totals.items():
+        print(f'{format_amount(total, unit):>20}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs a register or balance report on a Ledger file')
+    parser.add_argument('path', type=str, help='Path to Ledger file')
+    parser.add_argument('report', choices=('register', 'reg', 'balance', 'bal'))
+    parser.add_argument('query', nargs='*',
+                        help='Terms to match postings against, e.g. Expenses:Food @Safeway '
+                             'amount>50 date>=2022/01/01 unit=$ (see parse_query)')
+    parser.add_argument('--begin', '-b', type=parse_date,
+                        help='Only report postings on or after this date (YYYY/MM/DD)')
+    parser.add_argument('--end', '-e', type=parse_date,
+                        help='Only report postings on or before this date (YYYY/MM/DD)')
+    parser.add_argument('--effective', action='store_true',
+                        help='Use the effective date of transactions that have one')
+    parser.add_argument('--explain', action='store_true',
+                        help='Print how the query is run before the report')
+    parser.add_argument('--cache', action='store_true',
+                        help='Keep a parse cache next to the file, to load it faster '
+                             'while it does not change')
+    parser.add_argument('--columnar', action='store_true',
+                        help='Store transactions in columns to use less memory')
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+
+    # options can come before, between or after the query terms
+    args = parser.parse_intermixed_args()
+
+    if args.verbose:
+        ledger_importer.logger.setLevel(logging.DEBUG)
+        ledger_cache.logger.setLevel(logging.DEBUG)
+
+    try:
+        term = parse_query(args.query)
+    except QuerySyntaxError as e:
+        parser.error(str(e))
+    if args.begin is not None or args.end is not None:
+        dates = [DateTerm('>=', args.begin)] if args.begin is not None else []
+        dates += [DateTerm('<=', args.end)] if args.end is not None else []
+        term = And(_conjuncts(term) + dates)
+    query = Query(term, effective=args.effective)
+
+    ledger = ledger_importer.import_ledger_file(args.path,
+                                                ColumnarLedger() if args.columnar else None,
+                                                cache=args.cache)
+    for transaction, error in ledger.auto_balance():
+        print(f'warning: {transaction.date} {transaction.description}: {error}', file=sys.stderr)
+
+    if args.explain:
+        print(f'query: {query.term}', file=sys.stderr)
+        print(f'plan: {query.plan(ledger)}', file=sys.stderr)
+    if args.report in ('register', 'reg'):
+        _print_register(query.register(ledger), args.effective)
+    else:
+        _print_balance(query.balance(ledger))
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+
+from array import array
+from bisect import bisect_left
+from datetime import date
+from itertools import chain
+import mmap
+from typing import Iterator, Union
+
+from ledger import Ledger, Transaction, date_ordinal
+from ledger_money import Amount
+
+
+# amounts on bank statements are in cents
+CENTS = 2
+
+# limits of the search for split transactions (see `match_splits`)
+MAX_SPLIT_SIZE = 4
+MAX_SPLIT_CANDIDATES = 40
+SPLIT_SEARCH_BUDGET = 500
+SPLIT_TOTAL_BUDGET = 500000
+
+
+def cents(amount: Amount) -> Union[int, None]:
+    """Returns the absolute value of `amount` in integer cents,
+    or None if it has fractions of a cent (e.g. a share count)"""
+    amount = abs(amount)
+    if amount.scale > CENTS:
+        amount = amount.normalize()
+        if amount.scale > CENTS:
+            return None
+    return amount.rescale(CENTS)
+
+
+class BankTransaction:
+    """A row of a bank statement.
+
+    The row's text can be given as `raw`, or as the byte offsets
+    `span` of the row in `data` (e.g. a memory-mapped statement),
+    in which case it is only copied out when asked for."""
+    def __init__(self, amount: Amount, date: Union[date, None] = None,
+                 description: str = '', raw: str = '',
+                 data: Union[bytes, mmap.mmap, None] = None, span: tuple[int, int] = (0, 0)):
+        self.amount = amount
+        self.date = date
+        self.description = description
+        self._raw = raw
+        self._data = data
+        self._span = span
+
+    @property
+    def raw_bytes(self) -> bytes:
+        if self._data is None:
+            return self._raw.encode('utf-8')
+        start, end = self._span
+        return self._data[start:end]
+
+    @property
+    def raw(self) -> str:
+        if self._data is None:
+            return self._raw
+        return self.raw_bytes.decode('utf-8', errors='replace')
+
+    def __repr__(self) -> str:
+        return f'BankTransaction({self.amount!r}, {self.date!r}, {self.description!r})'
+
+
+class Match:
+    """A bank transaction and the ledger posting it was matched to"""
+    def __init__(self, bank_transaction: BankTransaction, transaction: Transaction,
+                 account: str, amount: Amount, days: Union[int, None]):
+        self.bank_transaction = bank_transaction
+        self.transaction = transaction
+        self.account = account
+        self.amount = amount
+        # days between the bank and ledger dates, None if the bank has no date
+        self.days = days
+
+
+class SplitMatch:
+    """Bank transactions and ledger postings that add up to the same
+    amount, where one side is a single bank transaction or posting"""
+    def __init__(self, bank_transactions: list[BankTransaction],
+                 postings: list[tuple[Transaction, str, Amount]]):
+        self.bank_transactions = bank_transactions
+        # (transaction, account, amount) of each posting
+        self.postings = postings
+
+
+class PostingIndex:
+    """Indexes the postings of a ledger by their amount in cents, so
+    each bank transaction is only compared with the postings of the
+    same amount. Built once, and reused for every statement.
+
+    If `account` is given, only postings to it (or its subaccounts)
+    are indexed, each on its own. Otherwise every transaction is
+    indexed once for each distinct amount it moves, so the two sides
+    of a transfer do not match two bank transactions.
+
+    Amounts are compared without their sign, since banks and card
+    issuers differ in which way round they write charges."""
+    def __init__(self, ledger: Ledger, account: Union[str, None] = None):
+        self.account = account
+        # candidates are referred to by their position
+        self.transactions = []
+        self.accounts = []
+        self.amounts = []
+        self.ordinals = array('l')
+        # cents -> positions of candidates, sorted by date
+        self.buckets = {}
+
+        if account is None:
+            transactions = ledger.transactions
+        else:
+            # a transaction can post to the account more than once.
+            # the views of a ColumnarLedger are new objects on each
+            # lookup, but views of the same transaction are equal
+            transactions = list(dict.fromkeys(transaction
+                                              for transaction, _ in ledger.postings(account)))
+        for transaction in transactions:
+            self._add(transaction)
+        ordinals = self.ordinals
+        for positions in self.buckets.values():
+            positions.sort(key=ordinals.__getitem__)
+
+    def _in_account(self, account: str) -> bool:
+        return (self.account is None or account == self.account
+                or account.startswith(self.account + ':'))
+
+    def _add(self, transaction: Transaction) -> None:
+        # banks clear transactions on their effective date, if there is one
+        try:
+            ordinal = date_ordinal(transaction.effective_date or transaction.date)
+        except ValueError:
+            return
+        seen = set()
+        for account, _, amount in transaction.posted_amounts():
+            if not self._in_account(account):
+                continue
+            key = cents(amount)
+            if key is None or key == 0:
+                continue
+            if self.account is None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            self.buckets.setdefault(key, []).append(len(self.transactions))
+            self.transactions.append(transaction)
+            self.accounts.append(account)
+            self.amounts.append(amount)
+            self.ordinals.append(ordinal)
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+
+class Reconciliation:
+    """The result of matching a statement against a ledger"""
+    def __init__(self, matched: list[Match], suspect: list[Match],
+                 missing: list[BankTransaction], index: PostingIndex, used: bytearray):
+        # matched within the date window
+        self.matched = matched
+        # matched by amount, but too far off in date
+        self.suspect = suspect
+        # no posting of the same amount left
+        self.missing = missing
+        # found by `match_splits`
+        self.splits = []
+        # the posting most like each of some missing bank
+        # transactions, found if `reconcile` is given a ranker
+        self.suggestions = []
+        self._index = index
+        self._used = used
+
+    def _unmatched_positions(self) -> list[int]:
+        return [position for position, used in enumerate(self._used) if not used]
+
+    def unmatched_postings(self) -> list[tuple[Transaction, str, Amount]]:
+        """Returns the (transaction, account, amount) of each indexed
+        posting no bank transaction was matched to"""
+        index = self._index
+        return [(index.transactions[position], index.accounts[position], index.amounts[position])
+                for position in self._unmatched_positions()]
+
+    def format(self) -> str:
+        """Describes the result, for the command line"""
+        lines = []
+        suggestions = {id(match.bank_transaction): match for match in self.suggestions}
+        for bank_transaction in self.missing:
+            lines.append(f'MISSING: {bank_transaction.amount} => {bank_transaction.raw}')
+            suggestion = suggestions.get(id(bank_transaction))
+            if suggestion is not None:
+                days = '' if suggestion.days is None else f', {suggestion.days} days off'
+                lines.append(f'    closest: {suggestion.transaction.date} '
+                             f'{suggestion.transaction.description} ({suggestion.amount}{days})')
+        for match in self.suspect:
+            lines.append(f'SUSPECT DATE: {match.bank_transaction.amount} => '
+                         f'{match.bank_transaction.raw} (ledger: {match.transaction.date} '
+                         f'{match.transaction.description}, {match.days} days off)')
+        for split in self.splits:
+            lines.append('SPLIT: ' + ' + '.join(str(bank_transaction.amount)
+                                                for bank_transaction in split.bank_transactions)
+                         + ' => ' + ' + '.join(f'{amount} ({transaction.date} '
+                                               f'{transaction.description})'
+                                               for transaction, _, amount in split.postings))
+        splits = f', {len(self.splits)} split' if self.splits else ''
+        lines.append(f'Matched {len(self.matched)} transactions{splits}, {len(self.suspect)} '
+                     f'with suspect dates, {len(self.missing)} missing')
+        return '\n'.join(lines)
+
+
+def _closest(positions: list[int], ordinals: array, used: bytearray,
+             ordinal: Union[int, None], days: Union[int, None]) -> Union[int, None]:
+    """Returns the unused position whose date is closest to `ordinal`
+    and at most `days` away (any distance if `days` is None)"""
+    if ordinal is None:
+        # no date to compare with, take the earliest unused posting
+        for position in positions:
+            if not used[position]:
+                return position
+        return None
+    after = bisect_left(positions, ordinal, key=ordinals.__getitem__)
+    before = after - 1
+    while before >= 0 and used[positions[before]]:
+        before -= 1
+    while after < len(positions) and used[positions[after]]:
+        after += 1
+    best = None
+    if before >= 0:
+        best = positions[before]
+    if after < len(positions):
+        candidate = positions[after]
+        if best is None or ordinals[candidate] - ordinal < ordinal - ordinals[best]:
+            best = candidate
+    if best is None or (days is not None and abs(ordinals[best] - ordinal) > days):
+        return None
+    return best
+
+
+def _unused_within(positions: list[int], ordinals: array, used: bytearray,
+                   ordinal: Union[int, None], days: Union[int, None]) -> list[int]:
+    """Returns the unused positions at most `days` away from `ordinal`
+    (all of them if either is None)"""
+    if ordinal is not None and days is not None:
+        positions = positions[bisect_left(positions, ordinal - days, key=ordinals.__getitem__):
+                              bisect_left(positions, ordinal + days + 1, key=ordinals.__getitem__)]
+    return [position for position in positions if not used[position]]
+
+
+def _match(index: PostingIndex, used: bytearray, rows: list[tuple],
+           days: Union[int, None], ranker=None) -> tuple[list[Match], list[tuple]]:
+    """Matches each of `rows` to the closest unused posting within
+    `days` days, returning the matches and the rows left over.
+
+    If a `ranker` is given, bank transactions with a description
+    are matched to the posting it scores highest instead."""
+    buckets = index.buckets
+    ordinals = index.ordinals
+    matches = []
+    left_over = []
+    for row in rows:
+        bank_transaction, key, ordinal = row
+        positions = buckets.get(key)
+        if positions is None:
+            position = None
+        elif ranker is not None and bank_transaction.description:
+            position = ranker.best(bank_transaction,
+                                   _unused_within(positions, ordinals, used, ordinal, days))
+        else:
+            position = _closest(positions, ordinals, used, ordinal, days)
+        if position is None:
+            left_over.append(row)
+            continue
+        used[position] = 1
+        matches.append(Match(bank_transaction, index.transactions[position],
+                             index.accounts[position], index.amounts[position],
+                             None if ordinal is None else abs(ordinals[position] - ordinal)))
+    return matches, left_over
+
+
+def reconcile(index: PostingIndex, bank_transactions: list[BankTransaction],
+              days: int = 3, ranker=None) -> Reconciliation:
+    """Matches each bank transaction to a posting of the same amount,
+    at most once each. A posting within `days` days is a match. Bank
+    transactions left over are then matched to the closest remaining
+    posting of the same amount as suspect, or are missing.
+
+    If a `ranker` for `index` is given (see
+    `ledger_descriptions.CandidateRanker`), postings of the same
+    amount are told apart by their description as well as their
+    date, and the best remaining posting of any amount is suggested
+    for each missing bank transaction.
+
+    Takes time roughly linear in the number of bank transactions,
+    unless many postings share an amount."""
+    used = bytearray(len(index))
+    rows = []
+    for bank_transaction in bank_transactions:
+        bank_date = bank_transaction.date
+        rows.append((bank_transaction, cents(bank_transaction.amount),
+                     None if bank_date is None else bank_date.toordinal()))
+    # bank transactions are matched in date order, so when several
+    # share an amount each takes the posting closest to its own date
+    rows.sort(key=lambda row: -1 if row[2] is None else row[2])
+
+    # postings within the window are all taken before any suspect
+    # match can take one a later bank transaction would have matched
+    matched, rows = _match(index, used, rows, days, ranker)
+    suspect, rows = _match(index, used, rows, None, ranker)
+    missing = [bank_transaction for bank_transaction, _, _ in rows]
+
+    order = {id(bank_transaction): i for i, bank_transaction in enumerate(bank_transactions)}
+    matched.sort(key=lambda match: order[id(match.bank_transaction)])
+    suspect.sort(key=lambda match: order[id(match.bank_transaction)])
+    missing.sort(key=lambda bank_transaction: order[id(bank_transaction)])
+    reconciliation = Reconciliation(matched, suspect, missing, index, used)
+    if ranker is not None:
+        for bank_transaction, _, ordinal in rows:
+            ranked = ranker.rank(bank_transaction, limit=1, used=used)
+            if ranked:
+                position = ranked[0][1]
+                reconciliation.suggestions.append(
+                    Match(bank_transaction, index.transactions[position], index.accounts[position],
+                          index.amounts[position],
+                          None if ordinal is None else abs(index.ordinals[position] - ordinal)))
+    return reconciliation
+
+
+def reconcile_ledger(ledger: Ledger, bank_transactions: list[BankTransaction],
+                     account: Union[str, None] = None, days: int = 3) -> Reconciliation:
+    """Indexes `ledger` (see `PostingIndex`) and reconciles
+    `bank_transactions` against it (see `reconcile`)"""
+    return reconcile(PostingIndex(ledger, account), bank_transactions, days)
+
+
+def _find_subset(target: int, candidates: list[tuple[int, int]], max_size: int,
+                 budget: int) -> tuple[Union[list[int], None], int]:
+    """Returns the ids of the smallest set (of 2 to `max_size`) of
+    `candidates`, given as (cents, id), whose cents add up to
+    `target`, and how many partial sets were tried, giving up
+    after `budget`.
+
+    Candidates are tried largest first, and a partial set is dropped
+    as soon as the rest can not reach `target`. The last candidate
+    of a set is looked up by the cents it needs, instead of being
+    searched for."""
+    candidates = sorted(candidate for candidate in candidates if 0 < candidate[0] < target)
+    candidates.reverse()
+    if len(candidates) < 2:
+        return None, 0
+    # cents -> positions in `candidates`, in ascending order
+    by_cents = {}
+    for position, (amount, _) in enumerate(candidates):
+        by_cents.setdefault(amount, []).append(position)
+    count = len(candidates)
+    tried = 0
+
+    def search(start: int, remaining: int, size: int) -> Union[list[int], None]:
+        nonlocal tried
+        if size == 1:
+            for position in by_cents.get(remaining, ()):
+                if position >= start:
+                    return [position]
+            return None
+        for position in range(start, count - size + 1):
+            tried += 1
+            if tried > budget:
+                return None
+            amount = candidates[position][0]
+            if amount >= remaining:
+                continue
+            # the candidates left are no larger than this one
+            if amount * size < remaining:
+                break
+            found = search(position + 1, remaining - amount, size - 1)
+            if found is not None:
+                return [position] + found
+        return None
+
+    for size in range(2, max_size + 1):
+        found = search(0, target, size)
+        if found is not None:
+            return [candidates[position][1] for position in found], tried
+        if tried > budget:
+            break
+    return None, tried
+
+
+def _closest_first(items: list[tuple], ordinals: list[int], ordinal: int,
+                   days: int) -> Iterator[tuple]:
+    """Yields the `items` at most `days` away from `ordinal`,
+    closest first, given their sorted `ordinals`"""
+    after = bisect_left(ordinals, ordinal)
+    before = after - 1
+    count = len(items)
+    while True:
+        before_days = ordinal - ordinals[before] if before >= 0 else days + 1
+        after_days = ordinals[after] - ordinal if after < count else days + 1
+        if before_days > days and after_days > days:
+            return
+        if before_days <= after_days:
+            yield items[before]
+            before -= 1
+        else:
+            yield items[after]
+            after += 1
+
+
+def _split(targets: list[tuple[int, Union[int, None], int]],
+           items: list[tuple[int, Union[int, None], int]], days: int, max_size: int,
+           max_candidates: int, budget: int,
+           total_budget: int) -> tuple[list[tuple[int, list[int]]], int]:
+    """Finds sets of `items` that add up to one of `targets`, both
+    given as (cents, ordinal, id), taking each item at most once.
+    Only the `max_candidates` items closest in date (and at most
+    `days` away) are considered for each target.
+
+    Returns the sets found for each target and the number of partial
+    sets tried, stopping once `total_budget` have been."""
+    # amounts with fractions of a cent (None) are never split
+    items = [item for item in items if item[0] is not None]
+    dated = sorted((item for item in items if item[1] is not None), key=lambda item: item[1])
+    ordinals = [item[1] for item in dated]
+    undated = [item for item in items if item[1] is None]
+    used = set()
+    found = []
+    targets = sorted((target for target in targets if target[0] is not None),
+                     key=lambda target: target[1] or 0)
+    tried = 0
+    for target_cents, ordinal, target_id in targets:
+        if tried >= total_budget:
+            break
+        candidates = []
+        if ordinal is None:
+            nearby = dated
+        else:
+            nearby = _closest_first(dated, ordinals, ordinal, days)
+        for amount, _, item_id in chain(nearby, undated):
+            if amount < target_cents and item_id not in used:
+                candidates.append((amount, item_id))
+                if len(candidates) == max_candidates:
+                    break
+        subset, target_tried = _find_subset(target_cents, candidates, max_size,
+                                            min(budget, total_budget - tried))
+        tried += target_tried
+        if subset is not None:
+            used.update(subset)
+            found.append((target_id, subset))
+    return found, tried
+
+
+def match_splits(reconciliation: Reconciliation, days: int = 3,
+                 max_size: int = MAX_SPLIT_SIZE, max_candidates: int = MAX_SPLIT_CANDIDATES,
+                 budget: int = SPLIT_SEARCH_BUDGET,
+                 total_budget: int = SPLIT_TOTAL_BUDGET) -> list[SplitMatch]:
+    """Matches missing bank transactions that the ledger records as
+    several postings (e.g. one charge entered as two transactions),
+    and the other way round, within `days` days. Matched bank
+    transactions and postings are taken out of `reconciliation`,
+    and the matches are added to its `splits`.
+
+    Sets have at most `max_size` members, drawn from the
+    `max_candidates` closest in date. At most `budget` sets are
+    tried for each bank transaction or posting, and `total_budget`
+    in all, so that many rows left over after `reconcile` are still
+    matched in seconds."""
+    index = reconciliation._index
+    splits = []
+
+    def posting(position):
+        return index.transactions[position], index.accounts[position], index.amounts[position]
+
+    def bank_row(i):
+        bank_transaction = reconciliation.missing[i]
+        bank_date = bank_transaction.date
+        return (cents(bank_transaction.amount),
+                None if bank_date is None else bank_date.toordinal(), i)
+
+    # bank transactions entered as several postings
+    postings = [(cents(index.amounts[position]), index.ordinals[position], position)
+                for position in reconciliation._unmatched_positions()]
+    rows = [bank_row(i) for i in range(len(reconciliation.missing))]
+    matched_rows = set()
+    found, tried = _split(rows, postings, days, max_size, max_candidates, budget, total_budget)
+    for i, positions in found:
+        for position in positions:
+            reconciliation._used[position] = 1
+        matched_rows.add(i)
+        splits.append(SplitMatch([reconciliation.missing[i]],
+                                 [posting(position) for position in positions]))
+
+    # postings paid in several bank transactions, only looked
+    # for in the dates the bank transactions left over span
+    rows = [bank_row(i) for i in range(len(reconciliation.missing)) if i not in matched_rows]
+    if not rows:
+        postings = []
+    elif any(ordinal is None for _, ordinal, _ in rows):
+        postings = [(cents(index.amounts[position]), index.ordinals[position], position)
+                    for position in reconciliation._unmatched_positions()]
+    else:
+        first = min(ordinal for _, ordinal, _ in rows) - days
+        last = max(ordinal for _, ordinal, _ in rows) + days
+        ordinals = index.ordinals
+        postings = [(cents(index.amounts[position]), ordinals[position], position)
+                    for position in reconciliation._unmatched_positions()
+                    if first <= ordinals[position] <= last]
+    found, _ = _split(postings, rows, days, max_size, max_candidates, budget,
+                      total_budget - tried)
+    for position, row_ids in found:
+        reconciliation._used[position] = 1
+        matched_rows.update(row_ids)
+        splits.append(SplitMatch([reconciliation.missing[i] for i in sorted(row_ids)],
+                                 [posting(position)]))
+
+    reconciliation.missing = [bank_transaction
+                              for i, bank_transaction in enumerate(reconciliation.missing)
+                              if i not in matched_rows]
+    reconciliation.splits.extend(splits)
+    return splits
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import logging
+from operator import is_
+import os
+import sys
+import threading
+import time
+from typing import Union
+
+from ledger import Ledger
+import ledger_importer
+
+
+logger = logging.getLogger(__name__)
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+logger.addHandler(handler)
+
+
+class LedgerSnapshot:
+    """One published version of a ledger.
+
+    The ledger is frozen (see `Ledger.freeze`), so it never
+    changes and can be read from any number of threads while
+    newer versions are built."""
+    def __init__(self, version: int, ledger: Ledger):
+        self.version = version
+        self.ledger = ledger
+        # time.time() when the version was published
+        self.published = time.time()
+
+
+class LedgerStore:
+    """Publishes versions of a ledger to readers in other threads.
+
+    Readers call `snapshot` to get the current version and can
+    keep using it for as long as they need. Publishing a new
+    version never changes one that was already handed out, so
+    readers never see a ledger that is still being built. Taking
+    a snapshot only reads a reference and never waits.
+
+    `refresh` re-imports a file into a new version. Versions share
+    as much as they can: blocks of the file that did not change
+    reuse their transactions from the last import, and if the file
+    was only appended to, the new version is a fork of the current
+    one (see `Ledger.fork`) so the entries of its indexes are
+    shared too. Memory grows with what changed, and the old
+    version is freed once no reader holds on to it.
+
+    If `index_amounts` is set, amounts are indexed before each
+    version is published, so readers can look postings up by
+    amount (see `Ledger.postings_between_amounts`)."""
+    def __init__(self, index_amounts: bool = False):
+        self.index_amounts = index_amounts
+        self._current = None
+        # versions are numbered in the order they are published
+        self._publish_lock = threading.Lock()
+        # refreshes share the import manifest of the file
+        self._refresh_lock = threading.Lock()
+
+    def snapshot(self) -> Union[LedgerSnapshot, None]:
+        """Returns the current version, or None if nothing
+        has been published yet"""
+        # reading an attribute is atomic
+        return self._current
+
+    def publish(self, ledger: Ledger) -> LedgerSnapshot:
+        """Freezes `ledger` and makes it the current version"""
+        if self.index_amounts:
+            ledger.index_amounts()
+        ledger.freeze()
+        with self._publish_lock:
+            version = 1 if self._current is None else self._current.version + 1
+            snapshot = LedgerSnapshot(version, ledger)
+            self._current = snapshot
+        logger.debug(f'Published version {version} with {len(ledger.transactions)} transactions')
+        return snapshot
+
+    def refresh(self, path: Union[str, os.PathLike]) -> LedgerSnapshot:
+        """Imports `path` incrementally (see `import_ledger_file`),
+        fills in the amounts left blank in new transactions and
+        publishes the result as a new version.
+
+        Meant to run in a background thread while readers use the
+        current version. Other incremental imports of the same
+        path should not run at the same time."""
+        with self._refresh_lock:
+            transactions = ledger_importer.read_ledger_file(path, incremental=True)
+            previous = self._current
+            ledger = None
+            if previous is not None:
+                known = previous.ledger.transactions
+                if len(transactions) >= len(known) and all(map(is_, transactions, known)):
+                    # only appended to, so only the new transactions are added
+                    ledger = previous.ledger.fork()
+                    transactions = transactions[len(known):]
+            if ledger is None:
+                ledger = Ledger()
+
+            # transactions reused from earlier versions were filled
+            # in before they were published. filling in is a no-op
+            # for them, so readers of those versions see no change
+            for transaction in transactions:
+                transaction.fill_amount()
+            ledger.add_transactions(transactions)
+            return self.publish(ledger)
@@ -1,9 +1,180 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import gc
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+from typing import Union
+
+from bank_transaction_import_helper import BankTransactionProfile, \
+    import_bank_transaction_profile, iter_bank_transactions
+import ledger_cache
+from ledger import Ledger
+from ledger_descriptions import CandidateRanker
+import ledger_importer
+from ledger_reconcile import PostingIndex, match_splits, reconcile
+
+
+logger = logging.getLogger(__name__)
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.DEBUG)
+logger.addHandler(handler)
+
+
+DEFAULT_CONFIG = '~/.ledgerweb/bank_config.yml'
+
+# the posting index (and description ranker) of each bank account
+# being reviewed, set before the worker processes are forked so that
+# they share the indexes (and the ledger they refer to) instead of
+# each receiving a copy
+_indexes = {}
+_rankers = {}
+
+
+class StatementReport:
+    """What reconciling one statement found. Only counts and the
+    report text are sent back from the worker that made it."""
+    def __init__(self, bank: str, path: str, matched: int, splits: int,
+                 suspect: int, missing: int, text: str):
+        self.bank = bank
+        self.path = path
+        self.matched = matched
+        self.splits = splits
+        self.suspect = suspect
+        self.missing = missing
+        self.text = text
+
+
+def statement_paths(bank_profile: BankTransactionProfile) -> list[str]:
+    """Returns the statement files of a bank, expanding ~ and
+    glob patterns (e.g. ~/statements/chase/*.csv)"""
+    paths = []
+    for pattern in bank_profile.statements:
+        pattern = os.path.expanduser(pattern)
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            logger.warning(f'No statements found for {bank_profile.bank_alias} at {pattern}')
+        paths.extend(matches)
+    return paths
+
+
+def review_statement(bank_profile: BankTransactionProfile, path: str, days: int = 3,
+                     splits: bool = True) -> StatementReport:
+    """Reconciles the statement at `path` against the index of
+    the bank's account. Runs in a worker process."""
+    reconciliation = reconcile(_indexes[bank_profile.account],
+                               list(iter_bank_transactions(path, bank_profile)), days,
+                               _rankers.get(bank_profile.account))
+    if splits:
+        match_splits(reconciliation, days)
+    return StatementReport(bank_profile.bank_alias, path, len(reconciliation.matched),
+                           len(reconciliation.splits), len(reconciliation.suspect),
+                           len(reconciliation.missing), reconciliation.format())
+
+
+def review(ledger: Ledger, bank_profiles: list[BankTransactionProfile], days: int = 3,
+           splits: bool = True, workers: Union[int, None] = None,
+           descriptions: bool = True) -> list[StatementReport]:
+    """Reconciles every statement of each of `bank_profiles` against
+    `ledger`, in the order the banks and their statements are listed.
+
+    The ledger is indexed once for each bank account (along with its
+    descriptions, for banks whose statements have a description
+    column, unless `descriptions` is False), then each
+    statement is reconciled in its own worker process (at most
+    `workers`, one for each statement by default). Workers are
+    forked, so they share the ledger and its indexes copy-on-write;
+    where processes can not be forked, statements are reconciled
+    one after the other."""
+    tasks = [(bank_profile, path) for bank_profile in bank_profiles
+             for path in statement_paths(bank_profile)]
+    _indexes.clear()
+    _rankers.clear()
+    for bank_profile in bank_profiles:
+        account = bank_profile.account
+        if account not in _indexes:
+            _indexes[account] = PostingIndex(ledger, account)
+        if descriptions and bank_profile.description is not None and account not in _rankers:
+            _rankers[account] = CandidateRanker(_indexes[account], days)
+
+    if workers is None:
+        workers = min(len(tasks), os.cpu_count() or 1)
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [review_statement(bank_profile, path, days, splits) for bank_profile, path in tasks]
+
+    # the collector would otherwise write to (and so copy) every page
+    # holding the ledger in each worker the first time it runs there
+    gc.freeze()
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context('fork')) as executor:
+            futures = [executor.submit(review_statement, bank_profile, path, days, splits)
+                       for bank_profile, path in tasks]
+            return [future.result() for future in futures]
+    finally:
+        gc.unfreeze()
+
+
+def format_reports(reports: list[StatementReport]) -> str:
+    """Merges the reports of each statement into one"""
+    lines = []
+    for report in reports:
+        lines.append(f'== {report.bank}: {report.path}')
+        lines.append(report.text)
+    banks = len({report.bank for report in reports})
+    lines.append(f'Reviewed {len(reports)} statements from {banks} banks: '
+                 f'{sum(report.matched for report in reports)} matched, '
+                 f'{sum(report.splits for report in reports)} split, '
+                 f'{sum(report.suspect for report in reports)} with suspect dates, '
+                 f'{sum(report.missing for report in reports)} missing')
+    return '\n'.join(lines)
+
 
 def main():
-    parser = argparse.ArgumentParser(description='')
+    parser = argparse.ArgumentParser(description='Reviews the statements of every bank in the '
+                                                 'bank config for transactions missing from a '
+                                                 'Ledger file')
+    parser.add_argument('path', type=str, help='Path to Ledger file')
+    parser.add_argument('--config', default=DEFAULT_CONFIG,
+                        help=f'Path to the bank config (default: {DEFAULT_CONFIG})')
+    parser.add_argument('--bank', action='append', dest='banks',
+                        help='Only review this bank (can be given more than once)')
+    parser.add_argument('--days', type=int, default=3,
+                        help='Days a bank transaction can be off from the ledger (default: 3)')
+    parser.add_argument('--no-splits', dest='splits', action='store_false',
+                        help='Do not look for transactions split into several')
+    parser.add_argument('--no-descriptions', dest='descriptions', action='store_false',
+                        help='Only match transactions by amount and date')
+    parser.add_argument('--workers', '-j', type=int,
+                        help='Number of worker processes (default: one for each statement)')
+    parser.add_argument('--cache', action='store_true',
+                        help='Keep a parse cache next to the file, to load it faster '
+                             'while it does not change')
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    args = parser.parse_args()
+
+    if args.verbose:
+        ledger_importer.logger.setLevel(logging.DEBUG)
+        ledger_cache.logger.setLevel(logging.DEBUG)
+
+    profiles = import_bank_transaction_profile(os.path.expanduser(args.config))
+    if args.banks:
+        unknown = [bank for bank in args.banks if bank not in profiles]
+        if unknown:
+            parser.error(f'unknown bank: {", ".join(unknown)}')
+        profiles = {bank: profiles[bank] for bank in args.banks}
+
+    ledger = ledger_importer.import_ledger_file(args.path, cache=args.cache)
+    reports = review(ledger, list(profiles.values()), args.days, args.splits, args.workers,
+                     args.descriptions)
+    print(format_reports(reports))
+    if any(report.missing or report.suspect for report in reports):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
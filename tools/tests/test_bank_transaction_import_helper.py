@@ -1,7 +1,14 @@
+from datetime import date
+import os
+import sys
+import tempfile
 import unittest
 from unittest import mock
 
-import bank_transaction_import_helper as bank_tx_helper
+sys.path.append('..')
+
+import bank_transaction_import_helper as bank_tx_helper  # noqa
+from ledger_money import Amount  # noqa
 
 
 class TestBankTransactionImportHelper(unittest.TestCase):
@@ -36,10 +43,47 @@ banks:
         self.assertEqual(bank_profile2.credit_amount, 2)
         self.assertEqual(bank_profile2.debit_amount, 3)
 
-#     @mock.patch('bank_transaction_import_helper.open')
-#     def test_import_bank_transactions(self, mock_open):
-#         mock_open.return_value.__enter__.return_value = iter("""\
-# header_1, header_2, header_3
-# a, b, c
-# 1, 2, 3""".split('\n'))
-#         bank_tx_helper.import_bank_transactions('fake_transactions.csv', )
+    def _write_statement(self, data: bytes) -> str:
+        f = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        self.addCleanup(os.remove, f.name)
+        with f:
+            f.write(data)
+        return f.name
+
+    def test_import_bank_transactions(self):
+        path = self._write_statement(
+            b'\xef\xbb\xbfDate,Description,Credit,Debit\r\n'
+            b'07/16/2022,SAFEWAY #1234,,42.50\r\n'
+            b'07/18/2022,"Rent, July",,"1,200.00"\r\n'
+            b'\r\n'
+            b'07/20/2022,"Refund\r\nline two",5.00,\r\n')
+        profile = bank_tx_helper.BankTransactionProfile('my_credit_card', credit_amount=2,
+                                                        debit_amount=3, date=0, description=1)
+
+        bank_transactions = bank_tx_helper.import_bank_transactions(path, profile)
+
+        self.assertEqual([(t.amount, t.date, t.description) for t in bank_transactions],
+                         [(Amount('-42.50'), date(2022, 7, 16), 'SAFEWAY #1234'),
+                          (-1200, date(2022, 7, 18), 'Rent, July'),
+                          (5, date(2022, 7, 20), 'Refund\r\nline two')])
+        self.assertEqual([t.raw for t in bank_transactions],
+                         ['07/16/2022,SAFEWAY #1234,,42.50',
+                          '07/18/2022,"Rent, July",,"1,200.00"',
+                          '07/20/2022,"Refund\r\nline two",5.00,'])
+        self.assertEqual(bank_transactions[1].raw_bytes, b'07/18/2022,"Rent, July",,"1,200.00"')
+
+    def test_iter_bank_transactions(self):
+        path = self._write_statement(b'Amount,Posted\n-5.00,2022-07-01\n+12,2022-07-02')
+        profile = bank_tx_helper.BankTransactionProfile('mybank', amount=0, date=1,
+                                                        date_format='%Y-%m-%d')
+
+        bank_transactions = bank_tx_helper.iter_bank_transactions(path, profile)
+
+        self.assertEqual(next(bank_transactions).amount, Amount('-5.00'))
+        last = next(bank_transactions)
+        self.assertEqual((last.amount, last.date, last.description, last.raw),
+                         (12, date(2022, 7, 2), '', '+12,2022-07-02'))
+        self.assertIsNone(next(bank_transactions, None))
+
+        self.assertEqual(list(bank_tx_helper.iter_bank_transactions(self._write_statement(b''),
+                                                                    profile)), [])
@@ -0,0 +1,327 @@
+from datetime import date
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger import AccountTree, DateIndex, FrozenLedgerError, Ledger, LedgerListenerType, \
+    LedgerPluginManager, Transaction, Transfer  # noqa
+from ledger_money import Amount  # noqa
+
+
+class TestLedger(unittest.TestCase):
+
+    def test_validate_transaction(self):
+        transaction = Transaction('2022/07/16', 'Balanced',
+                                  [Transfer('Expenses:Clothing', 17.5, '$'),
+                                   Transfer('Assets:MyBank:Checking', -17.5, '$')])
+        self.assertTrue(transaction.validate())
+
+        transaction = Transaction('2022/07/16', 'Elided amount',
+                                  [Transfer('Expenses:Clothing', 17.5, '$'),
+                                   Transfer('Assets:MyBank:Checking')])
+        self.assertTrue(transaction.validate())
+
+        transaction = Transaction('2022/07/16', 'Floating point',
+                                  [Transfer('Expenses:Clothing', 0.1, '$'),
+                                   Transfer('Expenses:Food', 0.2, '$'),
+                                   Transfer('Assets:MyBank:Checking', -0.3, '$')])
+        self.assertTrue(transaction.validate())
+
+        transaction = Transaction('2022/07/16', 'Priced',
+                                  [Transfer('Assets:Broker', 5, 'FOO', price=20.0, price_unit='$'),
+                                   Transfer('Assets:MyBank:Checking', -100.0, '$')])
+        self.assertTrue(transaction.validate())
+
+        transaction = Transaction('2022/07/16', 'Exchange',
+                                  [Transfer('Assets:Euro', 10, 'EUR'),
+                                   Transfer('Assets:MyBank:Checking', -11.0, '$')])
+        self.assertTrue(transaction.validate())
+
+    def test_transaction_errors(self):
+        transaction = Transaction('2022/07/16', 'Unbalanced',
+                                  [Transfer('Expenses:Clothing', 17.5, '$'),
+                                   Transfer('Assets:MyBank:Checking', -17.0, '$')])
+        self.assertFalse(transaction.validate())
+        self.assertEqual(transaction.imbalance(), {'$': 0.5})
+        self.assertEqual(transaction.errors(), ['Transfers do not balance, off by 0.5 $'])
+
+        transaction = Transaction('2022/13/16', 'Bad date',
+                                  [Transfer('Expenses:Clothing', 17.5, '$'),
+                                   Transfer('Assets:MyBank:Checking')])
+        self.assertEqual(transaction.errors(), ['Invalid date 2022/13/16'])
+
+        transaction = Transaction('2022/07/16', 'Two elided',
+                                  [Transfer('Expenses:Clothing'),
+                                   Transfer('Assets:MyBank:Checking')])
+        self.assertEqual(transaction.errors(),
+                         ['Found multiple transfers with no amount specified'])
+
+    def test_account_tree(self):
+        tree = AccountTree()
+        tree.add('Expenses:Food:Groceries', 'groceries')
+        tree.add('Expenses:Food', 'food')
+        tree.add('Expenses:Clothing', 'clothing')
+        tree.add('Assets:MyBank:Checking', 'checking')
+
+        self.assertEqual(tree.accounts(), ['Assets', 'Assets:MyBank', 'Assets:MyBank:Checking',
+                                           'Expenses', 'Expenses:Clothing', 'Expenses:Food',
+                                           'Expenses:Food:Groceries'])
+        self.assertEqual(sorted(tree.postings('Expenses:Food')), ['food', 'groceries'])
+        self.assertEqual(tree.postings('Expenses:Food', include_subaccounts=False), ['food'])
+        self.assertEqual(sorted(tree.postings('Expenses')), ['clothing', 'food', 'groceries'])
+        self.assertEqual(tree.postings('Expenses:Fo'), [])
+        self.assertIsNone(tree.find('Income'))
+        self.assertIn('Assets:MyBank', tree)
+
+        node = tree.find('Expenses:Food:Groceries')
+        self.assertEqual(node.name, 'Groceries')
+        self.assertIs(node.parent, tree.find('Expenses:Food'))
+        account = ''.join(['Expenses:', 'Food'])
+        self.assertIs(tree.intern(account), tree.find('Expenses:Food').full_name)
+
+    def test_ledger_postings(self):
+        ledger = Ledger()
+        groceries = Transaction('2022/07/16', 'Groceries',
+                                [Transfer('Expenses:Food:Groceries', 17.5, '$'),
+                                 Transfer('Assets:MyBank:Checking')])
+        clothes = Transaction('2022/07/17', 'Clothes',
+                              [Transfer('Expenses:Clothing', 20.0, '$'),
+                               Transfer('Assets:MyBank:Checking')])
+        ledger.add_transaction(groceries)
+        ledger.add_transaction(clothes)
+
+        self.assertEqual(ledger.postings('Expenses:Food'),
+                         [(groceries, groceries.transfers[0])])
+        self.assertEqual([t.description for t, _ in ledger.postings('Assets')],
+                         ['Groceries', 'Clothes'])
+        self.assertEqual(len(ledger.postings('Expenses')), 2)
+
+    def test_date_index(self):
+        index = DateIndex()
+        for ordinal, item in ((5, 'a'), (7, 'b'), (3, 'c'), (7, 'd'), (6, 'e'), (9, 'f')):
+            index.add(ordinal, item)
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.between(), ['c', 'a', 'e', 'b', 'd', 'f'])
+        self.assertEqual(list(index.ordinals), [3, 5, 6, 7, 7, 9])
+
+        start = date.fromordinal(6)
+        self.assertEqual(index.between(start), ['e', 'b', 'd', 'f'])
+        self.assertEqual(index.between(start, date.fromordinal(7)), ['e', 'b', 'd'])
+        self.assertEqual(index.between(end=date.fromordinal(4)), ['c'])
+        self.assertEqual(index.between(date.fromordinal(10)), [])
+        self.assertEqual(index.count_between(6, 7), 3)
+        self.assertEqual(index.count_between(8, 7), 0)
+
+    def test_amount_index(self):
+        ledger = Ledger()
+        ledger.add_transaction(Transaction('2022/07/16', 'Groceries',
+                                           [Transfer('Expenses:Food', 42.5, '$'),
+                                            Transfer('Assets:MyBank:Checking')]))
+        self.assertIsNone(ledger.amounts)
+        ledger.auto_balance()
+        self.assertEqual([tr.amount for _, tr in ledger.postings_between_amounts()], [-42.5, 42.5])
+        ledger.add_transaction(Transaction('2022/07/17', 'Rent',
+                                           [Transfer('Expenses:Rent', Amount('1200.00'), '$'),
+                                            Transfer('Assets:MyBank:Checking', -1200, '$')]))
+        self.assertEqual(len(ledger.amounts), 4)
+        self.assertEqual([t.description for t, _ in ledger.postings_between_amounts(0, 100)],
+                         ['Groceries'])
+        self.assertEqual([tr.account for _, tr in ledger.postings_between_amounts(high=-42.5)],
+                         ['Assets:MyBank:Checking', 'Assets:MyBank:Checking'])
+        self.assertEqual(ledger.amounts.count(Amount('42.50'), 1200), 2)
+
+    def test_transactions_between(self):
+        ledger = Ledger()
+        for day, effective_day in ((20, None), (5, 25), (12, None), (13, None)):
+            effective_date = None if effective_day is None else f'2022/7/{effective_day}'
+            ledger.add_transaction(Transaction(f'2022/7/{day}', f'Day {day}',
+                                               [Transfer('Expenses:Food', 1.0, '$'),
+                                                Transfer('Assets:MyBank:Checking')],
+                                               effective_date=effective_date))
+        ledger.add_transaction(Transaction('2022/7/32', 'Bad date', []))
+
+        self.assertEqual([t.description for t in ledger.transactions_between()],
+                         ['Day 5', 'Day 12', 'Day 13', 'Day 20'])
+        self.assertEqual([t.description for t in ledger.transactions_between(
+                             date(2022, 7, 10), date(2022, 7, 20))],
+                         ['Day 12', 'Day 13', 'Day 20'])
+        self.assertEqual([t.description for t in ledger.transactions_between(
+                             date(2022, 7, 10), effective=True)],
+                         ['Day 12', 'Day 13', 'Day 20', 'Day 5'])
+
+    def test_effective_date_errors(self):
+        transaction = Transaction('2022/07/16', 'Bad effective date',
+                                  [Transfer('Expenses:Clothing', 17.5, '$'),
+                                   Transfer('Assets:MyBank:Checking')],
+                                  effective_date='2022/02/30')
+        self.assertEqual(transaction.errors(), ['Invalid effective date 2022/02/30'])
+
+    def test_fill_amount(self):
+        transaction = Transaction('2022/07/16', 'Groceries',
+                                  [Transfer('Assets:MyBank:Checking'),
+                                   Transfer('Expenses:Food', 0.1, '$'),
+                                   Transfer('Expenses:Clothing', 0.2, '$')])
+        self.assertTrue(transaction.fill_amount())
+        self.assertEqual(transaction.transfers[0].amount, Amount('-0.3'))
+        self.assertEqual(transaction.transfers[0].unit, '$')
+        self.assertFalse(transaction.fill_amount())
+
+        transaction = Transaction('2022/07/16', 'Two units',
+                                  [Transfer('Assets:Euro', 10.0, 'EUR'),
+                                   Transfer('Assets:Broker', 5.0, 'FOO', price=20.0, price_unit='$'),
+                                   Transfer('Assets:MyBank:Checking')])
+        self.assertFalse(transaction.fill_amount())
+        self.assertIsNone(transaction.transfers[2].amount)
+
+    def test_auto_balance(self):
+        ledger = Ledger()
+        ledger.add_transaction(Transaction('2022/07/16', 'Stock',
+                                           [Transfer('Assets:Broker', 5.0, 'FOO',
+                                                     price=20.0, price_unit='$'),
+                                            Transfer('Assets:MyBank:Checking')]))
+        ledger.add_transaction(Transaction('2022/07/17', 'Unbalanced',
+                                           [Transfer('Expenses:Food', 10.0, '$'),
+                                            Transfer('Assets:MyBank:Checking', -9.0, '$')]))
+        problems = ledger.auto_balance()
+        self.assertEqual([(t.description, error) for t, error in problems],
+                         [('Unbalanced', 'Transfers do not balance, off by 1 $')])
+        transfer = ledger.transactions[0].transfers[1]
+        self.assertEqual((transfer.amount, transfer.unit), (-100.0, '$'))
+
+    def test_plugin_manager(self):
+        plugin_mgr = LedgerPluginManager()
+        calls = []
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTION,
+                                     lambda t: calls.append(('one', t)))
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                     lambda ts: calls.append(('many', ts)))
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS,
+                                     lambda ts: calls.append(('deferred', ts)), deferred=True)
+
+        plugin_mgr.trigger(LedgerListenerType.ADD_TRANSACTION, 'a')
+        plugin_mgr.trigger(LedgerListenerType.ADD_TRANSACTIONS, ['b', 'c'])
+        self.assertEqual(calls, [('one', 'a'), ('many', ['b', 'c'])])
+        self.assertEqual(plugin_mgr.add_transaction_listeners,
+                         plugin_mgr.listeners[LedgerListenerType.ADD_TRANSACTION])
+
+        plugin_mgr.run_deferred()
+        self.assertEqual(calls[2:], [('deferred', ['b', 'c'])])
+        plugin_mgr.run_deferred()
+        self.assertEqual(len(calls), 3)
+
+    def test_add_transactions(self):
+        def transaction(day):
+            return Transaction(f'2022/7/{day}', f'Day {day}',
+                               [Transfer('Expenses:Food', 1.0, '$'),
+                                Transfer('Assets:MyBank:Checking')])
+
+        ledger = Ledger()
+        single, batches, deferred = [], [], []
+        plugin_mgr = ledger.get_plugin_manager()
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTION, single.append)
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS, batches.append)
+        plugin_mgr.register_listener(LedgerListenerType.ADD_TRANSACTIONS, deferred.extend,
+                                     deferred=True)
+
+        ledger.add_transactions((transaction(day) for day in range(1, 6)), chunk_size=2)
+        ledger.add_transaction(transaction(6))
+        self.assertEqual([t.description for t in ledger.transactions],
+                         [f'Day {day}' for day in range(1, 7)])
+        self.assertEqual(single, ledger.transactions)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1, 1])
+        self.assertEqual(deferred, [])
+        self.assertEqual(len(ledger.postings('Expenses')), 6)
+        self.assertEqual(len(ledger.transactions_between(date(2022, 7, 5))), 2)
+
+        plugin_mgr.run_deferred()
+        self.assertEqual(deferred, ledger.transactions)
+
+
+    def test_totals(self):
+        ledger = Ledger()
+        for _ in range(10):
+            ledger.add_transaction(Transaction('2022/07/16', 'Groceries',
+                                               [Transfer('Expenses:Food', 0.1, '$'),
+                                                Transfer('Assets:MyBank:Checking', -0.1, '$')]))
+        ledger.add_transaction(Transaction('2022/07/17', 'Stock',
+                                           [Transfer('Assets:Broker', 1.5, 'FOO'),
+                                            Transfer('Assets:MyBank:Checking')]))
+        self.assertEqual(ledger.totals('Expenses'), {'$': Amount('1')})
+        self.assertEqual(ledger.totals('Assets'), {'$': Amount('-1'), 'FOO': Amount('1.5')})
+        self.assertEqual(ledger.totals(), {'$': 0, 'FOO': Amount('1.5')})
+
+
+    def test_indexes_are_built_on_first_lookup(self):
+        ledger = Ledger()
+        ledger.add_transaction(Transaction('2022/07/16', 'Groceries',
+                                           [Transfer('Expenses:Food', 42.5, '$'),
+                                            Transfer('Assets:MyBank:Checking', -42.5, '$')]))
+        self.assertIsNone(ledger.accounts)
+        self.assertIsNone(ledger.dates)
+        self.assertFalse(ledger.get_plugin_manager().has_listeners(LedgerListenerType.ADD_TRANSACTIONS))
+
+        self.assertEqual(len(ledger.postings('Expenses')), 1)
+        self.assertIsNone(ledger.dates)
+        self.assertEqual(len(ledger.transactions_between(effective=True)), 1)
+
+        # once built, the indexes are kept up to date
+        ledger.add_transaction(Transaction('2022/07/01', 'Paycheck',
+                                           [Transfer('Assets:MyBank:Checking', 1000, '$'),
+                                            Transfer('Income:Nerds, Inc.', -1000, '$')]))
+        self.assertEqual(len(ledger.postings('Assets')), 2)
+        self.assertEqual([t.description for t in ledger.transactions_between()],
+                         ['Paycheck', 'Groceries'])
+
+    def test_freeze_and_fork(self):
+        ledger = Ledger()
+        ledger.add_transaction(Transaction('2022/07/16', 'Groceries',
+                                           [Transfer('Expenses:Food', 42.5, '$'),
+                                            Transfer('Assets:MyBank:Checking', -42.5, '$')]))
+        ledger.add_transaction(Transaction('2022/07/01', 'Paycheck',
+                                           [Transfer('Assets:MyBank:Checking', 1000, '$'),
+                                            Transfer('Income:Nerds, Inc.', -1000, '$')]))
+        ledger.index_amounts()
+        ledger.freeze()
+        with self.assertRaises(FrozenLedgerError):
+            ledger.add_transaction(Transaction('2022/07/17', 'Late', []))
+        with self.assertRaises(FrozenLedgerError):
+            ledger.add_transactions([])
+        self.assertEqual(ledger.dates._unsorted, [])
+
+        fork = ledger.fork()
+        self.assertFalse(fork.frozen)
+        fork.add_transaction(Transaction('2022/07/20', 'Dinner',
+                                         [Transfer('Expenses:Food:Restaurants', 30, '$'),
+                                          Transfer('Assets:MyBank:Checking', -30, '$')]))
+        self.assertEqual(len(ledger.transactions), 2)
+        self.assertEqual(len(fork.transactions), 3)
+        self.assertEqual(len(ledger.postings('Expenses')), 1)
+        self.assertEqual(len(fork.postings('Expenses')), 2)
+        self.assertEqual([t.description for t in ledger.transactions_between()],
+                         ['Paycheck', 'Groceries'])
+        self.assertEqual([t.description for t in fork.transactions_between()],
+                         ['Paycheck', 'Groceries', 'Dinner'])
+        self.assertEqual(len(fork.postings_between_amounts(-50, 50)), 4)
+        self.assertEqual(len(ledger.postings_between_amounts(-50, 50)), 2)
+        # the postings themselves are shared
+        self.assertIs(fork.postings('Expenses:Food')[0], ledger.postings('Expenses:Food')[0])
+        # a frozen ledger is not changed by lookups
+        fork.freeze()
+        self.assertEqual(len(fork.postings_between_amounts(-50, 50)), 4)
+        fork = fork.fork()
+        fork.freeze()
+        self.assertEqual(len(fork.postings('Expenses')), 2)
+        unindexed = Ledger()
+        unindexed.freeze()
+        with self.assertRaises(FrozenLedgerError):
+            unindexed.postings_between_amounts(-50, 50)
+        self.assertIsNone(unindexed.amounts)
+        self.assertEqual(fork.accounts.accounts(), ['Assets', 'Assets:MyBank',
+                                                    'Assets:MyBank:Checking', 'Expenses',
+                                                    'Expenses:Food', 'Expenses:Food:Restaurants',
+                                                    'Income', 'Income:Nerds, Inc.'])
+
+
+if __name__ == '__main__':
+    unittest.main()
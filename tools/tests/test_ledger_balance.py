@@ -0,0 +1,139 @@
+from datetime import date
+import io
+import random
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger import Ledger, Transaction, Transfer  # noqa
+from ledger_balance import BalanceEngine, DayTotals, FenwickTree  # noqa
+from ledger_columnar import ColumnarLedger  # noqa
+import ledger_importer  # noqa
+
+
+class TestLedgerBalance(unittest.TestCase):
+
+    def test_fenwick_tree(self):
+        rng = random.Random(7)
+        tree = FenwickTree()
+        values = []
+        for _ in range(200):
+            index = rng.randrange(60)
+            delta = rng.randrange(-50, 50)
+            tree.add(index, delta)
+            values += [0] * (index + 1 - len(values))
+            values[index] += delta
+
+            check = rng.randrange(70)
+            self.assertEqual(tree.prefix_sum(check), sum(values[:check + 1]))
+
+        # growing in bulk keeps the sums of the existing values
+        tree.extend([rng.randrange(-50, 50) for _ in range(37)])
+        values += list(tree.values[len(values):])
+        for check in range(len(values)):
+            self.assertEqual(tree.prefix_sum(check), sum(values[:check + 1]))
+        tree.add(0, 3)
+        self.assertEqual(tree.prefix_sum(len(values)), sum(values) + 3)
+
+        tree.multiply(10)
+        self.assertEqual(tree.prefix_sum(len(values)), 10 * (sum(values) + 3))
+
+    def test_day_totals(self):
+        rng = random.Random(7)
+        totals = DayTotals()
+        postings = []
+        for _ in range(300):
+            ordinal = rng.randrange(1000, 1100)
+            value = rng.randrange(-50, 50)
+            totals.add(ordinal, value)
+            postings.append((ordinal, value))
+            if rng.random() < 0.1:
+                check = rng.randrange(990, 1110)
+                self.assertEqual(totals.total(check),
+                                 sum(value for day, value in postings if day <= check))
+        self.assertEqual(totals.total(), sum(value for _, value in postings))
+        # only the days with postings take a slot
+        self.assertEqual(list(totals.ordinals), sorted({day for day, _ in postings}))
+
+    def _ledger(self, ledger):
+        ledger.add_transaction(Transaction('2022/7/16', 'Groceries',
+                                           [Transfer('Expenses:Food:Groceries', 17.5, '$'),
+                                            Transfer('Assets:MyBank:Checking')]))
+        ledger.add_transaction(Transaction('2022/07/20', 'Restaurant',
+                                           [Transfer('Expenses:Food', 30.0, '$'),
+                                            Transfer('Assets:MyBank:Checking', -30.0, '$')]))
+        # added out of order
+        ledger.add_transaction(Transaction('2022/07/01', 'Paycheck',
+                                           [Transfer('Assets:MyBank:Checking', 1000.0, '$'),
+                                            Transfer('Income:Nerds, Inc.')]))
+        ledger.add_transaction(Transaction('2022/07/18', 'Stock',
+                                           [Transfer('Assets:Broker', 5.0, 'FOO',
+                                                     price=20.0, price_unit='$'),
+                                            Transfer('Assets:MyBank:Checking')]))
+        return ledger
+
+    def test_balance(self):
+        for ledger in (Ledger(), ColumnarLedger()):
+            engine = BalanceEngine()
+            engine.register(ledger.get_plugin_manager())
+            self._ledger(ledger)
+
+            self.assertEqual(engine.balance('Assets:MyBank:Checking'), {'$': 852.5})
+            self.assertEqual(engine.balance('Assets:MyBank:Checking', as_of=date(2022, 7, 16)),
+                             {'$': 982.5})
+            self.assertEqual(engine.balance('Assets:MyBank:Checking', as_of=date(2022, 6, 30)), {})
+            self.assertEqual(engine.balance('Assets', as_of=date(2022, 7, 18)),
+                             {'$': 882.5, 'FOO': 5.0})
+            self.assertEqual(engine.balance('Expenses:Food'), {'$': 47.5})
+            self.assertEqual(engine.balance('Expenses:Food', include_subaccounts=False), {'$': 30.0})
+            self.assertEqual(engine.balance('Income'), {'$': -1000.0})
+            self.assertEqual(engine.balance('Liabilities'), {})
+
+    def test_balance_newest_first(self):
+        engine = BalanceEngine()
+        for day in range(3000, 0, -1):
+            engine.add_transaction(Transaction(date.fromordinal(738000 + day).strftime('%Y/%m/%d'),
+                                               'Coffee', [Transfer('Expenses:Food', 1.25, '$'),
+                                                          Transfer('Assets:Cash')]))
+        self.assertEqual(engine.balance('Expenses'), {'$': 3750})
+        self.assertEqual(engine.balance('Assets:Cash', as_of=date.fromordinal(738010)),
+                         {'$': -12.5})
+
+    def test_balance_for_ledger(self):
+        ledger = self._ledger(Ledger())
+        engine = BalanceEngine.for_ledger(ledger)
+        ledger.add_transaction(Transaction('2022/07/21', 'Refund',
+                                           [Transfer('Expenses:Food', -10.0, '$'),
+                                            Transfer('Assets:MyBank:Checking')]))
+        self.assertEqual(engine.balance('Expenses'), {'$': 37.5})
+
+    def test_balance_of_lazy_import(self):
+        text = """
+2022/01/02 Consulting Income
+    Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+
+2022/13/03 Bad date
+    Asset:MyBank:Checking  $1.00
+    Income:Nerds, Inc.
+"""
+        ledger = Ledger()
+        engine = BalanceEngine()
+        engine.register(ledger.get_plugin_manager())
+        ledger_importer.import_ledger_file(io.StringIO(text), ledger, lazy=True, strict=True)
+        self.assertFalse(ledger.transactions[0].is_parsed())
+        self.assertEqual(engine.balance('Asset'), {'$': 123.45})
+        self.assertEqual([t.description for t in engine.undated], ['Bad date'])
+
+    def test_deferred_balance(self):
+        ledger = Ledger()
+        engine = BalanceEngine()
+        engine.register(ledger.get_plugin_manager(), deferred=True)
+        self._ledger(ledger)
+        self.assertEqual(engine.own, {})
+        self.assertEqual(engine.balance('Expenses:Food'), {'$': 47.5})
+
+
+if __name__ == '__main__':
+    unittest.main()
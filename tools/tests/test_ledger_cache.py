@@ -0,0 +1,137 @@
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append('..')
+
+from ledger import TransferStatus  # noqa
+import ledger_cache  # noqa
+import ledger_importer  # noqa
+
+
+LEDGER_TEXT = """
+2022/01/02 Consulting Income
+    * Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+
+2022/01/03=2022/01/05 Buy FOO
+    Asset:Broker  5 FOO @ $20.00
+    ! Asset:MyBank:Checking  $-100
+"""
+
+
+class TestLedgerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'test.ledger')
+        with open(self.path, 'w') as f:
+            f.write(LEDGER_TEXT)
+
+    def test_cache_path(self):
+        self.assertEqual(ledger_cache.cache_path('/home/jim/ledger/ladds.ledger'),
+                         '/home/jim/ledger/.ladds.ledger.cache')
+
+    def test_store_and_load(self):
+        key = ledger_cache.cache_key(self.path)
+        transactions = list(ledger_importer.iter_transactions(self.path))
+        ledger_cache.store(key, transactions)
+        self.assertTrue(os.path.exists(ledger_cache.cache_path(self.path)))
+
+        with self.assertLogs(ledger_cache.logger, 'INFO') as logs:
+            cached = ledger_cache.load(ledger_cache.cache_key(self.path))
+        self.assertIn('Cache hit', logs.output[0])
+
+        self.assertEqual(len(cached), 2)
+        self.assertEqual(cached[0].date, '2022/01/02')
+        self.assertEqual(cached[0].description, 'Consulting Income')
+        self.assertIsNone(cached[0].effective_date)
+        self.assertEqual(cached[1].effective_date, '2022/01/05')
+        transfer1, transfer2 = cached[0].transfers
+        self.assertEqual(transfer1.account, 'Asset:MyBank:Checking')
+        self.assertEqual(transfer1.amount, 123.45)
+        self.assertEqual(transfer1.unit, '$')
+        self.assertEqual(transfer1.status, TransferStatus.CLEARED)
+        self.assertEqual(transfer2.amount, None)
+        self.assertEqual(transfer2.status, TransferStatus.DEFAULT)
+
+        transfer1, transfer2 = cached[1].transfers
+        self.assertEqual(transfer1.price, 20.0)
+        self.assertEqual(transfer1.price_unit, '$')
+        self.assertEqual(transfer2.status, TransferStatus.PENDING)
+
+    def test_load_without_cache(self):
+        with self.assertLogs(ledger_cache.logger, 'INFO') as logs:
+            self.assertIsNone(ledger_cache.load(ledger_cache.cache_key(self.path)))
+        self.assertIn('Cache miss', logs.output[0])
+
+    def test_load_after_file_changed(self):
+        ledger_cache.store(ledger_cache.cache_key(self.path), [])
+        with open(self.path, 'a') as f:
+            f.write('\n2022/01/04 Another\n    A  $1\n    B\n')
+
+        with self.assertLogs(ledger_cache.logger, 'INFO') as logs:
+            self.assertIsNone(ledger_cache.load(ledger_cache.cache_key(self.path)))
+        self.assertIn('file changed', logs.output[0])
+
+    def test_load_with_other_version(self):
+        key = ledger_cache.cache_key(self.path)
+        ledger_cache.store(key, [])
+        with mock.patch('ledger_cache.CACHE_VERSION', ledger_cache.CACHE_VERSION + 1):
+            with self.assertLogs(ledger_cache.logger, 'INFO') as logs:
+                self.assertIsNone(ledger_cache.load(key))
+        self.assertIn('version', logs.output[0])
+
+    def test_load_with_corrupt_cache(self):
+        key = ledger_cache.cache_key(self.path)
+        with open(ledger_cache.cache_path(self.path), 'wb') as f:
+            f.write(b'garbage')
+        with self.assertLogs(ledger_cache.logger, 'INFO'):
+            self.assertIsNone(ledger_cache.load(key))
+
+    def test_load_does_not_unpickle(self):
+        key = ledger_cache.cache_key(self.path)
+        called = mock.Mock()
+        with open(ledger_cache.cache_path(self.path), 'wb') as f:
+            f.write(ledger_cache._HEADER.pack(ledger_cache.CACHE_MAGIC, ledger_cache.CACHE_VERSION))
+            f.write(pickle.dumps((key.as_json(), []), protocol=pickle.HIGHEST_PROTOCOL))
+        with mock.patch('pickle.loads', called), mock.patch('pickle.load', called):
+            with self.assertLogs(ledger_cache.logger, 'INFO'):
+                self.assertIsNone(ledger_cache.load(key))
+        called.assert_not_called()
+
+    def test_cache_is_json(self):
+        key = ledger_cache.cache_key(self.path)
+        ledger_cache.store(key, list(ledger_importer.iter_transactions(self.path)))
+        with open(ledger_cache.cache_path(self.path), 'rb') as f:
+            f.read(ledger_cache._HEADER.size)
+            contents = json.load(f)
+        self.assertEqual(contents['key'], key.as_json())
+        self.assertEqual(contents['transactions'][0][:2], ['2022/01/02', 'Consulting Income'])
+
+    def test_import_ledger_file_with_cache(self):
+        with self.assertLogs(ledger_cache.logger, 'INFO'):
+            ledger1 = ledger_importer.import_ledger_file(self.path, cache=True)
+
+        with mock.patch('ledger_importer._read_transactions') as read_transactions:
+            with self.assertLogs(ledger_cache.logger, 'INFO'):
+                ledger2 = ledger_importer.import_ledger_file(self.path, cache=True)
+            read_transactions.assert_not_called()
+
+        self.assertEqual([t.description for t in ledger2.transactions],
+                         [t.description for t in ledger1.transactions])
+
+    def test_import_ledger_file_with_cache_lazily(self):
+        with self.assertRaises(ValueError):
+            ledger_importer.import_ledger_file(self.path, cache=True, lazy=True)
+        self.assertFalse(os.path.exists(ledger_cache.cache_path(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
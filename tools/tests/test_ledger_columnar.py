@@ -0,0 +1,212 @@
+from datetime import date
+import io
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger import Ledger, LedgerListenerType, Transaction, Transfer, TransferStatus  # noqa
+from ledger_columnar import ColumnarLedger, Interner  # noqa
+from ledger_money import Amount  # noqa
+import ledger_importer  # noqa
+
+
+class TestLedgerColumnar(unittest.TestCase):
+
+    def _transactions(self):
+        return [Transaction('2022/7/16', 'Clothes',
+                            [Transfer('Expenses:Clothing', 17.5, '$', TransferStatus.CLEARED),
+                             Transfer('Assets:MyBank:Checking')]),
+                Transaction('2022/07/17', 'Stock',
+                            [Transfer('Assets:Broker', 5.0, 'FOO', price=20.0, price_unit='$'),
+                             Transfer('Assets:MyBank:Checking', -100.0, '$', TransferStatus.PENDING)],
+                            effective_date='2022/07/19'),
+                Transaction('2022/7/18', 'No transfers', [])]
+
+    def test_interner(self):
+        interner = Interner()
+        self.assertEqual(interner.id('Expenses:Food'), 0)
+        self.assertEqual(interner.id('Assets:Checking'), 1)
+        self.assertEqual(interner.id('Expenses:Food'), 0)
+        self.assertEqual(interner.id(None), -1)
+        self.assertEqual(len(interner), 2)
+        self.assertEqual(interner.name(1), 'Assets:Checking')
+        self.assertIsNone(interner.name(-1))
+
+    def test_columnar_ledger(self):
+        ledger = ColumnarLedger()
+        for transaction in self._transactions():
+            ledger.add_transaction(transaction)
+
+        self.assertEqual(len(ledger.transactions), 3)
+        for view, transaction in zip(ledger.transactions, self._transactions()):
+            self.assertIsInstance(view, Transaction)
+            self.assertEqual(view.date, transaction.date)
+            self.assertEqual(view.effective_date, transaction.effective_date)
+            self.assertEqual(view.description, transaction.description)
+            self.assertEqual(len(view.transfers), len(transaction.transfers))
+            for transfer_view, transfer in zip(view.transfers, transaction.transfers):
+                for attr in ('account', 'amount', 'unit', 'status', 'price', 'price_unit'):
+                    self.assertEqual(getattr(transfer_view, attr), getattr(transfer, attr), attr)
+            self.assertEqual(view.validate(), transaction.validate())
+
+        self.assertEqual(ledger.transactions[-1].description, 'No transfers')
+        self.assertEqual([t.description for t in ledger.transactions[1:]], ['Stock', 'No transfers'])
+        with self.assertRaises(IndexError):
+            ledger.transactions[3]
+
+        # repeated strings are only stored once
+        columns = ledger.columns
+        self.assertEqual(columns.accounts.names,
+                         ['Expenses:Clothing', 'Assets:MyBank:Checking', 'Assets:Broker'])
+        self.assertEqual(columns.units.names, ['$', 'FOO'])
+        self.assertEqual(list(columns.transfer_offsets), [0, 2, 4, 4])
+        self.assertEqual(ledger.transactions[0].ordinal,
+                         ledger.transactions[1].ordinal - 1)
+
+    def test_columnar_ledger_triggers_listeners(self):
+        ledger = ColumnarLedger()
+        seen = []
+        ledger.get_plugin_manager().register_listener(
+            LedgerListenerType.ADD_TRANSACTION, lambda t: seen.append(t.description))
+        ledger.add_transaction(self._transactions()[0])
+        self.assertEqual(seen, ['Clothes'])
+
+    def test_import_ledger_file_into_columnar_ledger(self):
+        text = """
+2022/01/02 Consulting Income
+    Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+"""
+        ledger = ledger_importer.import_ledger_file(io.StringIO(text), ColumnarLedger())
+        self.assertIsInstance(ledger, ColumnarLedger)
+        transfers = ledger.transactions[0].transfers
+        self.assertEqual(transfers[0].amount, 123.45)
+        self.assertEqual(transfers[1].account, 'Income:Nerds, Inc.')
+
+    def test_columnar_ledger_postings(self):
+        ledger = ColumnarLedger()
+        for transaction in self._transactions():
+            ledger.add_transaction(transaction)
+
+        postings = ledger.postings('Assets')
+        self.assertEqual([(t.description, tr.account) for t, tr in postings],
+                         [('Clothes', 'Assets:MyBank:Checking'),
+                          ('Stock', 'Assets:MyBank:Checking'),
+                          ('Stock', 'Assets:Broker')])
+        self.assertEqual([tr.amount for _, tr in ledger.postings('Assets:Broker')], [5.0])
+        self.assertEqual(ledger.postings('Income'), [])
+
+    def test_columnar_ledger_transactions_between(self):
+        ledger = ColumnarLedger()
+        for transaction in reversed(self._transactions()):
+            ledger.add_transaction(transaction)
+
+        self.assertEqual([t.description for t in ledger.transactions_between(date(2022, 7, 17))],
+                         ['Stock', 'No transfers'])
+        self.assertEqual([t.description for t in ledger.transactions_between(
+                             date(2022, 7, 17), date(2022, 7, 18), effective=True)],
+                         ['No transfers'])
+
+    def test_auto_balance(self):
+        def transactions():
+            return [Transaction('2022/07/16', 'Filled', [Transfer('Assets:MyBank:Checking'),
+                                                         Transfer('Expenses:Food', 0.1, '$'),
+                                                         Transfer('Expenses:Food', 0.2, '$')]),
+                    Transaction('2022/07/16', 'Priced', [Transfer('Assets:Broker', 5.0, 'FOO',
+                                                                  price=20.0, price_unit='$'),
+                                                         Transfer('Assets:MyBank:Checking')]),
+                    Transaction('2022/07/16', 'Balanced', [Transfer('Expenses:Food', 3.0, '$'),
+                                                           Transfer('Assets:MyBank:Checking', -3.0, '$')]),
+                    Transaction('2022/07/16', 'Unbalanced', [Transfer('Expenses:Food', 3.0, '$'),
+                                                             Transfer('Assets:MyBank:Checking', -2.0, '$')]),
+                    Transaction('2022/07/16', 'Exchange', [Transfer('Assets:Euro', 10.0, 'EUR'),
+                                                           Transfer('Assets:MyBank:Checking', -11.0, '$')]),
+                    Transaction('2022/07/16', 'Mixed', [Transfer('Assets:Euro', 10.0, 'EUR'),
+                                                        Transfer('Expenses:Food', 1.0, '$'),
+                                                        Transfer('Assets:MyBank:Checking')]),
+                    Transaction('2022/07/16', 'Lone', [Transfer('Assets:MyBank:Checking')]),
+                    Transaction('2022/07/16', 'Two elided', [Transfer('Expenses:Food'),
+                                                             Transfer('Assets:MyBank:Checking')]),
+                    Transaction('2022/07/16', 'No transfers', [])]
+
+        ledger = Ledger()
+        columnar_ledger = ColumnarLedger()
+        for transaction in transactions():
+            ledger.add_transaction(transaction)
+        for transaction in transactions():
+            columnar_ledger.add_transaction(transaction)
+
+        problems = columnar_ledger.auto_balance()
+        self.assertEqual([(t.description, error) for t, error in problems],
+                         [(t.description, error) for t, error in ledger.auto_balance()])
+        self.assertEqual([t.description for t, _ in problems], ['Unbalanced', 'Two elided'])
+        for view, transaction in zip(columnar_ledger.transactions, ledger.transactions):
+            self.assertEqual([(t.amount, t.unit) for t in view.transfers],
+                             [(t.amount, t.unit) for t in transaction.transfers])
+
+        self.assertEqual(columnar_ledger.transactions[1].transfers[1].amount, -100.0)
+        # filled in amounts are not filled in again
+        self.assertEqual(len(columnar_ledger.auto_balance()), 2)
+        self.assertEqual(columnar_ledger.transactions[0].transfers[0].amount, Amount('-0.3'))
+
+    def test_columnar_ledger_add_transactions(self):
+        ledger = ColumnarLedger()
+        batches = []
+        ledger.get_plugin_manager().register_listener(
+            LedgerListenerType.ADD_TRANSACTIONS, lambda ts: batches.append([t.description for t in ts]))
+        ledger.add_transactions(self._transactions(), chunk_size=2)
+        self.assertEqual(batches, [['Clothes', 'Stock'], ['No transfers']])
+        self.assertEqual(len(ledger.transactions), 3)
+        self.assertEqual(len(ledger.postings('Assets')), 3)
+        self.assertEqual(len(ledger.transactions_between()), 3)
+
+    def test_views(self):
+        ledger = ColumnarLedger()
+        for day in (16, 17):
+            ledger.add_transaction(Transaction(f'2022/07/{day}', 'Groceries',
+                                               [Transfer('Expenses:Food', 42.5, '$'),
+                                                Transfer('Assets:MyBank:Checking', -42.5, '$')]))
+        transaction = ledger.transactions[0]
+        self.assertFalse(hasattr(transaction, '__dict__'))
+        self.assertFalse(hasattr(transaction.transfers[0], '__dict__'))
+
+        # views of the same row are equal, wherever they come from
+        self.assertEqual(transaction, ledger.postings('Expenses')[0][0])
+        self.assertEqual(transaction.transfers[0], transaction.transfers[0])
+        self.assertNotEqual(transaction, ledger.transactions[1])
+        self.assertNotEqual(transaction.transfers[0], transaction.transfers[1])
+        self.assertEqual(len({transaction for transaction, _ in ledger.postings('Assets')}), 2)
+        self.assertNotEqual(transaction, ledger.fork().transactions[0])
+
+    def test_amounts_are_rescaled(self):
+        ledger = ColumnarLedger()
+        ledger.add_transaction(Transaction('2022/07/16', 'Whole',
+                                           [Transfer('Expenses:Food', 3, '$'),
+                                            Transfer('Assets:MyBank:Checking', -3, '$')]))
+        ledger.add_transaction(Transaction('2022/07/17', 'Cents',
+                                           [Transfer('Expenses:Food', Amount.parse('0.25'), '$'),
+                                            Transfer('Assets:Broker', Amount.parse('0.125'), 'FOO',
+                                                     price=Amount.parse('2'), price_unit='$'),
+                                            Transfer('Assets:MyBank:Checking')]))
+        columns = ledger.columns
+        self.assertEqual(columns.unit_scales, {0: 3, 1: 3})
+        self.assertEqual(list(columns.amounts[:2]), [3000, -3000])
+        # amounts keep the decimal places they were written with
+        self.assertEqual(str(ledger.transactions[0].transfers[0].amount), '3')
+        self.assertEqual(str(ledger.transactions[1].transfers[0].amount), '0.25')
+        self.assertEqual(ledger.transactions[1].transfers[1].price, 2)
+        self.assertEqual(str(ledger.transactions[1].transfers[1].price), '2')
+
+        self.assertEqual(ledger.auto_balance(), [])
+        self.assertEqual(ledger.transactions[1].transfers[2].amount, Amount.parse('-0.5'))
+        # as many decimal places as Transaction.fill_amount gives
+        self.assertEqual(str(ledger.transactions[1].transfers[2].amount), '-0.500')
+        # the price of FOO is paid in $, so $ does not total 0
+        self.assertEqual(ledger.totals(), {'$': Amount('-0.25'), 'FOO': Amount('0.125')})
+        self.assertEqual(ledger.totals('Expenses'), {'$': Amount.parse('3.25')})
+        self.assertEqual(ledger.totals('Assets'), Ledger.totals(ledger, 'Assets'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+from datetime import date
+import io
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger_descriptions import CandidateRanker, DescriptionIndex, tokenize  # noqa
+from ledger_importer import import_ledger_file  # noqa
+from ledger_money import Amount  # noqa
+from ledger_reconcile import BankTransaction, PostingIndex, reconcile  # noqa
+
+
+LEDGER_TEXT = """
+2022/07/10 Blue Bottle Coffee
+    Expenses:Food:Coffee  $5.00
+    Liabilities:Card
+
+2022/07/10 City parking
+    Expenses:Auto:Parking  $5.00
+    Liabilities:Card
+
+2022/07/11 Blue Bottle Coffee
+    Expenses:Food:Coffee  $6.00
+    Liabilities:Card
+
+2022/07/12 Safeway
+    Expenses:Food:Groceries  $42.50
+    Liabilities:Card
+
+2022/07/30 Blue Bottle Coffee
+    Expenses:Food:Coffee  $5.00
+    Liabilities:Card
+"""
+
+
+def bank(amount, day, description):
+    return BankTransaction(Amount(amount), date(2022, 7, day), description,
+                           raw=f'{amount} {description}')
+
+
+class TestLedgerDescriptions(unittest.TestCase):
+
+    def setUp(self):
+        ledger = import_ledger_file(io.StringIO(LEDGER_TEXT))
+        self.postings = PostingIndex(ledger, 'Liabilities:Card')
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('SQ *BLUE BOTTLE #1234 San-Francisco, CA'),
+                         ['sq', 'blue', 'bottle', 'san', 'francisco', 'ca'])
+
+    def test_description_index(self):
+        descriptions = DescriptionIndex(self.postings)
+        # each distinct description is stored once
+        self.assertEqual(len(descriptions.vectors), 3)
+        self.assertEqual([len(positions) for positions in descriptions.positions], [3, 1, 1])
+        self.assertEqual([self.postings.ordinals[position] for position in descriptions.positions[0]],
+                         [date(2022, 7, day).toordinal() for day in (10, 11, 30)])
+        # words in fewer postings weigh more
+        words = descriptions.words
+        self.assertGreater(descriptions.idf[words['parking']], descriptions.idf[words['coffee']])
+
+        vector = descriptions.vector('BLUE BOTTLE COFFEE #42 OAKLAND')
+        self.assertAlmostEqual(descriptions.similarity(vector, 0), 1.0)
+        self.assertEqual(descriptions.similarity(vector, 1), 0.0)
+        self.assertEqual(descriptions.vector('nothing like it'), {})
+
+        found = descriptions.search(descriptions.vector('city parking meter'))
+        self.assertEqual([position for _, position in found], [1])
+        found = descriptions.search(vector, date(2022, 7, 12).toordinal(), 2)
+        self.assertEqual([position for _, position in found], [0, 2])
+
+    def test_rank(self):
+        ranker = CandidateRanker(self.postings, days=3)
+        row = bank('-5.00', 10, 'SQ *BLUE BOTTLE COFFEE')
+        ranked = ranker.rank(row)
+        self.assertEqual([position for _, position in ranked], [0, 1, 2])
+        # same amount, same day and the same description
+        self.assertAlmostEqual(ranked[0][0], 2.5)
+        self.assertAlmostEqual(ranker.score(row, 1), 1.5)
+
+        used = bytearray(len(self.postings))
+        used[0] = 1
+        self.assertEqual([position for _, position in ranker.rank(row, limit=1, used=used)], [1])
+
+    def test_reconcile(self):
+        bank_transactions = [bank('-5.00', 10, 'PARKING METER CITY OF SF'),
+                             bank('-5.00', 10, 'SQ *BLUE BOTTLE COFFEE'),
+                             bank('-6.50', 12, 'BLUE BOTTLE COFFEE')]
+
+        # by amount and date alone, parking takes the first $5.00 posting
+        reconciliation = reconcile(self.postings, bank_transactions)
+        self.assertEqual([match.transaction.description for match in reconciliation.matched],
+                         ['Blue Bottle Coffee', 'City parking'])
+
+        reconciliation = reconcile(self.postings, bank_transactions,
+                                   ranker=CandidateRanker(self.postings))
+        self.assertEqual([match.transaction.description for match in reconciliation.matched],
+                         ['City parking', 'Blue Bottle Coffee'])
+        self.assertEqual([(match.transaction.date, match.amount, match.days)
+                          for match in reconciliation.suggestions],
+                         [('2022/07/11', -6, 1)])
+        self.assertIn('MISSING: -6.50 => -6.50 BLUE BOTTLE COFFEE\n'
+                      '    closest: 2022/07/11 Blue Bottle Coffee (-6.00, 1 days off)',
+                      reconciliation.format())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import io
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger import Ledger, Transaction, Transfer  # noqa
+from ledger_columnar import ColumnarLedger  # noqa
+from ledger_duplicates import DuplicateDetector, find_duplicates, fingerprint, \
+    normalize_description  # noqa
+import ledger_importer  # noqa
+
+
+LEDGER_TEXT = """
+2022/07/01 Paycheck
+    Assets:MyBank:Checking  $1,000.00
+    Income:Nerds, Inc.
+
+2022/07/16 Safeway
+    Expenses:Food:Groceries  $42.50
+    Assets:MyBank:Checking
+
+2022/07/18 Rent
+    Expenses:Rent  $1,200
+    Assets:MyBank:Checking
+
+; pasted twice, written a little differently
+2022/7/16 SAFEWAY
+    Assets:MyBank:Checking  $-42.5
+    Expenses:Food:Groceries  $42.50
+
+2022/07/18 Safeway
+    Expenses:Food:Groceries  $42.50
+    Assets:MyBank:Checking
+
+2022/07/25 Safeway
+    Expenses:Food:Groceries  $42.50
+    Assets:MyBank:Checking
+
+2022/07/01   Paycheck
+    Assets:MyBank:Checking  $1,000.00
+    Income:Nerds, Inc.
+"""
+
+
+class TestLedgerDuplicates(unittest.TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(normalize_description('  Nerds,\tInc.  Paycheck '), 'nerds, inc. paycheck')
+        first = Transaction('2022/7/1', 'Paycheck', [Transfer('Assets:Checking', 1000, '$'),
+                                                     Transfer('Income:Nerds')])
+        second = Transaction('2022/07/01', 'paycheck', [Transfer('Income:Nerds', -1000, '$'),
+                                                        Transfer('Assets:Checking', '1000.00', '$')])
+        self.assertEqual(fingerprint(first), fingerprint(second))
+        third = Transaction('2022/07/01', 'paycheck', [Transfer('Income:Nerds', -1000, '$'),
+                                                       Transfer('Assets:Savings', 1000, '$')])
+        self.assertNotEqual(fingerprint(first), fingerprint(third))
+
+    def _descriptions(self, transactions):
+        return [(t.date, t.description) for t in transactions]
+
+    def test_duplicates(self):
+        for ledger in (Ledger(), ColumnarLedger()):
+            detector = DuplicateDetector(days=3)
+            detector.register(ledger.get_plugin_manager())
+            ledger_importer.import_ledger_file(io.StringIO(LEDGER_TEXT), ledger)
+
+            self.assertEqual([self._descriptions(group) for group in detector.exact_duplicates()],
+                             [[('2022/07/01', 'Paycheck'), ('2022/07/01', 'Paycheck')],
+                              [('2022/07/16', 'Safeway'), ('2022/7/16', 'SAFEWAY')]])
+            self.assertEqual([self._descriptions(pair) for pair in detector.probable_duplicates()],
+                             [[('2022/07/16', 'Safeway'), ('2022/07/18', 'Safeway')],
+                              [('2022/7/16', 'SAFEWAY'), ('2022/07/18', 'Safeway')]])
+
+            report = detector.format()
+            self.assertIn('Duplicate transactions:\n    2022/07/01 Paycheck (1000.00 $)', report)
+            self.assertTrue(report.endswith('Checked 7 transactions: 2 groups of duplicates, '
+                                            '2 probable duplicates found'))
+
+    def test_days(self):
+        ledger = ledger_importer.import_ledger_file(io.StringIO(LEDGER_TEXT))
+        exact, probable = find_duplicates(ledger, days=10)
+        self.assertEqual(len(exact), 2)
+        self.assertEqual(len(probable), 5)
+        self.assertEqual(find_duplicates(ledger, days=0)[1], [])
+
+    def test_deferred_and_lazy(self):
+        ledger = Ledger()
+        detector = DuplicateDetector()
+        detector.register(ledger.get_plugin_manager(), deferred=True)
+        ledger_importer.import_ledger_file(io.StringIO(LEDGER_TEXT), ledger, lazy=True)
+        self.assertEqual(detector.transactions, [])
+        self.assertFalse(ledger.transactions[0].is_parsed())
+        self.assertEqual(len(detector.exact_duplicates()), 2)
+        self.assertEqual(len(detector.transactions), 7)
+
+    def test_for_ledger(self):
+        ledger = ledger_importer.import_ledger_file(io.StringIO(LEDGER_TEXT))
+        detector = DuplicateDetector.for_ledger(ledger)
+        ledger.add_transaction(Transaction('2022/07/18', 'rent',
+                                           [Transfer('Assets:MyBank:Checking', -1200, '$'),
+                                            Transfer('Expenses:Rent', 1200, '$')]))
+        self.assertEqual(len(detector.exact_duplicates()), 3)
+        self.assertEqual(detector.exact_duplicates()[2][1].description, 'rent')
+
+
+if __name__ == '__main__':
+    unittest.main()
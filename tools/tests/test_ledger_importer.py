@@ -1,10 +1,16 @@
+import io
+import operator
+import os
+from datetime import date
+import subprocess
 import sys
+import tempfile
 import unittest
 from unittest import mock
 
 sys.path.append('..')
 
-from ledger import TransferStatus  # noqa
+from ledger import Ledger, LedgerListenerType, Transfer, TransferStatus  # noqa
 import ledger_importer  # noqa
 
 
@@ -240,6 +246,68 @@ class TestLedgerImporter(unittest.TestCase):
         self.assertEqual(amt, -123.0)
         self.assertEqual(unit, 'FOO')
 
+    def test_lex_posting(self):
+        lex = ledger_importer._lex_posting
+
+        self.assertEqual(lex('    Asset:MyBank:Checking  $123.45'),
+                         (TransferStatus.DEFAULT, 'Asset:MyBank:Checking', 123.45, '$', None, None))
+        self.assertEqual(lex('      * Income:Nerds, Inc. \t$-1,000.45\n'),
+                         (TransferStatus.CLEARED, 'Income:Nerds, Inc.', -1000.45, '$', None, None))
+        self.assertEqual(lex('    ! Assets:MyBank:Savings  €42'),
+                         (TransferStatus.PENDING, 'Assets:MyBank:Savings', 42.0, '€', None, None))
+        self.assertEqual(lex('    Assets:Broker  -2.5 FOO'),
+                         (TransferStatus.DEFAULT, 'Assets:Broker', -2.5, 'FOO', None, None))
+        self.assertEqual(lex('    Assets:Broker  5 FOO @ $20.00'),
+                         (TransferStatus.DEFAULT, 'Assets:Broker', 5.0, 'FOO', 20.0, '$'))
+        self.assertEqual(lex('    Income:Nerds, Inc.'),
+                         (TransferStatus.DEFAULT, 'Income:Nerds, Inc.', None, None, None, None))
+        self.assertEqual(lex('    * Income:Nerds, Inc.   '),
+                         (TransferStatus.CLEARED, 'Income:Nerds, Inc.', None, None, None, None))
+
+        # a price without a unit is ignored, as it was before prices were read
+        for line in ['    A:B  5 FOO @ 3', '    A:B  5 FOO @ 3\n', '    A:B  5 FOO @ $$3']:
+            self.assertEqual(lex(line), (TransferStatus.DEFAULT, 'A:B', 5.0, 'FOO', None, None))
+        transaction = ledger_importer._form_transaction(['2022/07/14 Buy FOO',
+                                                         '    A:B  5 FOO @ 3\n',
+                                                         '    Asset:MyBank:Checking'])
+        self.assertEqual(transaction.transfers[0].amount, 5)
+
+        # not a posting
+        for line in ['Asset:MyBank:Checking  $123.45',
+                     '  Asset:MyBank:Checking  $123.45',
+                     '    Asset:MyBank:Checking  5',
+                     '    Asset:MyBank:Checking  $5.00 5']:
+            with self.assertRaises(ledger_importer.MalformedTransaction):
+                lex(line)
+
+        # posting with malformed amount
+        for line in ['    Asset:MyBank:Checking  $$2.00',
+                     '    Asset:MyBank:Checking  $-',
+                     '    Asset:MyBank:Checking  1.2.3 FOO']:
+            with self.assertRaises(ledger_importer.MalformedTransfer):
+                lex(line)
+
+    def test_form_transaction_with_price(self):
+        lines = ['2022/07/14 Buy FOO',
+                 '    Asset:Broker  5 FOO @ $20.00',
+                 '    Asset:MyBank:Checking']
+        transaction = ledger_importer._form_transaction(lines)
+
+        transfer1, transfer2 = transaction.transfers
+        self.assertEqual(transfer1.amount, 5.0)
+        self.assertEqual(transfer1.unit, 'FOO')
+        self.assertEqual(transfer1.price, 20.0)
+        self.assertEqual(transfer1.price_unit, '$')
+        self.assertEqual(transfer2.price, None)
+        self.assertEqual(transfer2.price_unit, None)
+
+    def test_form_transaction_with_multiple_empty_amounts(self):
+        lines = ['2022/07/14 Simple Transaction',
+                 '    Asset:MyBank:Checking',
+                 '    Income:Nerds, Inc.']
+        with self.assertRaises(ledger_importer.MalformedTransaction):
+            ledger_importer._form_transaction(lines)
+
     def test_form_transaction_simple_case(self):
         lines = ['2022/07/14 Simple Transaction',
                  '    Asset:MyBank:Checking  $123.45',
@@ -305,11 +373,11 @@ class TestLedgerImporter(unittest.TestCase):
 
     @mock.patch('ledger_importer.open')
     def test_parse_ledger_with_simple_transaction(self, mock_open):
-        mock_open.return_value.__enter__.return_value.readlines.return_value = """
+        mock_open.return_value.__enter__.return_value.__iter__.return_value = iter("""
 2022/01/02 Simple Transaction
     Asset:MyBank:Checking  $123.45
     Income:Nerds, Inc.
-""".split('\n')
+""".split('\n'))
         ledger = ledger_importer.import_ledger_file('fake.ledger')
         transactions = ledger.transactions
 
@@ -333,7 +401,7 @@ class TestLedgerImporter(unittest.TestCase):
 
     @mock.patch('ledger_importer.open')
     def test_parse_ledger_with_multiple_simple_transactions(self, mock_open):
-        mock_open.return_value.__enter__.return_value.readlines.return_value = """
+        mock_open.return_value.__enter__.return_value.__iter__.return_value = iter("""
 2022/01/02 Consulting Income
     Asset:MyBank:Checking  $123.45
     Income:Nerds, Inc.
@@ -341,7 +409,7 @@ class TestLedgerImporter(unittest.TestCase):
 2022/01/03 20m CW HF Radio Kit
     Expenses:Hobby:Ham Radio  $75
     Asset:MyBank:Checking
-""".split('\n')
+""".split('\n'))
         ledger = ledger_importer.import_ledger_file('fake.ledger')
         transactions = ledger.transactions
 
@@ -381,7 +449,7 @@ class TestLedgerImporter(unittest.TestCase):
 
     @mock.patch('ledger_importer.open')
     def test_parse_multiple_simple_transactions_with_comments(self, mock_open):
-        mock_open.return_value.__enter__.return_value.readlines.return_value = """
+        mock_open.return_value.__enter__.return_value.__iter__.return_value = iter("""
 ; Pay day!
 2022/01/02 Consulting Income
     Asset:MyBank:Checking  $123.45
@@ -401,7 +469,7 @@ class TestLedgerImporter(unittest.TestCase):
 ;;;;;;;;;;;;;;;;;;;;;;;;
 
 ; That's it!
-""".split('\n')
+""".split('\n'))
         ledger = ledger_importer.import_ledger_file('fake.ledger')
         transactions = ledger.transactions
 
@@ -442,7 +510,7 @@ class TestLedgerImporter(unittest.TestCase):
     @mock.patch('ledger_importer.open')
     def test_parse_ledger_with_multiple_simple_transactions_and_rules(self, mock_open):
         """Currently, the ledger parser should simply ignore ledger rules"""
-        mock_open.return_value.__enter__.return_value.readlines.return_value = """
+        mock_open.return_value.__enter__.return_value.__iter__.return_value = iter("""
 ; silly rule that puts money into savings
 ; each time we spend money on a hobby
 =/Expenses:Hobby/
@@ -467,7 +535,7 @@ class TestLedgerImporter(unittest.TestCase):
     Asset:MyBank:Checking  -1.0
     Asset:MyBank:Savings    1.0
 
-""".split('\n')
+""".split('\n'))
         ledger = ledger_importer.import_ledger_file('fake.ledger')
         transactions = ledger.transactions
 
@@ -505,5 +573,610 @@ class TestLedgerImporter(unittest.TestCase):
         self.assertEqual(transfer2.unit, None)
         self.assertEqual(transfer2.status, TransferStatus.DEFAULT)
 
+    def test_iter_blocks(self):
+        lines = ['',
+                 '; comment',
+                 '2022/01/02 Consulting Income',
+                 '    Asset:MyBank:Checking  $123.45',
+                 '  ',
+                 '\t',
+                 '2022/01/03 20m CW HF Radio Kit',
+                 '    Expenses:Hobby:Ham Radio  $75']
+        blocks = list(ledger_importer._iter_blocks(lines))
+        self.assertEqual(blocks, [(1, lines[1:4]), (6, lines[6:8])])
+
+        self.assertEqual(list(ledger_importer._iter_blocks([])), [])
+        self.assertEqual(list(ledger_importer._iter_blocks(['', ' '])), [])
+
+    def test_iter_transactions_from_file_object(self):
+        ledger_file = io.StringIO("""
+2022/01/02 Consulting Income
+    Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+
+=/Expenses:Hobby/
+    Asset:MyBank:Checking  -1.0
+    Asset:MyBank:Savings    1.0
+
+2022/01/03 20m CW HF Radio Kit
+    Expenses:Hobby:Ham Radio  $75
+    Asset:MyBank:Checking""")
+        transactions = ledger_importer.iter_transactions(ledger_file)
+
+        # transactions are yielded as soon as their block is read
+        t1 = next(transactions)
+        self.assertEqual(t1.description, 'Consulting Income')
+        self.assertLess(ledger_file.tell(), len(ledger_file.getvalue()))
+
+        t2 = next(transactions)
+        self.assertEqual(t2.date, '2022/01/03')
+        self.assertEqual(t2.description, '20m CW HF Radio Kit')
+        self.assertEqual(len(t2.transfers), 2)
+
+        with self.assertRaises(StopIteration):
+            next(transactions)
+
+    def test_import_ledger_file_from_file_object(self):
+        ledger_file = io.StringIO("""2022/01/02 Consulting Income
+    Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+""")
+        ledger = ledger_importer.import_ledger_file(ledger_file)
+        self.assertEqual(len(ledger.transactions), 1)
+        self.assertEqual(ledger.transactions[0].transfers[0].amount, 123.45)
+
+    @mock.patch('ledger_importer.open')
+    def test_import_ledger_file_with_missing_file(self, mock_open):
+        mock_open.side_effect = FileNotFoundError
+        with self.assertLogs(ledger_importer.logger):
+            with self.assertRaises(FileNotFoundError):
+                ledger_importer.import_ledger_file('missing.ledger')
+
+    def _write_ledger_file(self, text):
+        fd, path = tempfile.mkstemp(suffix='.ledger')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def _generate_ledger_text(self, count):
+        blocks = []
+        for i in range(count):
+            blocks.append(f"""; entry {i}
+2022/{i % 12 + 1}/{i % 28 + 1} Transaction {i}
+    Expenses:Hobby:Ham Radio  ${i}.50
+    Asset:MyBank:Checking""")
+        return '\n\n'.join(blocks) + '\n'
+
+    def test_chunk_file(self):
+        text = self._generate_ledger_text(50)
+        path = self._write_ledger_file(text)
+
+        chunks = ledger_importer._chunk_file(path, 8)
+        self.assertGreater(len(chunks), 1)
+        self.assertLessEqual(len(chunks), 8)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(text.encode()))
+        for (_, end), (start, _) in zip(chunks[:-1], chunks[1:]):
+            self.assertEqual(end, start)
+            # each chunk begins with a new block
+            self.assertTrue(text.encode()[start:].startswith(b'; entry'))
+
+    def test_import_ledger_file_with_workers(self):
+        path = self._write_ledger_file(self._generate_ledger_text(200))
+
+        seen = []
+        ledger = Ledger()
+        ledger.get_plugin_manager().register_listener(
+            LedgerListenerType.ADD_TRANSACTION,
+            lambda t: seen.append(t.description))
+        ledger = ledger_importer.import_ledger_file(path, ledger, workers=2)
+
+        expected = [f'Transaction {i}' for i in range(200)]
+        self.assertEqual([t.description for t in ledger.transactions], expected)
+        self.assertEqual(seen, expected)
+        self.assertEqual(ledger.transactions[3].date, '2022/4/4')
+        self.assertEqual(ledger.transactions[3].transfers[0].amount, 3.5)
+
+    def test_import_ledger_file_with_workers_requires_path(self):
+        with self.assertRaises(ValueError):
+            ledger_importer.import_ledger_file(io.StringIO(''), workers=2)
+
+    def test_iter_block_spans(self):
+        data = b'\n; comment\n2022/01/02 A\n    B  $1\n  \n\t\n2022/01/03 C\r\n    D  $2'
+        spans = list(ledger_importer._iter_block_spans(data))
+        self.assertEqual([data[o:o + n] for o, n in spans],
+                         [b'; comment\n2022/01/02 A\n    B  $1',
+                          b'2022/01/03 C\r\n    D  $2'])
+        self.assertEqual(list(ledger_importer._iter_block_spans(b' \n\n')), [])
+
+        # lines that only hold non-ASCII whitespace are blank too
+        data = '2022/01/02 A\n    B  $1\n\u00a0\n2022/01/03 Caf\u00e9\n    D  $2'.encode()
+        spans = list(ledger_importer._iter_block_spans(data))
+        self.assertEqual([data[o:o + n] for o, n in spans],
+                         [b'2022/01/02 A\n    B  $1',
+                          '2022/01/03 Caf\u00e9\n    D  $2'.encode()])
+
+    def test_import_ledger_file_incrementally(self):
+        ledger_importer.clear_manifests()
+        self.addCleanup(ledger_importer.clear_manifests)
+        path = self._write_ledger_file(self._generate_ledger_text(20))
+
+        parse = mock.Mock(wraps=ledger_importer._parse_block_bytes)
+        with mock.patch('ledger_importer._parse_block_bytes', parse):
+            ledger1 = ledger_importer.import_ledger_file(path, incremental=True)
+            self.assertEqual(parse.call_count, 20)
+
+            # append a transaction
+            with open(path, 'a') as f:
+                f.write('\n2022/12/31 Appended\n    Expenses:Food  $5\n    Asset:MyBank:Checking\n')
+            parse.reset_mock()
+            ledger2 = ledger_importer.import_ledger_file(path, incremental=True)
+            # only the appended block and the block before it are parsed
+            self.assertLessEqual(parse.call_count, 2)
+            self.assertEqual(len(ledger2.transactions), 21)
+            # each import gets its own copy of reused transactions
+            self.assertIsNot(ledger2.transactions[0], ledger1.transactions[0])
+            self.assertEqual(ledger2.transactions[0].description, ledger1.transactions[0].description)
+            self.assertEqual(ledger2.transactions[-1].description, 'Appended')
+
+            # edit a transaction in the middle of the file
+            with open(path) as f:
+                text = f.read()
+            with open(path, 'w') as f:
+                f.write(text.replace('Transaction 7\n', 'Edited 7\n'))
+            parse.reset_mock()
+            ledger3 = ledger_importer.import_ledger_file(path, incremental=True)
+            self.assertEqual(parse.call_count, 1)
+            self.assertEqual([t.description for t in ledger3.transactions],
+                             [t.description for t in ledger2.transactions[:7]] +
+                             ['Edited 7'] +
+                             [t.description for t in ledger2.transactions[8:]])
+            self.assertIsNot(ledger3.transactions[8], ledger2.transactions[8])
+
+            # the same read_ledger_file returns the same objects
+            transactions1 = ledger_importer.read_ledger_file(path, incremental=True)
+            parse.reset_mock()
+            transactions2 = ledger_importer.read_ledger_file(path, incremental=True)
+            self.assertEqual(parse.call_count, 0)
+            self.assertTrue(all(map(operator.is_, transactions1, transactions2)))
+
+    def test_import_ledger_file_incrementally_with_duplicate_blocks(self):
+        ledger_importer.clear_manifests()
+        self.addCleanup(ledger_importer.clear_manifests)
+        block = '2022/01/02 A\n    B  $1\n    C\n'
+        path = self._write_ledger_file(block + '\n' + block)
+
+        ledger1 = ledger_importer.import_ledger_file(path, incremental=True)
+        with open(path, 'w') as f:
+            f.write(block + '\n' + block + '\n' + block)
+        ledger2 = ledger_importer.import_ledger_file(path, incremental=True)
+
+        self.assertEqual(len(ledger2.transactions), 3)
+        # each transaction object is only used once
+        self.assertEqual(len(set(map(id, ledger2.transactions))), 3)
+        self.assertEqual([t.description for t in ledger2.transactions], ['A'] * 3)
+        self.assertEqual(len(ledger1.transactions), 2)
+
+    def test_import_ledger_file_incrementally_does_not_share_changes(self):
+        ledger_importer.clear_manifests()
+        self.addCleanup(ledger_importer.clear_manifests)
+        text = '2022/01/02 A\n    B  $1\n    C\n\n2022/01/03 D\n    E  $2\n    F  $-1\n'
+        for lazy in (False, True):
+            path = self._write_ledger_file(text)
+            ledger1 = ledger_importer.import_ledger_file(path, incremental=True, lazy=lazy)
+            ledger1.auto_balance()
+            # e.g. a plugin adding a transfer
+            ledger1.transactions[1].transfers.append(Transfer('J', -1, '$'))
+
+            with open(path, 'a') as f:
+                f.write('\n2022/01/04 G\n    H  $3\n    I\n')
+            ledger2 = ledger_importer.import_ledger_file(path, incremental=True, lazy=lazy)
+            self.assertEqual(len(ledger2.transactions), 3)
+            self.assertIsNone(ledger2.transactions[0].transfers[1].amount)
+            self.assertEqual(len(ledger2.transactions[1].transfers), 2)
+            self.assertEqual(ledger1.transactions[0].transfers[1].amount, -1)
+
+    def test_mapped_ledger_file(self):
+        text = '; header\n\n2022/01/02 A\n    B  $1\n    C\n \n\n2022/01/03 D\n    E  $2\n    F\n'
+        path = self._write_ledger_file(text)
+        data = text.encode()
+
+        with ledger_importer.MappedLedgerFile(path) as mapped:
+            self.assertEqual(mapped.size, len(data))
+            spans = list(mapped.spans())
+            self.assertEqual([mapped.block(o, n) for o, n in spans],
+                             [b'; header',
+                              b'2022/01/02 A\n    B  $1\n    C',
+                              b'2022/01/03 D\n    E  $2\n    F'])
+            self.assertEqual(mapped.block_lines(*spans[1]),
+                             ['2022/01/02 A', '    B  $1', '    C'])
+
+            # boundaries are the start of the line after a blank line
+            self.assertEqual(mapped.next_boundary(0), data.index(b'2022/01/02'))
+            boundary = mapped.next_boundary(data.index(b'    B'))
+            self.assertTrue(data[boundary:].lstrip().startswith(b'2022/01/03'))
+            self.assertEqual(data[boundary - 1:boundary], b'\n')
+            self.assertEqual(mapped.next_boundary(data.index(b'    E')), len(data))
+
+            # only blocks in the given range are scanned
+            start = mapped.next_boundary(0)
+            end = mapped.next_boundary(start)
+            self.assertEqual(list(mapped.spans(start, end)), [spans[1]])
+
+    def test_mapped_ledger_file_when_empty(self):
+        path = self._write_ledger_file('')
+        with ledger_importer.MappedLedgerFile(path) as mapped:
+            self.assertEqual(list(mapped.spans()), [])
+            self.assertEqual(mapped.next_boundary(0), 0)
+        self.assertEqual(len(ledger_importer.import_ledger_file(path, mapped=True).transactions), 0)
+
+    def test_iter_mapped_transactions(self):
+        path = self._write_ledger_file(self._generate_ledger_text(30))
+        mapped = list(ledger_importer.iter_mapped_transactions(path))
+        streamed = list(ledger_importer.iter_transactions(path))
+
+        self.assertEqual(len(mapped), 30)
+        for t1, t2 in zip(mapped, streamed):
+            self.assertEqual(t1.date, t2.date)
+            self.assertEqual(t1.description, t2.description)
+            self.assertEqual([(tr.account, tr.amount, tr.unit) for tr in t1.transfers],
+                             [(tr.account, tr.amount, tr.unit) for tr in t2.transfers])
+
+        ledger = ledger_importer.import_ledger_file(path, mapped=True)
+        self.assertEqual([t.description for t in ledger.transactions],
+                         [t.description for t in streamed])
+
+    def test_import_modes_agree(self):
+        text = self._generate_ledger_text(20)
+        texts = {'LF': text,
+                 'CRLF': text.replace('\n', '\r\n'),
+                 'NBSP': text.replace('\n\n', '\n\u00a0\n'),
+                 'CRLF and NBSP': text.replace('\n\n', '\n\u2003\n').replace('\n', '\r\n')}
+        expected = [(f'2022/{i % 12 + 1}/{i % 28 + 1}', f'Transaction {i}',
+                     [('Expenses:Hobby:Ham Radio', i + 0.5), ('Asset:MyBank:Checking', None)])
+                    for i in range(20)]
+
+        for name, text in texts.items():
+            fd, path = tempfile.mkstemp(suffix='.ledger')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(text.encode())
+            self.addCleanup(os.remove, path)
+
+            for kwargs in ({}, {'mapped': True}, {'workers': 2}, {'incremental': True},
+                           {'since': date(2022, 1, 1)}, {'accounts': ['Expenses']},
+                           {'lazy': True, 'mapped': True}):
+                with self.subTest(name, **kwargs):
+                    ledger_importer.clear_manifests()
+                    ledger = ledger_importer.import_ledger_file(path, **kwargs)
+                    self.assertEqual([(t.date, t.description,
+                                       [(tr.account, tr.amount) for tr in t.transfers])
+                                      for t in ledger.transactions], expected)
+            ledger_importer.clear_manifests()
+
+            with self.subTest(name, check=True):
+                report = ledger_importer.check_ledger_file(path)
+                self.assertEqual(report.problems, [])
+                self.assertEqual(report.blocks, 20)
+                self.assertEqual(report.transactions, 20)
+
+    def test_transaction_filter_accepts_lines(self):
+        lines = ['2022/7/14=2022/07/20 Groceries',
+                 '    Expenses:Food:Groceries  $42.00',
+                 '    Asset:MyBank:Checking']
+        TransactionFilter = ledger_importer.TransactionFilter
+
+        self.assertTrue(TransactionFilter().accepts_lines(lines))
+        self.assertTrue(TransactionFilter(since=date(2022, 7, 14)).accepts_lines(lines))
+        self.assertFalse(TransactionFilter(since=date(2022, 7, 15)).accepts_lines(lines))
+        self.assertTrue(TransactionFilter(until=date(2022, 7, 14)).accepts_lines(lines))
+        self.assertFalse(TransactionFilter(until=date(2022, 7, 13)).accepts_lines(lines))
+        self.assertTrue(TransactionFilter(accounts=['Expenses:Food']).accepts_lines(lines))
+        self.assertFalse(TransactionFilter(accounts=['Expenses:Hobby']).accepts_lines(lines))
+
+        # malformed dates are left for the parser to report
+        self.assertTrue(TransactionFilter(since=date(2022, 7, 15)).accepts_lines(['2022/13/1 Oops']))
+
+    def test_transaction_filter_rejects_raw_block(self):
+        block = b'2022/07/14 Groceries\n    Expenses:Food:Groceries  $42.00\n    Asset:MyBank:Checking'
+        TransactionFilter = ledger_importer.TransactionFilter
+
+        self.assertFalse(TransactionFilter().rejects_raw_block(block))
+        self.assertTrue(TransactionFilter(since=date(2022, 8, 1)).rejects_raw_block(block))
+        self.assertFalse(TransactionFilter(since=date(2022, 7, 1)).rejects_raw_block(block))
+        self.assertTrue(TransactionFilter(accounts=['Expenses:Hobby']).rejects_raw_block(block))
+        self.assertFalse(TransactionFilter(accounts=['Expenses:Food']).rejects_raw_block(block))
+
+        # blocks that begin with a comment are never rejected by date
+        self.assertFalse(TransactionFilter(since=date(2022, 8, 1)).rejects_raw_block(b'; note\n' + block))
+
+    def test_transaction_filter_accepts_transfers(self):
+        transaction = ledger_importer._form_transaction(['2022/07/14 Groceries',
+                                                         '    Expenses:Food:Groceries  $42.00',
+                                                         '    Asset:MyBank:Checking'])
+        TransactionFilter = ledger_importer.TransactionFilter
+
+        self.assertTrue(TransactionFilter(accounts=['Expenses:Food']).accepts(transaction))
+        self.assertTrue(TransactionFilter(accounts=['Asset:MyBank:Checking']).accepts(transaction))
+        # account names must match whole components
+        self.assertFalse(TransactionFilter(accounts=['Expenses:Foo']).accepts(transaction))
+        self.assertFalse(TransactionFilter(until=date(2022, 7, 1)).accepts(transaction))
+
+    def test_import_ledger_file_with_filters(self):
+        text = """
+2022/01/02 Consulting Income
+    Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+
+; this block is malformed, but is never parsed
+2022/01/03 Broken
+    Expenses:Hobby  $$75
+
+2022/02/01 Groceries
+    Expenses:Food:Groceries  $42.00
+    Asset:MyBank:Checking
+
+2022/03/01 Foodie magazine
+    Expenses:Foodie  $5.00
+    Asset:MyBank:Checking
+"""
+        path = self._write_ledger_file(text)
+        for source in (path, io.StringIO(text)):
+            ledger = ledger_importer.import_ledger_file(source, since=date(2022, 1, 15))
+            self.assertEqual([t.description for t in ledger.transactions],
+                             ['Groceries', 'Foodie magazine'])
+
+        ledger = ledger_importer.import_ledger_file(path, since=date(2022, 1, 15),
+                                                    until=date(2022, 2, 28))
+        self.assertEqual([t.description for t in ledger.transactions], ['Groceries'])
+
+        ledger = ledger_importer.import_ledger_file(path, since=date(2022, 1, 15),
+                                                    accounts=['Expenses:Food'])
+        self.assertEqual([t.description for t in ledger.transactions], ['Groceries'])
+
+        # the malformed block is only parsed when inside the window
+        with self.assertRaises(ledger_importer.MalformedTransfer):
+            ledger_importer.import_ledger_file(path, until=date(2022, 1, 31))
+
+        with self.assertRaises(ValueError):
+            ledger_importer.import_ledger_file(path, incremental=True, since=date(2022, 1, 1))
+
+    def test_import_ledger_file_lazily_with_filters(self):
+        text = """
+2022/01/02 Consulting Income
+    Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+
+2022/02/01 Groceries
+    ; Expenses:Foodie
+    * Expenses:Food:Groceries  $42.00
+    Asset:MyBank:Checking
+
+2022/02/03 Broken
+    Expenses:Food  $$75
+    Asset:MyBank:Checking
+
+2022/03/01 Foodie magazine
+    Expenses:Foodie  $5.00  ; not Expenses:Food
+    Asset:MyBank:Checking
+"""
+        path = self._write_ledger_file(text)
+        for source in (path, io.StringIO(text)):
+            ledger = ledger_importer.import_ledger_file(source, lazy=True, accounts=['Expenses:Food'],
+                                                        since=date(2022, 1, 15))
+            self.assertEqual([t.description for t in ledger.transactions], ['Groceries', 'Broken'])
+            # filtering did not parse any transfers
+            self.assertFalse(any(t.is_parsed() for t in ledger.transactions))
+            errors = ledger_importer.validate_transfers(ledger.transactions)
+            self.assertEqual([(t.description, type(e)) for t, e in errors],
+                             [('Broken', ledger_importer.MalformedTransfer)])
+
+    def test_cli_rejects_check_with_workers_or_lazy(self):
+        path = self._write_ledger_file('2022/01/02 Consulting Income\n'
+                                       '    Asset:MyBank:Checking  $123.45\n'
+                                       '    Income:Nerds, Inc.\n')
+        script = os.path.join(os.path.dirname(ledger_importer.__file__), 'ledger_importer.py')
+        for options in (['--workers', '2'], ['--lazy']):
+            result = subprocess.run([sys.executable, script, path, '--check'] + options,
+                                    capture_output=True, text=True)
+            self.assertEqual(result.returncode, 2)
+            self.assertIn('--check can not be used with --workers or --lazy', result.stderr)
+            self.assertNotIn('Traceback', result.stderr)
+        result = subprocess.run([sys.executable, script, path, '--check'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_parse_header(self):
+        self.assertEqual(ledger_importer._parse_header('2022/7/14 Simple Transaction'),
+                         ('2022/7/14', None, 'Simple Transaction'))
+        self.assertEqual(ledger_importer._parse_header('2022/02/25=2022/03/07 Effective'),
+                         ('2022/02/25', '2022/03/07', 'Effective'))
+
+        with self.assertRaisesRegex(ledger_importer.MalformedTransaction, 'Expected date'):
+            ledger_importer._parse_header('July 14th Simple Transaction')
+        with self.assertRaisesRegex(ledger_importer.MalformedTransaction, 'Could not find description'):
+            ledger_importer._parse_header('2022/07/14')
+
+    def test_lazy_transaction(self):
+        lines = ['; leading comment',
+                 '2022/07/14 Simple Transaction  ; header comment',
+                 '    ; comment between transfers',
+                 '    * Asset:MyBank:Checking  $123.45',
+                 '    Income:Nerds, Inc.  ; trailing comment']
+        transaction = ledger_importer._parse_block(lines, lazy=True)
+
+        self.assertIsInstance(transaction, ledger_importer.LazyTransaction)
+        self.assertEqual(transaction.date, '2022/07/14')
+        self.assertEqual(transaction.description, 'Simple Transaction')
+        self.assertFalse(transaction.is_parsed())
+
+        with mock.patch('ledger_importer._form_transfers',
+                        wraps=ledger_importer._form_transfers) as form_transfers:
+            transfers = transaction.transfers
+            self.assertIs(transaction.transfers, transfers)
+            form_transfers.assert_called_once()
+        self.assertTrue(transaction.is_parsed())
+
+        transfer1, transfer2 = transfers
+        self.assertEqual(transfer1.account, 'Asset:MyBank:Checking')
+        self.assertEqual(transfer1.amount, 123.45)
+        self.assertEqual(transfer1.status, TransferStatus.CLEARED)
+        self.assertEqual(transfer2.account, 'Income:Nerds, Inc.')
+        self.assertEqual(transfer2.amount, None)
+
+        # comments and rules are still skipped
+        self.assertIsNone(ledger_importer._parse_block(['; only', '; comments'], lazy=True))
+        self.assertIsNone(ledger_importer._parse_block(['=/Expenses:Hobby/',
+                                                        '    Asset:MyBank:Checking  -1.0'], lazy=True))
+
+    def test_import_ledger_file_lazily(self):
+        text = """
+2022/01/02 Consulting Income
+    Asset:MyBank:Checking  $123.45
+    Income:Nerds, Inc.
+
+2022/01/03 Broken
+    Expenses:Hobby  $$75
+    Asset:MyBank:Checking
+
+2022/01/04 No transfers
+"""
+        path = self._write_ledger_file(text)
+        for source, kwargs in ((io.StringIO(text), {}),
+                               (path, {'mapped': True}),
+                               (path, {'workers': 2})):
+            ledger = ledger_importer.import_ledger_file(source, lazy=True, **kwargs)
+            self.assertEqual([t.description for t in ledger.transactions],
+                             ['Consulting Income', 'Broken', 'No transfers'])
+
+            errors = ledger_importer.validate_transfers(ledger.transactions)
+            self.assertEqual([(t.description, type(e)) for t, e in errors],
+                             [('Broken', ledger_importer.MalformedTransfer),
+                              ('No transfers', ledger_importer.MalformedTransaction)])
+            self.assertEqual(ledger.transactions[0].transfers[0].amount, 123.45)
+
+    def test_import_ledger_file_with_stats(self):
+        text = self._generate_ledger_text(40)
+        path = self._write_ledger_file(text)
+
+        for kwargs in ({}, {'mapped': True}, {'workers': 2}, {'incremental': True}):
+            ledger_importer.clear_manifests()
+            stats = ledger_importer.ImportStats()
+            ledger = Ledger()
+            # profiled imports add transactions in chunks like any other
+            with mock.patch.object(ledger, 'add_transaction') as add_transaction:
+                ledger_importer.import_ledger_file(path, ledger, stats=stats, **kwargs)
+            add_transaction.assert_not_called()
+            self.assertEqual(len(ledger.transactions), 40)
+
+            self.assertEqual(stats.bytes, len(text.encode()))
+            self.assertEqual(stats.blocks, 40)
+            self.assertEqual(stats.transactions, 40)
+            self.assertEqual(stats.postings, 80)
+            for phase in ('scan', 'strip_comments', 'header', 'postings', 'add_transaction'):
+                self.assertGreater(stats.times[phase], 0.0, phase)
+            self.assertGreater(stats.wall_time, 0.0)
+            self.assertGreater(stats.transactions_per_second(), 0.0)
+            self.assertGreater(stats.bytes_per_second(), 0.0)
+        ledger_importer.clear_manifests()
+
+        report = stats.report()
+        self.assertIn('strip_comments', report)
+        self.assertIn('40 transactions', report)
+        self.assertIn('transactions/s', report)
+
+    def test_import_ledger_file_lazily_with_stats(self):
+        stats = ledger_importer.ImportStats()
+        ledger_importer.import_ledger_file(io.StringIO(self._generate_ledger_text(10)),
+                                           lazy=True, stats=stats)
+        self.assertEqual(stats.transactions, 10)
+        self.assertEqual(stats.postings, 0)
+        self.assertEqual(stats.times['postings'], 0.0)
+        self.assertGreater(stats.times['header'], 0.0)
+
+    def test_check_ledger_file(self):
+        text = """; header
+
+2022/01/01 Balanced
+    Expenses:Food  $10.00
+    Asset:MyBank:Checking
+
+2022/01/02 Unbalanced
+    Expenses:Food  $10.00
+    Asset:MyBank:Checking  $-9.00
+
+not a transaction
+    Expenses:Food  $1.00
+
+2022/01/03 Broken
+    Expenses:Food  $$75
+    Asset:MyBank:Checking
+
+2022/01/04 Last
+    Expenses:Food  $1.00
+    Asset:MyBank:Checking
+"""
+        path = self._write_ledger_file(text)
+        for source, offsets in ((path, [83, 166, 210]),
+                                (io.StringIO(text), [None, None, None])):
+            report = ledger_importer.check_ledger_file(source)
+            self.assertFalse(report.ok())
+            self.assertEqual(report.blocks, 6)
+            self.assertEqual(report.transactions, 3)
+            self.assertEqual([(p.line, p.offset) for p in report.problems],
+                             list(zip([7, 11, 14], offsets)))
+            self.assertEqual(report.problems[0].transaction.description, 'Unbalanced')
+            self.assertIn('MalformedTransaction', report.problems[1].message)
+            self.assertIn('MalformedTransfer', report.problems[2].message)
+            self.assertIn('3 problems found', report.format())
+
+    def test_import_ledger_file_when_not_strict(self):
+        text = """
+2022/01/02 Broken
+    Expenses:Hobby  $$75
+    Asset:MyBank:Checking
+
+2022/01/03 Fine
+    Expenses:Hobby  $75
+    Asset:MyBank:Checking
+"""
+        with self.assertRaises(ledger_importer.MalformedTransfer):
+            ledger_importer.import_ledger_file(io.StringIO(text))
+
+        report = ledger_importer.ValidationReport()
+        ledger = ledger_importer.import_ledger_file(io.StringIO(text), strict=False, report=report)
+        self.assertEqual([t.description for t in ledger.transactions], ['Fine'])
+        self.assertEqual([p.line for p in report.problems], [2])
+
+        path = self._write_ledger_file(text)
+        for kwargs in ({'workers': 2}, {'incremental': True}, {'cache': True}, {'lazy': True}):
+            with self.assertRaises(ValueError):
+                ledger_importer.import_ledger_file(path, strict=False, **kwargs)
+
+    def test_import_ledger_file_lazily_indexes_accounts(self):
+        text = self._generate_ledger_text(3)
+        ledger = ledger_importer.import_ledger_file(io.StringIO(text), lazy=True)
+        self.assertFalse(any(t.is_parsed() for t in ledger.transactions))
+        self.assertEqual(len(ledger.postings('Expenses:Hobby')), 3)
+        self.assertTrue(all(t.is_parsed() for t in ledger.transactions))
+
+    def test_import_effective_dates(self):
+        text = """
+2022/02/25=2022/03/07 Effective
+    Expenses:Hobby  $75
+    Asset:MyBank:Checking
+
+2022/02/26 Not effective
+    Expenses:Hobby  $75
+    Asset:MyBank:Checking
+"""
+        for lazy in (False, True):
+            ledger = ledger_importer.import_ledger_file(io.StringIO(text), lazy=lazy)
+            self.assertEqual([(t.date, t.effective_date) for t in ledger.transactions],
+                             [('2022/02/25', '2022/03/07'), ('2022/02/26', None)])
+            self.assertEqual([t.description for t in ledger.transactions_between(
+                                 date(2022, 3, 1), effective=True)], ['Effective'])
+
+
 if __name__ == '__main__':
     unittest.main()
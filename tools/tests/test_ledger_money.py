@@ -0,0 +1,78 @@
+from array import array
+import pickle
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger_money import Amount, sum_amounts, sum_by_unit  # noqa
+
+
+class TestLedgerMoney(unittest.TestCase):
+
+    def test_parse(self):
+        amount = Amount.parse('-1,234.50')
+        self.assertEqual((amount.value, amount.scale), (-123450, 2))
+        self.assertEqual(str(amount), '-1234.50')
+        self.assertEqual(str(Amount.parse('.5')), '0.5')
+        self.assertEqual(str(Amount.parse('+12')), '12')
+        self.assertEqual(str(Amount.parse('-0.05')), '-0.05')
+        self.assertEqual(Amount('12.50').value, 1250)
+        self.assertEqual(eval(repr(Amount.parse('-7.25'))).value, -725)
+        for text in ('', '-', '.', '1.2.3', '1e5', 'abc'):
+            with self.assertRaises(ValueError):
+                Amount.parse(text)
+
+    def test_coerce(self):
+        self.assertEqual(str(Amount.coerce(0.1)), '0.1')
+        self.assertEqual(str(Amount.coerce(1e-7)), '0.0000001')
+        self.assertEqual(str(Amount.coerce(12)), '12')
+        self.assertEqual(str(Amount.coerce('3.10')), '3.10')
+        with self.assertRaises(TypeError):
+            Amount.coerce(None)
+
+    def test_arithmetic_is_exact(self):
+        total = sum(Amount.parse('0.1') for _ in range(10))
+        self.assertEqual(total, 1)
+        self.assertEqual(str(Amount.parse('0.1') + Amount.parse('0.2')), '0.3')
+        self.assertEqual(str(Amount.parse('1.5') * Amount.parse('0.25')), '0.375')
+        self.assertEqual(str(1 - Amount.parse('0.01')), '0.99')
+        self.assertEqual(str(-Amount.parse('2.50')), '-2.50')
+        self.assertEqual(str(abs(Amount.parse('-2.50'))), '2.50')
+        self.assertFalse(Amount.parse('0.00'))
+
+    def test_compare_and_hash(self):
+        self.assertEqual(Amount.parse('1.50'), Amount.parse('1.5'))
+        self.assertEqual(hash(Amount.parse('1.50')), hash(Amount.parse('1.5')))
+        self.assertEqual(Amount.parse('123.45'), 123.45)
+        self.assertEqual(hash(Amount.parse('123.45')), hash(123.45))
+        self.assertEqual(hash(Amount.parse('2.0')), hash(2))
+        self.assertNotEqual(Amount.parse('0.3'), 0.1 + 0.2)
+        self.assertNotEqual(Amount.parse('1'), 'one')
+        self.assertNotEqual(Amount.parse('1'), float('nan'))
+        self.assertLess(Amount.parse('-0.01'), 0)
+        self.assertGreater(Amount.parse('0.10'), Amount.parse('0.09'))
+        self.assertEqual(len({Amount.parse('5'), Amount.parse('5.00'), 5.0}), 1)
+
+    def test_format_and_pickle(self):
+        amount = Amount.parse('1234.5')
+        self.assertEqual(f'{amount:,.2f}', '1,234.50')
+        self.assertEqual(repr(amount), "Amount('1234.5')")
+        copy = pickle.loads(pickle.dumps(amount))
+        self.assertEqual((copy.value, copy.scale), (amount.value, amount.scale))
+
+    def test_sum_by_unit(self):
+        values = array('q', [10, -10, 25, 5, 1])
+        unit_ids = array('l', [0, 0, 1, 1, 2])
+        self.assertEqual(sum_by_unit(values, unit_ids), {0: 0, 1: 30, 2: 1})
+        self.assertEqual(sum_by_unit(array('q'), array('l')), {})
+
+    def test_sum_amounts(self):
+        totals = sum_amounts([('$', Amount.parse('0.1')), ('$', Amount.parse('0.25')),
+                              ('EUR', Amount.parse('3')), ('$', Amount.parse('1'))])
+        self.assertEqual(totals, {'$': Amount.parse('1.35'), 'EUR': 3})
+        self.assertEqual(str(totals['$']), '1.35')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+from collections import Counter
+from datetime import date
+import io
+import random
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger import Ledger, Transaction, Transfer  # noqa
+from ledger_columnar import ColumnarLedger  # noqa
+import ledger_importer  # noqa
+from ledger_money import Amount  # noqa
+from ledger_query import AccountTerm, And, AmountTerm, DateTerm, Not, Or, PayeeTerm, Query, \
+    QuerySyntaxError, UnitTerm, format_amount, parse_query  # noqa
+
+
+LEDGER_TEXT = """
+2022/07/01 Paycheck
+    Assets:MyBank:Checking  $1,000.00
+    Income:Nerds, Inc.
+
+2022/07/16 Safeway
+    Expenses:Food:Groceries  $42.50
+    Assets:MyBank:Checking
+
+2022/07/18=2022/07/25 Stock
+    Assets:Broker  5 FOO @ $20.00
+    Assets:MyBank:Checking
+
+2022/07/20 Safeway
+    Expenses:Food:Groceries  $17.25
+    Expenses:Household  $5.00
+    Assets:MyBank:Checking
+
+2022/07/20 Dinner
+    Expenses:Food:Restaurants  $30.00
+    Liabilities:CreditCard
+"""
+
+
+class TestLedgerQuery(unittest.TestCase):
+
+    def _ledger(self, ledger=None):
+        ledger = ledger_importer.import_ledger_file(io.StringIO(LEDGER_TEXT), ledger)
+        ledger.auto_balance()
+        return ledger
+
+    def _descriptions(self, query, ledger, **kwargs):
+        return [(t.description, tr.account) for t, tr in Query(query, **kwargs).postings(ledger)]
+
+    def test_parse_query(self):
+        term = parse_query('Expenses @safe amount>=10.5 date<2022/08/01 unit=$')
+        self.assertIsInstance(term, And)
+        self.assertEqual([type(t) for t in term.terms],
+                         [AccountTerm, PayeeTerm, AmountTerm, DateTerm, UnitTerm])
+        self.assertEqual(term.terms[2].amount, Amount('10.5'))
+        self.assertEqual(term.terms[3].day, date(2022, 8, 1))
+
+        term = parse_query(['not', '(', 'Food', 'or', 'Rent', ')', 'and', 'payee!=Safeway'])
+        self.assertEqual(str(term), '(not (account=Food or account=Rent) and not payee=Safeway)')
+        self.assertIsInstance(term, And)
+        negated, payee = term.terms
+        self.assertIsInstance(negated, Not)
+        self.assertIsInstance(negated.term, Or)
+        self.assertEqual([(type(t), t.pattern) for t in negated.term.terms],
+                         [(AccountTerm, 'Food'), (AccountTerm, 'Rent')])
+        self.assertIsInstance(payee, Not)
+        self.assertIsInstance(payee.term, PayeeTerm)
+        # `or` binds looser than `and`
+        term = parse_query('Food @Safeway or Rent')
+        self.assertIsInstance(term, Or)
+        self.assertEqual([type(t) for t in term.terms], [And, AccountTerm])
+        self.assertIsInstance(parse_query('not not Food').term, Not)
+        self.assertEqual(str(parse_query('')), '(all)')
+        self.assertEqual(str(parse_query('(Food|Rent) (@Safeway or Card)')),
+                         '(account=(Food|Rent) and (payee=Safeway or account=Card))')
+        self.assertEqual(str(parse_query("'@Nerds, Inc.'")), 'payee=Nerds, Inc.')
+
+        for query in ('date>2022/13/01', 'amount<ten', 'payee>x', 'unit<$', '(Food',
+                      'Food )', 'not', 'Food or', '[unclosed'):
+            with self.assertRaises(QuerySyntaxError, msg=query):
+                parse_query(query)
+
+    def test_postings(self):
+        ledger = self._ledger()
+        self.assertEqual(self._descriptions('Groceries', ledger),
+                         [('Safeway', 'Expenses:Food:Groceries'),
+                          ('Safeway', 'Expenses:Food:Groceries')])
+        self.assertEqual(self._descriptions('@safeway not groceries', ledger),
+                         [('Safeway', 'Assets:MyBank:Checking'),
+                          ('Safeway', 'Expenses:Household'),
+                          ('Safeway', 'Assets:MyBank:Checking')])
+        self.assertEqual(self._descriptions('Expenses amount>20', ledger),
+                         [('Safeway', 'Expenses:Food:Groceries'),
+                          ('Dinner', 'Expenses:Food:Restaurants')])
+        self.assertEqual(self._descriptions('unit=FOO or CreditCard', ledger),
+                         [('Stock', 'Assets:Broker'), ('Dinner', 'Liabilities:CreditCard')])
+        self.assertEqual(self._descriptions('date=2022/07/20 amount=-22.25', ledger),
+                         [('Safeway', 'Assets:MyBank:Checking')])
+        self.assertEqual(self._descriptions('Broker date>2022/07/20', ledger), [])
+        self.assertEqual(self._descriptions('Broker date>2022/07/20', ledger, effective=True),
+                         [('Stock', 'Assets:Broker')])
+
+    def test_plan(self):
+        ledger = self._ledger()
+        self.assertEqual(Query('').plan(ledger).index, 'scan')
+        self.assertEqual(Query('@Safeway').plan(ledger).index, 'scan')
+        self.assertEqual(Query('Broker').plan(ledger).index, 'account')
+        self.assertEqual(Query('Broker').plan(ledger).estimate, 1)
+        self.assertEqual(Query('date>=2022/07/20').plan(ledger).index, 'date')
+        self.assertEqual(Query('date>=2022/07/20').plan(ledger).estimate, 4)
+        self.assertEqual(Query('date>2022/07/20 date<2022/07/18').plan(ledger).estimate, 0)
+        # there is no amount index to use until one is asked for
+        self.assertEqual(Query('amount>500').plan(ledger).index, 'scan')
+        ledger.index_amounts()
+        plan = Query('amount>500 Assets').plan(ledger)
+        self.assertEqual((plan.index, plan.estimate), ('amount', 1))
+        self.assertIn('amount index', str(plan))
+        # disjunctions and negations are only checked
+        self.assertEqual(Query('Broker or @Dinner').plan(ledger).index, 'scan')
+        self.assertEqual(Query('not Expenses').plan(ledger).index, 'scan')
+        self.assertEqual(Query('Broker or CreditCard').plan(ledger).estimate, 2)
+
+    def test_plans_give_the_same_postings(self):
+        rng = random.Random(3)
+        accounts = ['Expenses:Food', 'Expenses:Rent', 'Assets:Checking', 'Assets:Savings',
+                    'Liabilities:Card']
+        for ledger in (Ledger(), ColumnarLedger()):
+            for i in range(300):
+                amount = Amount(rng.randrange(1, 20000), 2)
+                ledger.add_transaction(Transaction(
+                    f'2022/{rng.randrange(1, 13)}/{rng.randrange(1, 29)}', f'Payee {i % 7}',
+                    [Transfer(rng.choice(accounts), amount, '$'),
+                     Transfer(rng.choice(accounts), -amount, '$')]))
+            ledger.index_amounts()
+
+            for query in ('Expenses date>=2022/06/01', 'amount>100 amount<=150.5',
+                          'date<2022/03/01 @3', '(Rent or Card) amount<0',
+                          'date=2022/05/05', 'not Assets date>2022/10/01 amount>=50'):
+                query = Query(query)
+                plan = query.plan(ledger)
+                scan = query.plan(ledger)
+                scan.index, scan.by_date = 'scan', False
+                scan.candidates = lambda: ((t, tr) for t in ledger.transactions
+                                           for tr in t.transfers)
+                indexed = query.postings(ledger)
+                scanned = query.postings(ledger, scan)
+                self.assertNotEqual(plan.index, 'scan')
+                key = lambda posting: (posting[0].date, posting[0].description,
+                                       posting[1].account, posting[1].amount)
+                self.assertEqual(Counter(map(key, indexed)), Counter(map(key, scanned)))
+                ordinals = [query._ordinal(t) for t, _ in indexed]
+                self.assertEqual(ordinals, sorted(ordinals))
+
+    def test_register(self):
+        rows = Query('Checking').register(self._ledger())
+        self.assertEqual([(t.description, tr.amount, total) for t, tr, total in rows],
+                         [('Paycheck', 1000, 1000), ('Safeway', -42.5, 957.5),
+                          ('Stock', -100, 857.5), ('Safeway', Amount('-22.25'), Amount('835.25'))])
+
+    def test_balance(self):
+        for ledger in (self._ledger(), self._ledger(ColumnarLedger())):
+            self.assertEqual(Query('Expenses').balance(ledger),
+                             {'Expenses:Food:Groceries': {'$': Amount('59.75')},
+                              'Expenses:Food:Restaurants': {'$': 30},
+                              'Expenses:Household': {'$': 5}})
+            self.assertEqual(Query('Assets').balance(ledger),
+                             {'Assets:Broker': {'FOO': 5},
+                              'Assets:MyBank:Checking': {'$': Amount('835.25')}})
+
+    def test_format_amount(self):
+        self.assertEqual(format_amount(Amount('-12.50'), '$'), '$-12.50')
+        self.assertEqual(format_amount(Amount('5'), 'FOO'), '5 FOO')
+        self.assertEqual(format_amount(Amount('5'), None), '5')
+        self.assertEqual(format_amount(None, '$'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+from datetime import date
+import io
+import sys
+import unittest
+
+sys.path.append('..')
+
+from ledger_columnar import ColumnarLedger  # noqa
+from ledger_importer import import_ledger_file  # noqa
+from ledger_money import Amount  # noqa
+from ledger_reconcile import BankTransaction, PostingIndex, cents, match_splits, reconcile, \
+    reconcile_ledger  # noqa
+
+
+LEDGER_TEXT = """
+2022/07/01 Paycheck
+    Assets:MyBank:Checking  $1,000.00
+    Income:Nerds, Inc.
+
+2022/07/05 Safeway
+    Expenses:Food:Groceries  $42.50
+    Assets:MyBank:Checking
+
+2022/07/06 Safeway
+    Expenses:Food:Groceries  $42.50
+    Assets:MyBank:Checking
+
+2022/07/10=2022/07/12 Coffee
+    Expenses:Food:Coffee  $5
+    Liabilities:Card
+
+2022/07/20 Rent
+    Expenses:Rent  $1,200
+    Assets:MyBank:Checking
+
+2022/07/21 Brokerage
+    Assets:Brokerage  0.125 AAPL
+    Assets:MyBank:Checking  $-20.00
+"""
+
+SPLIT_LEDGER_TEXT = """
+2022/07/03 Costco
+    Expenses:Food:Groceries  $60.00
+    Liabilities:Card
+
+2022/07/03 Costco
+    Expenses:Household  $30.00
+    Liabilities:Card
+
+2022/07/03 Costco
+    Expenses:Household  $10.25
+    Liabilities:Card
+
+2022/07/08 Gas
+    Expenses:Auto:Gas  $41
+    Liabilities:Card
+
+2022/07/15 Hardware store
+    Expenses:Household  $75.00
+    Liabilities:Card
+
+2022/07/30 Pharmacy
+    Expenses:Health  $9.75
+    Liabilities:Card
+"""
+
+
+def bank(amount, day=None):
+    return BankTransaction(Amount(amount), None if day is None else date(2022, 7, day),
+                           raw=f'{amount} on {day}')
+
+
+class TestLedgerReconcile(unittest.TestCase):
+
+    def setUp(self):
+        self.ledger = import_ledger_file(io.StringIO(LEDGER_TEXT))
+
+    def test_cents(self):
+        self.assertEqual(cents(Amount('-42.5')), 4250)
+        self.assertEqual(cents(Amount('5')), 500)
+        self.assertEqual(cents(Amount('1.2300')), 123)
+        self.assertIsNone(cents(Amount('0.125')))
+
+    def test_index(self):
+        index = PostingIndex(self.ledger)
+        # one candidate per distinct amount of each transaction
+        self.assertEqual(len(index), 6)
+        self.assertEqual(sorted(index.buckets), [500, 2000, 4250, 100000, 120000])
+        self.assertEqual([index.transactions[position].date for position in index.buckets[4250]],
+                         ['2022/07/05', '2022/07/06'])
+
+        index = PostingIndex(self.ledger, 'Assets:MyBank')
+        self.assertEqual(len(index), 5)
+        self.assertEqual(set(index.accounts), {'Assets:MyBank:Checking'})
+        self.assertEqual(index.amounts[0], 1000)
+
+    def test_index_of_columnar_ledger(self):
+        text = """
+2022/07/01 Transfer
+    Assets:MyBank:Savings  $100.00
+    Assets:MyBank:Checking  $-100.00
+"""
+        ledger = import_ledger_file(io.StringIO(text), ColumnarLedger())
+        # the transaction posts to Assets:MyBank twice, so
+        # two views of it are found, but it is indexed once
+        index = PostingIndex(ledger, 'Assets:MyBank')
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.transactions[0], index.transactions[1])
+
+    def test_reconcile(self):
+        bank_transactions = [bank('-42.50', 7), bank('-42.50', 5), bank('-42.50', 6),
+                             bank('1000', 1), bank('-1200.00', 30), bank('-9.99', 2)]
+        reconciliation = reconcile_ledger(self.ledger, bank_transactions, 'Assets:MyBank:Checking')
+
+        # each posting matches at most one bank transaction, the closest in date first
+        self.assertEqual([(match.bank_transaction.raw, match.transaction.date, match.days)
+                          for match in reconciliation.matched],
+                         [('-42.50 on 5', '2022/07/05', 0), ('-42.50 on 6', '2022/07/06', 0),
+                          ('1000 on 1', '2022/07/01', 0)])
+        self.assertEqual([(match.bank_transaction.raw, match.transaction.description, match.days)
+                          for match in reconciliation.suspect],
+                         [('-1200.00 on 30', 'Rent', 10)])
+        self.assertEqual([bank_transaction.raw for bank_transaction in reconciliation.missing],
+                         ['-42.50 on 7', '-9.99 on 2'])
+        self.assertEqual([(transaction.description, amount)
+                          for transaction, _, amount in reconciliation.unmatched_postings()],
+                         [('Brokerage', -20)])
+
+        report = reconciliation.format()
+        self.assertIn('MISSING: -9.99 => -9.99 on 2', report)
+        self.assertIn('SUSPECT DATE: -1200.00 => -1200.00 on 30 (ledger: 2022/07/20 Rent, '
+                      '10 days off)', report)
+        self.assertTrue(report.endswith('Matched 3 transactions, 1 with suspect dates, 2 missing'))
+
+    def test_window(self):
+        index = PostingIndex(self.ledger, 'Liabilities:Card')
+        # the card clears on the effective date
+        reconciliation = reconcile(index, [bank('5.00', 14)], days=2)
+        self.assertEqual(len(reconciliation.matched), 1)
+        reconciliation = reconcile(index, [bank('5.00', 15)], days=2)
+        self.assertEqual(len(reconciliation.suspect), 1)
+
+        # a suspect match does not take a posting matched within the window
+        index = PostingIndex(self.ledger)
+        reconciliation = reconcile(index, [bank('42.50', 1), bank('42.50', 6), bank('42.50', 4)],
+                                   days=1)
+        self.assertEqual([match.bank_transaction.raw for match in reconciliation.matched],
+                         ['42.50 on 6', '42.50 on 4'])
+        self.assertEqual(reconciliation.missing[0].raw, '42.50 on 1')
+
+    def test_no_dates(self):
+        reconciliation = reconcile_ledger(self.ledger, [bank('42.50'), bank('42.50'), bank('42.50')])
+        self.assertEqual([match.transaction.date for match in reconciliation.matched],
+                         ['2022/07/05', '2022/07/06'])
+        self.assertEqual([match.days for match in reconciliation.matched], [None, None])
+        self.assertEqual(len(reconciliation.missing), 1)
+
+    def test_splits(self):
+        ledger = import_ledger_file(io.StringIO(SPLIT_LEDGER_TEXT))
+        bank_transactions = [bank('-100.25', 4), bank('-41.00', 8), bank('-50', 16),
+                             bank('-25', 17), bank('-9.75', 2), bank('-20', 30)]
+        reconciliation = reconcile_ledger(ledger, bank_transactions, 'Liabilities:Card')
+        self.assertEqual(len(reconciliation.matched), 1)
+        self.assertEqual(len(reconciliation.suspect), 1)
+
+        splits = match_splits(reconciliation, days=3)
+        self.assertEqual(reconciliation.splits, splits)
+        self.assertEqual([([bank_transaction.raw for bank_transaction in split.bank_transactions],
+                           [amount for _, _, amount in split.postings])
+                          for split in splits],
+                         [(['-100.25 on 4'], [-60, -30, Amount('-10.25')]),
+                          (['-50 on 16', '-25 on 17'], [-75])])
+        self.assertEqual([bank_transaction.raw for bank_transaction in reconciliation.missing],
+                         ['-20 on 30'])
+        self.assertEqual(reconciliation.unmatched_postings(), [])
+        self.assertIn('SPLIT: -100.25 => -60.00 (2022/07/03 Costco) + -30.00 (2022/07/03 Costco) '
+                      '+ -10.25 (2022/07/03 Costco)', reconciliation.format())
+        self.assertTrue(reconciliation.format().endswith(
+            'Matched 1 transactions, 2 split, 1 with suspect dates, 1 missing'))
+
+    def test_split_limits(self):
+        ledger = import_ledger_file(io.StringIO(SPLIT_LEDGER_TEXT))
+        bank_transactions = [bank('-100.25', 4), bank('-50', 16), bank('-25', 22)]
+
+        # the Costco charge is split three ways, the hardware store payment is a week apart
+        reconciliation = reconcile_ledger(ledger, bank_transactions, 'Liabilities:Card')
+        self.assertEqual(match_splits(reconciliation, days=3, max_size=2), [])
+        self.assertEqual(len(reconciliation.missing), 3)
+
+        reconciliation = reconcile_ledger(ledger, bank_transactions, 'Liabilities:Card')
+        self.assertEqual(match_splits(reconciliation, days=7, budget=0), [])
+
+        reconciliation = reconcile_ledger(ledger, bank_transactions, 'Liabilities:Card')
+        self.assertEqual(len(match_splits(reconciliation, days=7)), 2)
+        self.assertEqual(reconciliation.missing, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append('..')
+
+from ledger import FrozenLedgerError, Ledger, Transaction  # noqa
+import ledger_importer  # noqa
+from ledger_snapshot import LedgerStore  # noqa
+
+
+class TestLedgerSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        ledger_importer.clear_manifests()
+        self.addCleanup(ledger_importer.clear_manifests)
+        fd, self.path = tempfile.mkstemp(suffix='.ledger')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self._write(0, 20)
+
+    def _write(self, start, end, mode='w'):
+        with open(self.path, mode) as f:
+            for i in range(start, end):
+                f.write(f'2022/{i % 12 + 1}/{i % 28 + 1} Transaction {i}\n'
+                        f'    Expenses:Hobby:Ham Radio  ${i}.50\n'
+                        f'    Asset:MyBank:Checking\n\n')
+
+    def test_publish(self):
+        store = LedgerStore()
+        self.assertIsNone(store.snapshot())
+        ledger = Ledger()
+        snapshot = store.publish(ledger)
+        self.assertIs(store.snapshot(), snapshot)
+        self.assertEqual(snapshot.version, 1)
+        self.assertTrue(ledger.frozen)
+        with self.assertRaises(FrozenLedgerError):
+            ledger.add_transaction(Transaction('2022/07/16', 'Late', []))
+        self.assertEqual(store.publish(Ledger()).version, 2)
+        # a reader holding on to an old version still has it
+        self.assertIs(snapshot.ledger, ledger)
+
+    def test_refresh(self):
+        store = LedgerStore()
+        first = store.refresh(self.path)
+        self.assertEqual(len(first.ledger.transactions), 20)
+        self.assertEqual(first.ledger.transactions[0].transfers[1].amount, -0.5)
+
+        # appended to: the new version is a fork of the first one
+        self._write(20, 25, 'a')
+        second = store.refresh(self.path)
+        self.assertEqual(second.version, 2)
+        self.assertEqual(len(first.ledger.transactions), 20)
+        self.assertEqual(len(second.ledger.transactions), 25)
+        self.assertEqual(second.ledger.transactions[24].transfers[1].amount, -24.5)
+        self.assertIs(second.ledger.transactions[3], first.ledger.transactions[3])
+        self.assertIs(second.ledger.postings('Asset')[0], first.ledger.postings('Asset')[0])
+        self.assertEqual(len(first.ledger.postings('Expenses')), 20)
+        self.assertEqual(len(second.ledger.postings('Expenses')), 25)
+
+        # edited: the transactions that did not change are still reused
+        with open(self.path) as f:
+            text = f.read()
+        with open(self.path, 'w') as f:
+            f.write(text.replace('Transaction 7\n', 'Edited 7\n'))
+        third = store.refresh(self.path)
+        self.assertEqual(third.ledger.transactions[7].description, 'Edited 7')
+        self.assertEqual(second.ledger.transactions[7].description, 'Transaction 7')
+        self.assertIs(third.ledger.transactions[8], second.ledger.transactions[8])
+        self.assertEqual(len(third.ledger.transactions_between()), 25)
+
+    def test_refresh_with_amount_index(self):
+        store = LedgerStore(index_amounts=True)
+        first = store.refresh(self.path)
+        self._write(20, 25, 'a')
+        second = store.refresh(self.path)
+        self.assertEqual(len(first.ledger.postings_between_amounts(0, 100)), 20)
+        self.assertEqual(len(second.ledger.postings_between_amounts(0, 100)), 25)
+
+        with self.assertRaises(FrozenLedgerError):
+            LedgerStore().refresh(self.path).ledger.postings_between_amounts(0, 100)
+
+    def test_readers_only_see_published_versions(self):
+        store = LedgerStore()
+        store.refresh(self.path)
+        seen = []
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                snapshot = store.snapshot()
+                ledger = snapshot.ledger
+                # each version holds 5 more transactions than the last
+                seen.append((snapshot.version, len(ledger.transactions),
+                             len(ledger.postings('Expenses')), len(ledger.transactions_between())))
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for version in range(2, 8):
+                self._write(15 + 5 * version, 20 + 5 * version, 'a')
+                store.refresh(self.path)
+        finally:
+            done.set()
+            reader.join()
+
+        self.assertEqual(store.snapshot().version, 7)
+        for version, *counts in seen:
+            self.assertEqual(counts, [15 + 5 * version] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
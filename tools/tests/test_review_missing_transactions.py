@@ -1,4 +1,100 @@
+import io
+import os
+import sys
+import tempfile
 import unittest
 
+sys.path.append('..')
+
+from bank_transaction_import_helper import BankTransactionProfile  # noqa
+from ledger_importer import import_ledger_file  # noqa
+import review_missing_transactions as review_tx  # noqa
+
+
+LEDGER_TEXT = """
+2022/07/05 Safeway
+    Expenses:Food:Groceries  $42.50
+    Assets:MyBank:Checking
+
+2022/07/10 Coffee
+    Expenses:Food:Coffee  $5
+    Liabilities:Card
+
+2022/07/12 Costco
+    Expenses:Household  $30.00
+    Liabilities:Card
+
+2022/07/12 Costco
+    Expenses:Household  $10.25
+    Liabilities:Card
+"""
+
+
 class TestReviewMissingTransactions(unittest.TestCase):
-    pass
+
+    def setUp(self):
+        self.ledger = import_ledger_file(io.StringIO(LEDGER_TEXT))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _write_statement(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def _profiles(self):
+        checking = self._write_statement('checking.csv', 'Date,Amount\n'
+                                                         '07/05/2022,-42.50\n'
+                                                         '07/06/2022,-9.99\n')
+        self._write_statement('card-1.csv', 'Date,Credit,Debit\n07/11/2022,,5.00\n')
+        self._write_statement('card-2.csv', 'Date,Credit,Debit\n07/13/2022,,40.25\n')
+        return [BankTransactionProfile('mybank', amount=1, date=0,
+                                       account='Assets:MyBank:Checking', statements=[checking]),
+                BankTransactionProfile('my_credit_card', credit_amount=1, debit_amount=2, date=0,
+                                       account='Liabilities:Card',
+                                       statements=[os.path.join(self.directory, 'card-*.csv')])]
+
+    def test_review(self):
+        for workers in (1, 3):
+            profiles = self._profiles()
+            profiles[1].statements.append(os.path.join(self.directory, 'none-*.csv'))
+            with self.assertLogs(review_tx.logger, 'WARNING') as logs:
+                reports = review_tx.review(self.ledger, profiles, workers=workers)
+            self.assertEqual(len(logs.output), 1)
+
+            self.assertEqual([(report.bank, os.path.basename(report.path), report.matched,
+                               report.splits, report.suspect, report.missing)
+                              for report in reports],
+                             [('mybank', 'checking.csv', 1, 0, 0, 1),
+                              ('my_credit_card', 'card-1.csv', 1, 0, 0, 0),
+                              ('my_credit_card', 'card-2.csv', 0, 1, 0, 0)])
+            self.assertIn('MISSING: -9.99 => 07/06/2022,-9.99', reports[0].text)
+
+            text = review_tx.format_reports(reports)
+            self.assertTrue(text.startswith(f'== mybank: {os.path.join(self.directory, "checking.csv")}'))
+            self.assertTrue(text.endswith('Reviewed 3 statements from 2 banks: 2 matched, 1 split, '
+                                          '0 with suspect dates, 1 missing'))
+
+    def test_descriptions(self):
+        card = self._write_statement('card.csv', 'Date,Description,Amount\n'
+                                                 '07/12/2022,COSTCO WHSE #123,-10.25\n'
+                                                 '07/12/2022,PEETS COFFEE,-4.00\n')
+        profile = BankTransactionProfile('my_credit_card', amount=2, date=0, description=1,
+                                         account='Liabilities:Card', statements=[card])
+
+        reports = review_tx.review(self.ledger, [profile], workers=1)
+        self.assertIn('MISSING: -4.00 => 07/12/2022,PEETS COFFEE,-4.00\n'
+                      '    closest: 2022/07/10 Coffee (-5, 2 days off)', reports[0].text)
+
+        reports = review_tx.review(self.ledger, [profile], workers=1, descriptions=False)
+        self.assertNotIn('closest', reports[0].text)
+
+    def test_no_splits(self):
+        reports = review_tx.review(self.ledger, self._profiles(), splits=False, workers=1)
+        self.assertEqual([report.missing for report in reports], [1, 0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()